@@ -1,12 +1,6 @@
-import os
-import requests
 import json
-from dotenv import load_dotenv
-
-load_dotenv()
-
-API_KEY = os.getenv("GEMINI_API_KEY")
-URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-3-flash-preview:generateContent"
+from gemini_client import GEMINI
+from llm_guard import LLM_GUARD, Overloaded
 
 
 def call_gemini(prompt):
@@ -20,16 +14,22 @@ def call_gemini(prompt):
         ]
     }
 
-    r = requests.post(f"{URL}?key={API_KEY}", json=payload, timeout=30)
-    return r.json()
+    # Raises llm_guard.Overloaded when busy or the breaker is open; the
+    # call was never made, so the caller should wait and retry
+    with LLM_GUARD.admit() as call:
+        r = call.check(GEMINI.generate(payload, timeout=30))
+        return r.json()
 
 
-def analyze_session(summary):
+def analyze_session(summary, fallback=True):
     """
     AI remains fully responsible for:
     - Risk assessment
     - Email tone, greeting, ending
     - Structured clinical JSON
+
+    Overloaded is re-raised. Any other failure returns the fallback report,
+    or re-raises when fallback=False.
     """
 
     prompt = f"""
@@ -175,8 +175,13 @@ SESSION SUMMARY:
 
         return result
 
+    except Overloaded:
+        raise
+
     except Exception as e:
         print("AI ENGINE ERROR:", e)
+        if not fallback:
+            raise
 
         # Safe fallback (still professional, no placeholders)
         return {
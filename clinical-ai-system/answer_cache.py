@@ -0,0 +1,141 @@
+import os
+import re
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+# ---------------- SEMANTIC ANSWER CACHE ----------------
+# Admins ask the same dashboard questions many times a day. Answers are
+# cached against the embedding of the normalized question and reused for
+# any later question with the same scope (filters plus the patients and
+# doctors it names) whose embedding is at least SIMILARITY close, as long
+# as the data version (index + database) is unchanged. Any write moves the
+# version and the cache starts over; entries also expire after TTL seconds
+# and the least recently used are evicted past MAX_ENTRIES. The previous
+# generation is kept aside so fallback() can still serve a slightly stale
+# answer while Gemini is unavailable.
+
+MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_SIZE", "256"))
+TTL = float(os.getenv("ANSWER_CACHE_TTL", "900"))
+SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+
+_PUNCT = re.compile(r"[^\w\s]")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_question(question):
+    return _SPACES.sub(" ", _PUNCT.sub(" ", question.lower())).strip()
+
+
+class AnswerCache:
+
+    def __init__(self, max_entries=MAX_ENTRIES, ttl=TTL, similarity=SIMILARITY):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity = similarity
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # (scope, question) -> (unit vector, answer, stored at)
+        self._stale = OrderedDict()     # previous generation, for fallback()
+        self._version = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.fallbacks = 0
+
+    def _sync_version(self, version):
+        if version != self._version:
+            if self._entries:
+                self.invalidations += 1
+                self._stale = self._entries
+            self._entries = OrderedDict()
+            self._version = version
+
+    def lookup(self, question, vector, version, scope=()):
+        vector = np.asarray(vector, dtype="float32").reshape(-1)
+        vector = vector / (np.linalg.norm(vector) or 1)
+        now = time.time()
+
+        with self._lock:
+            self._sync_version(version)
+
+            for key in [k for k, e in self._entries.items() if now - e[2] > self.ttl]:
+                del self._entries[key]
+
+            best, best_score = None, self.similarity
+            key = (scope, normalize_question(question))
+            if key in self._entries:
+                best = key
+            else:
+                for k, (vec, _, _) in self._entries.items():
+                    if k[0] != scope:
+                        continue
+                    score = float(vec @ vector)
+                    if score >= best_score:
+                        best, best_score = k, score
+
+            if best is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(best)
+            self.hits += 1
+            return self._entries[best][1]
+
+    def fallback(self, question, vector, scope=()):
+        """
+        Closest answer from the current or previous generation, ignoring
+        data version and TTL. Only for when the model cannot be called.
+        """
+        vector = np.asarray(vector, dtype="float32").reshape(-1)
+        vector = vector / (np.linalg.norm(vector) or 1)
+
+        with self._lock:
+            best, best_score = None, self.similarity
+            for entries in (self._entries, self._stale):
+                for k, (vec, answer, _) in entries.items():
+                    if k[0] != scope:
+                        continue
+                    score = float(vec @ vector)
+                    if score >= best_score:
+                        best, best_score = answer, score
+
+            if best is not None:
+                self.fallbacks += 1
+            return best
+
+    def store(self, question, vector, version, answer, scope=()):
+        vector = np.asarray(vector, dtype="float32").reshape(-1)
+        vector = vector / (np.linalg.norm(vector) or 1)
+
+        with self._lock:
+            self._sync_version(version)
+            key = (scope, normalize_question(question))
+            self._entries[key] = (vector, answer, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        with self._lock:
+            self._sync_version(object())
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0,
+                "invalidations": self.invalidations,
+                "stale_entries": len(self._stale),
+                "fallbacks": self.fallbacks,
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "similarity": self.similarity,
+            }
@@ -0,0 +1,187 @@
+import os
+import time
+import threading
+import subprocess
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+# ---------------- AUDIO PREPROCESSING ----------------
+# Uploads are piped straight into ffmpeg as they arrive (no temp file) and
+# come out as 16 kHz mono PCM; the video track is dropped without being
+# decoded. Then an energy-based VAD cuts silences longer than
+# VAD_MIN_SILENCE, keeping VAD_PAD seconds around speech, so Whisper only
+# spends compute on the parts where someone talks.
+
+SAMPLE_RATE = 16000
+FFMPEG_BIN = os.getenv("FFMPEG_BIN", "ffmpeg")
+DECODE_TIMEOUT = float(os.getenv("DECODE_TIMEOUT", "300"))
+READ_CHUNK = 64 * 1024
+
+VAD_ENABLED = os.getenv("VAD_ENABLED", "1") == "1"
+VAD_FRAME_MS = 30
+VAD_MIN_DB = float(os.getenv("VAD_MIN_DB", "-50"))          # never speech below this level (dBFS)
+VAD_MARGIN_DB = float(os.getenv("VAD_MARGIN_DB", "12"))     # above the estimated noise floor
+VAD_PAD = float(os.getenv("VAD_PAD", "0.3"))                # seconds kept around speech
+VAD_MIN_SILENCE = float(os.getenv("VAD_MIN_SILENCE", "1.0"))  # shorter pauses are kept as is
+
+
+class DecodeError(Exception):
+    """
+    The upload is not audio ffmpeg can read.
+    """
+
+
+_stats_lock = threading.Lock()
+_stats = {"decoded": 0, "failed": 0, "input_bytes": 0, "audio_seconds": 0.0,
+          "speech_seconds": 0.0, "decode_ms": 0.0}
+
+
+def decode_stream(stream):
+    """
+    Decodes a file-like upload to a float32 16 kHz mono array while it is
+    still being read.
+    """
+    started = time.perf_counter()
+    try:
+        proc = subprocess.Popen(
+            [FFMPEG_BIN, "-nostdin", "-hide_banner", "-loglevel", "error",
+             "-i", "pipe:0", "-vn", "-sn", "-dn", "-ac", "1", "-ar", str(SAMPLE_RATE),
+             "-f", "s16le", "pipe:1"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+    except FileNotFoundError:
+        raise DecodeError(f"{FFMPEG_BIN} not found")
+
+    fed = [0]
+    err = []
+
+    def feed():
+        # Separate threads, so full pipes cannot deadlock the writer
+        try:
+            while True:
+                chunk = stream.read(READ_CHUNK)
+                if not chunk:
+                    break
+                fed[0] += len(chunk)
+                proc.stdin.write(chunk)
+        except (BrokenPipeError, OSError):
+            pass
+        finally:
+            try:
+                proc.stdin.close()
+            except OSError:
+                pass
+
+    threads = [threading.Thread(target=feed, daemon=True),
+               threading.Thread(target=lambda: err.append(proc.stderr.read()), daemon=True)]
+    for t in threads:
+        t.start()
+    watchdog = threading.Timer(DECODE_TIMEOUT, proc.kill)
+    watchdog.start()
+
+    try:
+        pcm = proc.stdout.read()
+        proc.wait()
+    finally:
+        watchdog.cancel()
+        for t in threads:
+            t.join(5)
+
+    if proc.returncode != 0 or not pcm:
+        with _stats_lock:
+            _stats["failed"] += 1
+        message = (err[0] if err else b"").decode(errors="replace").strip()[-300:]
+        if proc.returncode == -9:
+            message = "audio decode timed out"
+        raise DecodeError(message or "no audio stream")
+
+    audio = np.frombuffer(pcm[:len(pcm) - len(pcm) % 2], dtype=np.int16).astype(np.float32) / 32768.0
+    with _stats_lock:
+        _stats["decoded"] += 1
+        _stats["input_bytes"] += fed[0]
+        _stats["decode_ms"] += (time.perf_counter() - started) * 1000
+    return audio
+
+
+def _frame_db(audio):
+    frame = SAMPLE_RATE * VAD_FRAME_MS // 1000
+    n = len(audio) // frame
+    if n == 0:
+        return np.zeros(0), frame
+    frames = audio[:n * frame].reshape(n, frame)
+    rms = np.sqrt(np.mean(frames ** 2, axis=1) + 1e-12)
+    return 20 * np.log10(rms), frame
+
+
+def speech_mask(audio):
+    """
+    Per-frame True where the level is clearly above the noise floor.
+    """
+    db, frame = _frame_db(audio)
+    if not len(db):
+        return db.astype(bool), frame
+    floor, loud = np.percentile(db, [10, 95])
+    # Little dynamic range means no silence to tell apart: keep everything
+    return db > max(VAD_MIN_DB, min(floor + VAD_MARGIN_DB, loud - 3)), frame
+
+
+def has_speech(audio):
+    mask, _ = speech_mask(audio)
+    return bool(mask.any())
+
+
+def trim_silence(audio):
+    """
+    Returns audio with long silences removed.
+    """
+    if not VAD_ENABLED or len(audio) == 0:
+        return audio
+
+    mask, frame = speech_mask(audio)
+    if not mask.any():
+        return audio[:0]
+
+    # Pad speech on both sides, then keep pauses shorter than VAD_MIN_SILENCE
+    pad = max(1, int(VAD_PAD * 1000 / VAD_FRAME_MS))
+    keep = np.convolve(mask.astype(np.int8), np.ones(2 * pad + 1, dtype=np.int8), mode="same") > 0
+
+    min_gap = int(VAD_MIN_SILENCE * 1000 / VAD_FRAME_MS)
+    edges = np.flatnonzero(np.diff(np.concatenate(([1], keep.astype(np.int8), [1]))))
+    for start, end in zip(edges[::2], edges[1::2]):
+        if end - start < min_gap:
+            keep[start:end] = True
+
+    keep_samples = np.repeat(keep, frame)
+    tail = audio[len(keep_samples):]
+    return np.concatenate((audio[:len(keep_samples)][keep_samples], tail if keep[-1] else tail[:0]))
+
+
+def prepare_upload(stream):
+    """
+    Decode + VAD. Returns (audio, seconds of audio before trimming).
+    """
+    audio = decode_stream(stream)
+    seconds = len(audio) / SAMPLE_RATE
+    speech = trim_silence(audio)
+    with _stats_lock:
+        _stats["audio_seconds"] += seconds
+        _stats["speech_seconds"] += len(speech) / SAMPLE_RATE
+    return speech, seconds
+
+
+def prep_stats():
+    with _stats_lock:
+        s = dict(_stats)
+    return {
+        "decoded": s["decoded"],
+        "failed": s["failed"],
+        "input_mb": round(s["input_bytes"] / 1e6, 2),
+        "audio_seconds": round(s["audio_seconds"], 1),
+        "speech_seconds": round(s["speech_seconds"], 1),
+        "silence_skipped": round(1 - s["speech_seconds"] / s["audio_seconds"], 3) if s["audio_seconds"] else 0,
+        "avg_decode_ms": round(s["decode_ms"] / s["decoded"], 1) if s["decoded"] else 0,
+        "vad_enabled": VAD_ENABLED,
+    }
@@ -1,28 +1,249 @@
 import os
+import time
+import queue
 import smtplib
+import threading
+from collections import deque
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from dotenv import load_dotenv
+from crypto_utils import encrypt_text, decrypt_text
+from job_queue import JobQueue, GiveUp
+from latency_stats import percentiles
 
 load_dotenv()
 
 SES_HOST = os.getenv("AWS_SES_HOST")
-SES_PORT = int(os.getenv("AWS_SES_PORT"))
+SES_PORT = int(os.getenv("AWS_SES_PORT", "587"))
 SES_USER = os.getenv("AWS_SES_USERNAME")
 SES_PASS = os.getenv("AWS_SES_PASSWORD")
 SENDER = os.getenv("SES_VERIFIED_SENDER")
 
+# Plain SMTP without STARTTLS/login is only for a local stand-in server
+SES_STARTTLS = os.getenv("AWS_SES_STARTTLS", "1") == "1"
 
-def send_email(to_email, subject, body):
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "2"))
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "20"))
+SMTP_MAX_IDLE = float(os.getenv("SMTP_MAX_IDLE", "60"))      # NOOP before reusing older connections
+SMTP_MAX_MESSAGES = int(os.getenv("SMTP_MAX_MESSAGES", "100"))  # per connection, then reconnect
+MAIL_WORKERS = int(os.getenv("MAIL_WORKERS", "2"))
+MAIL_MAX_ATTEMPTS = int(os.getenv("MAIL_MAX_ATTEMPTS", "6"))
+MAIL_RETRY_DELAY = float(os.getenv("MAIL_RETRY_DELAY", "15"))
+
+LATENCY_WINDOW = 500
+
+
+def _message(to_email, subject, body):
     msg = MIMEMultipart()
     msg["From"] = SENDER
     msg["To"] = to_email
     msg["Subject"] = subject
     msg.attach(MIMEText(body, "plain"))
+    return msg
+
+
+# ---------------- SMTP CONNECTION POOL ----------------
+# Opening an SES connection costs a TCP handshake, STARTTLS and AUTH. The
+# pool keeps up to SMTP_POOL_SIZE authenticated connections open between
+# messages; a connection that errors is discarded and replaced, and one
+# that sat idle longer than SMTP_MAX_IDLE is checked with NOOP first since
+# SES drops idle sessions.
+
+class _Connection:
+
+    def __init__(self):
+        self.smtp = smtplib.SMTP(SES_HOST, SES_PORT, timeout=SMTP_TIMEOUT)
+        if SES_STARTTLS:
+            self.smtp.starttls()
+        if SES_USER:
+            self.smtp.login(SES_USER, SES_PASS)
+        self.last_used = time.monotonic()
+        self.sent = 0
+
+    def alive(self):
+        if time.monotonic() - self.last_used < SMTP_MAX_IDLE:
+            return True
+        try:
+            return self.smtp.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def close(self):
+        try:
+            self.smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            try:
+                self.smtp.close()
+            except OSError:
+                pass
+
+
+class SMTPPool:
+
+    def __init__(self, size=SMTP_POOL_SIZE):
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.reconnects = 0
+
+    def _checkout(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if conn.alive():
+                return conn
+            conn.close()
+
+        conn = _Connection()
+        with self._lock:
+            self.opened += 1
+        return conn
+
+    def _checkin(self, conn):
+        conn.last_used = time.monotonic()
+        if conn.sent >= SMTP_MAX_MESSAGES:
+            conn.close()
+        else:
+            self._idle.put(conn)
+
+    def send(self, to_email, msg):
+        """
+        Sends one message over a pooled connection. A connection the server
+        dropped is replaced once before the error is raised to the caller.
+        """
+        with self._slots:
+            for attempt in (1, 2):
+                conn = self._checkout()
+                try:
+                    conn.smtp.sendmail(SENDER, to_email, msg.as_string())
+                except smtplib.SMTPException as e:
+                    # SMTPException subclasses OSError, so it goes first.
+                    # smtplib closes the socket when the server went away
+                    # (disconnect, timeout, 421) and otherwise sends RSET
+                    # after a refused sender / recipient / message.
+                    if conn.smtp.sock is not None:
+                        # Still usable
+                        self._checkin(conn)
+                        raise
+                    conn.close()
+                    if attempt == 1:
+                        with self._lock:
+                            self.reconnects += 1
+                        continue
+                    raise
+                except OSError:
+                    conn.close()
+                    raise
+
+                conn.sent += 1
+                self._checkin(conn)
+                return
+
+    def close_all(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": self.size,
+                "idle": self._idle.qsize(),
+                "opened": self.opened,
+                "reconnects": self.reconnects,
+            }
+
+
+POOL = SMTPPool()
+
+
+# ---------------- OUTBOX ----------------
+# send_email only writes the message to the persistent mail_outbox table
+# (body encrypted like email_logs) and returns; MAIL_WORKERS threads drain
+# it through the pool. Failed sends are retried with exponential backoff
+# and survive restarts; a permanent (5xx) refusal fails the message at once. Latency is tracked per message, both for the SMTP
+# transaction itself and from enqueue to delivery.
+
+OUTBOX = JobQueue(table="mail_outbox", max_attempts=MAIL_MAX_ATTEMPTS, retry_delay=MAIL_RETRY_DELAY)
+
+_stats_lock = threading.Lock()
+_send_ms = deque(maxlen=LATENCY_WINDOW)
+_delivery_ms = deque(maxlen=LATENCY_WINDOW)
+
+
+def send_email(to_email, subject, body, priority="MEDIUM", message_id=None):
+    """
+    Queues an email and returns its outbox id. A fixed message_id makes the
+    call idempotent, e.g. when a job retries the stage that sends it.
+    """
+    return OUTBOX.enqueue(
+        "email",
+        {"to": to_email, "subject": subject, "body": encrypt_text(body)},
+        priority,
+        message_id
+    )
+
+
+def _rejection(e):
+    """
+    The 5xx reply behind an SMTP error, or None if it is worth retrying
+    (4xx, connection errors).
+    """
+    if isinstance(e, smtplib.SMTPRecipientsRefused):
+        codes = [code for code, _ in e.recipients.values()]
+    elif isinstance(e, smtplib.SMTPResponseException):
+        codes = [e.smtp_code]
+    else:
+        return None
+    return codes[0] if codes and all(500 <= c < 600 for c in codes) else None
+
+
+@OUTBOX.handler("email")
+def _deliver(job, progress):
+    payload = job["payload"]
+    msg = _message(payload["to"], payload["subject"], decrypt_text(payload["body"]))
+
+    started = time.perf_counter()
+    try:
+        POOL.send(payload["to"], msg)
+    except smtplib.SMTPException as e:
+        code = _rejection(e)
+        if code is not None:
+            # Permanent: the same address would be refused on every retry
+            raise GiveUp(f"{payload['to']} refused with {code}: {e}")
+        raise
+    send_ms = (time.perf_counter() - started) * 1000
+    delivery_ms = (time.time() - job["created_at"]) * 1000
+
+    with _stats_lock:
+        _send_ms.append(send_ms)
+        _delivery_ms.append(delivery_ms)
+
+    print(f"📧 Email sent to {payload['to']} in {send_ms:.0f} ms")
+    return {"send_ms": round(send_ms, 1), "delivery_ms": round(delivery_ms, 1)}
+
+
+def start_mail_workers(spawn):
+    """
+    spawn(fn) starts a background thread, e.g. socketio.start_background_task.
+    """
+    for _ in range(MAIL_WORKERS):
+        spawn(OUTBOX.work)
+    print(f"📬 {MAIL_WORKERS} mail workers started")
+
 
-    with smtplib.SMTP(SES_HOST, SES_PORT) as server:
-        server.starttls()
-        server.login(SES_USER, SES_PASS)
-        server.sendmail(SENDER, to_email, msg.as_string())
-  
-    
+def mail_stats():
+    with _stats_lock:
+        send, delivery = list(_send_ms), list(_delivery_ms)
+    return {
+        "outbox": OUTBOX.stats(),
+        "pool": POOL.stats(),
+        "send_ms": percentiles(send),
+        "delivery_ms": percentiles(delivery),
+    }
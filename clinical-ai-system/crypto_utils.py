@@ -30,3 +30,17 @@ def decrypt_text(cipher_text: str) -> str:
     except Exception:
         return "<< Not encrypted or corrupted data >>"
 
+
+def decrypt_many(cipher_texts: list) -> list:
+    """
+    decrypt_text for a batch, sharing one AES-GCM context.
+    """
+    aes = AESGCM(KEY)
+    out = []
+    for cipher_text in cipher_texts:
+        try:
+            raw = b64decode(cipher_text)
+            out.append(aes.decrypt(raw[:12], raw[12:], None).decode())
+        except Exception:
+            out.append("<< Not encrypted or corrupted data >>")
+    return out
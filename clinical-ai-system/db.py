@@ -1,4 +1,5 @@
 import sqlite3
+import threading
 
 DB_NAME = "clinic.db"
 
@@ -6,3 +7,20 @@ def get_db():
     conn = sqlite3.connect(DB_NAME)
     conn.row_factory = sqlite3.Row   # ⭐ THIS FIXES EVERYTHING
     return conn
+
+
+# ---------------- WRITE VERSION ----------------
+# PRAGMA data_version on a long-lived connection changes whenever any other
+# connection (this process or another one) commits to the database, so
+# caches can key on it instead of re-querying tables.
+
+_watch_conn = None
+_watch_lock = threading.Lock()
+
+
+def data_version():
+    global _watch_conn
+    with _watch_lock:
+        if _watch_conn is None:
+            _watch_conn = sqlite3.connect(DB_NAME, check_same_thread=False)
+        return _watch_conn.execute("PRAGMA data_version").fetchone()[0]
@@ -0,0 +1,280 @@
+import os
+import time
+import hashlib
+import sqlite3
+import threading
+from dotenv import load_dotenv
+from db import get_db
+from job_queue import JOBS_DB
+from aws_mailer import send_email
+
+load_dotenv()
+
+
+# ---------------- DOCTOR DIGEST ----------------
+# Optional (DOCTOR_DIGEST=1). Instead of one email per HIGH-risk session,
+# follow-ups for a doctor's patients are collected in digest_queue and sent
+# as one message once the oldest has waited DIGEST_WINDOW seconds or
+# DIGEST_MAX_SESSIONS have piled up. MEDIUM sessions are added to the
+# digest as well, for information; their patient email is unchanged.
+#
+# Self-harm is never delayed: sessions with a self-harm score of at least
+# DIGEST_URGENT_SELF_HARM, or flagged for self-harm/suicidal ideation in the
+# report, go to the doctor immediately as before.
+#
+# digest_queue is bookkeeping like the job tables, so it lives in jobs.db:
+# writing it in clinic.db would move data_version and flush the answer
+# cache and snapshot on every queued session. The digest is composed with
+# one clinic.db query over email_logs -> patients/clinical_sessions for the
+# queued log ids; only the assessment line is pulled out of ai_json
+# (json_extract), the rest comes from the email_logs score columns.
+#
+# A flush first stamps its rows with the digest's message_id, then queues
+# the email under that id, then marks the rows sent. After a crash in
+# between, the next flush re-sends the stamped rows under the same id,
+# which the mail outbox ignores if the email was already queued.
+
+DIGEST_ENABLED = os.getenv("DOCTOR_DIGEST", "0") == "1"
+DIGEST_WINDOW = float(os.getenv("DIGEST_WINDOW", "3600"))
+DIGEST_MAX_SESSIONS = int(os.getenv("DIGEST_MAX_SESSIONS", "5"))
+DIGEST_RISKS = {r.strip() for r in os.getenv("DIGEST_RISKS", "HIGH,MEDIUM").split(",") if r.strip()}
+DIGEST_URGENT_SELF_HARM = float(os.getenv("DIGEST_URGENT_SELF_HARM", "7"))
+DIGEST_POLL = float(os.getenv("DIGEST_POLL", "60"))
+
+_flush_lock = threading.Lock()
+_created = False
+
+
+def _db():
+    global _created
+    db = sqlite3.connect(JOBS_DB, timeout=30)
+    db.row_factory = sqlite3.Row
+    if not _created:
+        db.executescript("""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS digest_queue (
+                log_id INTEGER PRIMARY KEY,
+                doctor_id INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                sent_at REAL,
+                message_id TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_digest_pending
+                ON digest_queue(doctor_id, created_at) WHERE sent_at IS NULL;
+        """)
+        _created = True
+    return db
+
+
+def is_urgent(res):
+    try:
+        if float(res.get("self_harm_risk", 0)) >= DIGEST_URGENT_SELF_HARM:
+            return True
+    except (TypeError, ValueError):
+        pass
+    flags = (res.get("clinical_report") or {}).get("riskAssessment") or {}
+    return bool(flags.get("selfHarmRisk") or flags.get("suicidalIdeation"))
+
+
+def wants_digest(res, doctor_id):
+    """
+    True if this session's doctor follow-up should wait for the digest.
+    """
+    return (
+        DIGEST_ENABLED
+        and doctor_id is not None
+        and res.get("risk") in DIGEST_RISKS
+        and not is_urgent(res)
+    )
+
+
+def queue_for_digest(log_id, doctor_id):
+    db = _db()
+    db.execute("""
+        INSERT OR IGNORE INTO digest_queue (log_id, doctor_id, created_at)
+        VALUES (?, ?, ?)
+    """, (log_id, doctor_id, time.time()))
+    db.commit()
+    pending = db.execute(
+        "SELECT COUNT(*) FROM digest_queue WHERE doctor_id = ? AND sent_at IS NULL",
+        (doctor_id,)
+    ).fetchone()[0]
+    db.close()
+
+    if pending >= DIGEST_MAX_SESSIONS:
+        flush(doctor_id)
+
+
+def _compose(rows):
+    high = sum(1 for r in rows if r["recipient_type"] == "HIGH")
+    lines = []
+    for i, r in enumerate(rows, 1):
+        lines.append(f"{i}. {r['name']} — {r['recipient_type']} risk — {r['created_at']}")
+        lines.append(
+            f"   Anxiety {r['anxiety']}/10 · Burnout {r['burnout_risk']}/10 · "
+            f"Depression {r['depression_risk']}/10 · Self-harm {r['self_harm_risk']}/10"
+        )
+        if r["assessment"]:
+            lines.append(f"   {r['assessment']}")
+
+    intro = (
+        f"{len(rows)} recent session{'s' if len(rows) != 1 else ''} for your patients "
+        f"{'were' if len(rows) != 1 else 'was'} assessed as elevated risk"
+        + (f", {high} of them HIGH" if high and high != len(rows) else "")
+        + ". A summary of each is below:"
+    )
+
+    body = (
+        "Dear Doctor,\n"
+        f"{intro}\n\n"
+        + "\n".join(lines)
+        + "\n\nPlease review the full reports in the HopeQure dashboard.\n\n"
+        "Warm regards,\n"
+        "HopeQure Clinical Team"
+    )
+    subject = f"HopeQure Clinical Digest – {len(rows)} session{'s' if len(rows) != 1 else ''} to review"
+    return subject, body, "HIGH" if high else "MEDIUM"
+
+
+def _claim(db, doctor_id):
+    """
+    (message_id, {log_id: queued_at}) of the digest to send for a doctor:
+    one a previous flush stamped but did not finish, else all pending rows,
+    stamped now. None if nothing is pending.
+    """
+    db.execute("BEGIN IMMEDIATE")
+    row = db.execute("""
+        SELECT message_id FROM digest_queue
+        WHERE doctor_id = ? AND sent_at IS NULL AND message_id IS NOT NULL
+        LIMIT 1
+    """, (doctor_id,)).fetchone()
+
+    if row:
+        message_id = row["message_id"]
+    else:
+        log_ids = [r["log_id"] for r in db.execute(
+            "SELECT log_id FROM digest_queue WHERE doctor_id = ? AND sent_at IS NULL ORDER BY log_id",
+            (doctor_id,)
+        )]
+        if not log_ids:
+            db.rollback()
+            return None
+        message_id = "digest-" + hashlib.sha256(
+            f"{doctor_id}:{','.join(map(str, log_ids))}".encode()
+        ).hexdigest()[:32]
+        db.execute(f"""
+            UPDATE digest_queue SET message_id = ?
+            WHERE log_id IN ({','.join('?' * len(log_ids))})
+        """, (message_id, *log_ids))
+    db.commit()
+
+    queued = {r["log_id"]: r["created_at"] for r in db.execute(
+        "SELECT log_id, created_at FROM digest_queue WHERE message_id = ? AND sent_at IS NULL",
+        (message_id,)
+    )}
+    return message_id, queued
+
+
+def flush(doctor_id):
+    """
+    Sends all pending items of one doctor as one digest email.
+    """
+    with _flush_lock:
+        db = _db()
+        try:
+            claimed = _claim(db, doctor_id)
+            if claimed is None:
+                return None
+            message_id, queued = claimed
+
+            clinic = get_db()
+            cur = clinic.cursor()
+            cur.execute(f"""
+                SELECT
+                    e.log_id,
+                    p.name,
+                    e.recipient_type,
+                    e.anxiety, e.burnout_risk, e.depression_risk, e.self_harm_risk,
+                    e.created_at,
+                    CASE WHEN json_valid(c.ai_json)
+                        THEN json_extract(c.ai_json, '$.clinical_report.overallAssessment')
+                    END AS assessment
+                FROM email_logs e
+                JOIN patients p ON p.patient_id = e.patient_id
+                LEFT JOIN clinical_sessions c ON c.session_id = e.session_id
+                WHERE e.log_id IN ({','.join('?' * len(queued))})
+            """, list(queued))
+            rows = sorted(cur.fetchall(), key=lambda r: (r["recipient_type"] != "HIGH", queued[r["log_id"]]))
+            cur.execute("SELECT email FROM doctors WHERE doctor_id = ?", (doctor_id,))
+            doctor = cur.fetchone()
+            clinic.close()
+
+            if not doctor:
+                print(f"⚠️ Doctor {doctor_id} no longer exists, dropping {len(queued)} digest items")
+            elif rows:
+                subject, body, priority = _compose(rows)
+                # Queued under the id stamped before; a repeat is a no-op
+                send_email(doctor["email"], subject, body, priority=priority, message_id=message_id)
+
+            # Settled either way, so flush_due does not pick the rows up again
+            db.execute(
+                "UPDATE digest_queue SET sent_at = ? WHERE message_id = ? AND sent_at IS NULL",
+                (time.time(), message_id)
+            )
+            db.commit()
+        finally:
+            db.close()
+
+        if not doctor:
+            return None
+        print(f"🗂️ Digest of {len(rows)} sessions queued for doctor {doctor_id}")
+        return message_id
+
+
+def flush_due():
+    """
+    Flushes every doctor whose oldest pending item is past the window.
+    """
+    db = _db()
+    doctors = [r[0] for r in db.execute("""
+        SELECT doctor_id
+        FROM digest_queue
+        WHERE sent_at IS NULL
+        GROUP BY doctor_id
+        HAVING MIN(created_at) <= ? OR COUNT(*) >= ?
+    """, (time.time() - DIGEST_WINDOW, DIGEST_MAX_SESSIONS)).fetchall()]
+    db.close()
+
+    for doctor_id in doctors:
+        flush(doctor_id)
+    return len(doctors)
+
+
+def digest_worker():
+    while True:
+        try:
+            flush_due()
+        except Exception as e:
+            print("DIGEST ERROR:", e)
+        time.sleep(DIGEST_POLL)
+
+
+def digest_stats():
+    if not DIGEST_ENABLED:
+        return {"enabled": False}
+    db = _db()
+    row = db.execute("""
+        SELECT COUNT(*), COUNT(DISTINCT doctor_id), MIN(created_at)
+        FROM digest_queue WHERE sent_at IS NULL
+    """).fetchone()
+    sent = db.execute("SELECT COUNT(DISTINCT message_id) FROM digest_queue WHERE sent_at IS NOT NULL").fetchone()[0]
+    db.close()
+    return {
+        "enabled": DIGEST_ENABLED,
+        "pending_sessions": row[0],
+        "pending_doctors": row[1],
+        "oldest_pending_seconds": round(time.time() - row[2], 1) if row[2] else 0,
+        "digests_sent": sent,
+        "window_seconds": DIGEST_WINDOW,
+        "max_sessions": DIGEST_MAX_SESSIONS,
+    }
@@ -0,0 +1,120 @@
+import hashlib
+import sqlite3
+import threading
+import numpy as np
+
+
+# ---------------- EMBEDDING CACHE ----------------
+# Content-addressed store of document embeddings. Rows are keyed by
+# SHA-256(model name + text), so a rebuild only runs the encoder on text
+# it has not seen with that model before, and vectors of several models
+# can live side by side while the index switches from one to another.
+
+EMB_FILE = "rag_embeddings.db"
+LOOKUP_CHUNK = 500
+
+
+def content_key(model_name, text):
+    return hashlib.sha256(f"{model_name}\0{text}".encode()).hexdigest()
+
+
+class EmbeddingCache:
+
+    def __init__(self, path=EMB_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+        self.hits = 0
+        self.misses = 0
+
+    def _db(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    dim INTEGER NOT NULL,
+                    vector BLOB NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS cache_meta (
+                    name TEXT PRIMARY KEY,
+                    value TEXT
+                );
+            """)
+        return self._conn
+
+    def lookup(self, keys):
+        found = {}
+        with self._lock:
+            db = self._db()
+            for start in range(0, len(keys), LOOKUP_CHUNK):
+                chunk = keys[start:start + LOOKUP_CHUNK]
+                rows = db.execute(
+                    f"SELECT key, dim, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})",
+                    chunk
+                ).fetchall()
+                for key, dim, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype="float32", count=dim)
+        return found
+
+    def store(self, model_name, items):
+        with self._lock:
+            db = self._db()
+            db.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, dim, vector) VALUES (?, ?, ?, ?)",
+                [(k, model_name, len(v), np.asarray(v, dtype="float32").tobytes()) for k, v in items]
+            )
+            db.commit()
+
+    def encode(self, model_name, model, texts, batch_size=256):
+        """
+        Embeddings for texts as a float32 matrix, running the model only
+        on texts missing from the cache.
+        """
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, 0), dtype="float32")
+
+        keys = [content_key(model_name, t) for t in texts]
+        found = self.lookup(list(set(keys)))
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+
+        if missing:
+            todo = list(missing.items())
+            for start in range(0, len(todo), batch_size):
+                batch = todo[start:start + batch_size]
+                vectors = np.asarray(model.encode([t for _, t in batch]), dtype="float32")
+                fresh = [(k, v) for (k, _), v in zip(batch, vectors)]
+                self.store(model_name, fresh)
+                found.update(fresh)
+
+        return np.vstack([found[k] for k in keys]).astype("float32")
+
+    def get_meta(self, name):
+        with self._lock:
+            row = self._db().execute("SELECT value FROM cache_meta WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, name, value):
+        with self._lock:
+            db = self._db()
+            db.execute("INSERT OR REPLACE INTO cache_meta (name, value) VALUES (?, ?)", (name, value))
+            db.commit()
+
+    def prune(self, keep_model):
+        """
+        Drop vectors of every other model, e.g. after a model switch.
+        """
+        with self._lock:
+            db = self._db()
+            cur = db.execute("DELETE FROM embeddings WHERE model != ?", (keep_model,))
+            db.commit()
+            return cur.rowcount
@@ -1,12 +1,36 @@
-from flask import Flask, request, jsonify, render_template, session, redirect
-from flask_socketio import SocketIO, emit
+# ---------------- EVENTLET ----------------
+# Run directly (python followup_service.py, or via start.py), Flask-SocketIO
+# serves on eventlet when it is installed, but nothing has patched the
+# standard library: Event.wait in the job workers and the Whisper pool's
+# pipe reads would block the hub and every request with it. Patch first,
+# before the imports below. gunicorn's eventlet worker patches on its own.
+if __name__ == "__main__":
+    try:
+        import eventlet
+        eventlet.monkey_patch()
+    except ImportError:
+        pass
+
+from flask import Flask, request, jsonify, render_template, session, redirect, Response, stream_with_context
+from flask_socketio import SocketIO, emit, join_room
 from ai_engine import analyze_session
-from rag_engine import query_rag
-from aws_mailer import send_email
-from crypto_utils import encrypt_text
+from rag_engine import query_rag, stream_rag, index_session, refresh_rag_documents, start_model_switch, ANSWERS
+from query_router import ROUTER
+from gemini_client import GEMINI
+from llm_guard import LLM_GUARD, Overloaded, CircuitOpen
+from job_queue import JOBS, Defer, FAILED
+from risk_screen import prescreen
+from aws_mailer import send_email, start_mail_workers, mail_stats
+from doctor_digest import DIGEST_ENABLED, wants_digest, queue_for_digest, digest_worker, digest_stats
+from transcriber import TRANSCRIBER, Busy
+from live_transcribe import LIVE
+from audio_prep import prepare_upload, prep_stats, DecodeError, SAMPLE_RATE
+from model_loader import PRELOAD_MODELS, model_stats
+from crypto_utils import encrypt_text, decrypt_text
 from db import get_db
 import json
 from webhooks.webhook_dispatcher import dispatch_event
+from webhooks.webhook_outbox import OUTBOX as WEBHOOK_OUTBOX, start_webhook_workers, webhook_stats, dead_letters
 from webhooks.webhook_events import (
     SESSION_CREATED,
     AI_INSIGHT_GENERATED,
@@ -14,16 +38,15 @@ from webhooks.webhook_events import (
 )
 import hmac
 import hashlib
-import whisper
-import tempfile
 import os
 
 app = Flask(__name__, template_folder="templates")
 socketio = SocketIO(app, cors_allowed_origins="*")
 app.secret_key = "clinical_admin_secret"
 API_KEY = "hopequre_test_token_2026"
-# Load Whisper Model Once at Startup
-whisper_model = whisper.load_model("base")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+ANALYSIS_DEFER = float(os.getenv("ANALYSIS_DEFER", "5"))   # seconds, while Gemini is overloaded
+ESCALATION_EMAIL = os.getenv("ESCALATION_EMAIL")   # for HIGH sessions of patients without a doctor
 
 
 @app.route("/")
@@ -186,11 +209,99 @@ def admin_search():
     if not (session.get("admin") or verify_api_key(request)):
         return jsonify({"answer": "Unauthorized"}), 403
 
-    q = request.json["query"]
-    return jsonify({"answer": query_rag(q)})
+    data = request.json
+    q = data["query"]
+    return jsonify({"answer": query_rag(q, search_filters(data))})
+
+
+def search_filters(data):
+    # Optional scope: patient_id, doctor_id, type, from, to
+    return {
+        k: data[k] for k in ("patient_id", "doctor_id", "type", "from", "to")
+        if data.get(k)
+    }
+
+
+# Streaming variant: answer text is pushed as server-sent events while
+# Gemini is still generating it
+@app.route("/api/admin-search/stream", methods=["POST"])
+def admin_search_stream():
+    if not (session.get("admin") or verify_api_key(request)):
+        return jsonify({"answer": "Unauthorized"}), 403
+
+    data = request.json
+    q = data["query"]
+    filters = search_filters(data)
+
+    def events():
+        for chunk in stream_rag(q, filters):
+            yield f"data: {json.dumps({'text': chunk})}\n\n"
+        yield "event: done\ndata: {}\n\n"
+
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@socketio.on("admin_search")
+def socket_admin_search(data):
+    if not session.get("admin"):
+        emit("admin_search_done", {"error": "Unauthorized"})
+        return
+
+    for chunk in stream_rag(data["query"], search_filters(data)):
+        emit("admin_search_chunk", {"text": chunk})
+    emit("admin_search_done", {})
+
+
+# ---------------- SERVICE METRICS ----------------
+
+@app.route("/api/metrics")
+def service_metrics():
+    if not (session.get("admin") or verify_api_key(request)):
+        return jsonify({"error": "Unauthorized"}), 403
+
+    return jsonify({
+        "answer_cache": ANSWERS.stats(),
+        "query_router": ROUTER.stats(),
+        "gemini": GEMINI.stats(),
+        "llm_guard": LLM_GUARD.stats(),
+        "jobs": JOBS.stats(),
+        "mail": mail_stats(),
+        "digest": digest_stats(),
+        "webhooks": webhook_stats(),
+        "transcription": TRANSCRIBER.stats(),
+        "live_transcription": LIVE.stats(),
+        "audio_prep": prep_stats(),
+        "models": model_stats()
+    })
+
+
+# ---------------- WEBHOOK DEAD LETTERS ----------------
+
+@app.route("/api/webhooks/dead-letters")
+def webhook_dead_letters():
+    if not (session.get("admin") or verify_api_key(request)):
+        return jsonify({"error": "Unauthorized"}), 403
+    return jsonify(dead_letters())
+
+
+@app.route("/api/webhooks/dead-letters/<delivery_id>/retry", methods=["POST"])
+def retry_webhook(delivery_id):
+    if not (session.get("admin") or verify_api_key(request)):
+        return jsonify({"error": "Unauthorized"}), 403
+    if not WEBHOOK_OUTBOX.requeue(delivery_id):
+        return jsonify({"error": "No failed delivery with that id"}), 404
+    return jsonify({"status": "queued"})
 
 
 # ---------------- ANALYZE SESSION ROUTE ----------------
+# The request only stores the (encrypted) session and queues a job; the
+# Gemini analysis, follow-up email, email log, RAG indexing and webhooks
+# run in the JOBS worker. Clients get 202 + job_id and follow progress via
+# the "job_update" Socket.IO event (after "watch_job") or GET /api/jobs/<id>.
 
 @app.route("/analyze-session", methods=["POST"])
 def analyze():
@@ -203,100 +314,294 @@ def analyze():
     if not data or "summary" not in data:
         return jsonify({"error": "Missing summary"}), 400
 
-    summary = data["summary"]
-    res = analyze_session(summary)
-    dispatch_event(
-        AI_INSIGHT_GENERATED,
-        {
-        "risk": res["risk"],
-        "signals": list(res.keys()),
-        "engine": "clinical_ai_v1"
-        }
-    )
-
-
-    db = get_db()
-    cur = db.cursor()
-
-    # Get patient and doctor info
-        # ✅ Patient selected from dropdown
+    # ✅ Patient selected from dropdown
     pid = data.get("patient_id")
 
     if not pid:
         return jsonify({"error": "Missing patient_id"}), 400
 
-    # Get patient + doctor info for selected patient
-    cur.execute("""
-        SELECT patient_id, email, assigned_doctor 
-        FROM patients 
-        WHERE patient_id = ?
-    """, (pid,))
-    pid, pemail, did = cur.fetchone()
-
-
-    cur.execute("SELECT email FROM doctors WHERE doctor_id=?", (did,))
-    demail = cur.fetchone()[0]
-
-    recipient = demail if res["risk"] == "HIGH" else pemail
-
-    # Send email
-    send_email(recipient, "HopeQure Follow-up", res["email_text"])
-    dispatch_event(
-        FOLLOWUP_SENT,
-        {
-        "to": recipient,
-        "risk": res["risk"],
-        "session_context": "clinical_followup"
-        }
-    )
+    db = get_db()
+    cur = db.cursor()
 
+    cur.execute("SELECT patient_id FROM patients WHERE patient_id = ?", (pid,))
+    row = cur.fetchone()
+    if not row:
+        db.close()
+        return jsonify({"error": "Unknown patient_id"}), 404
+    pid = row["patient_id"]
 
-    # Store session WITH ai_json
+    # Store session now; ai_json is filled in by the job
     cur.execute("""
-        INSERT INTO clinical_sessions(patient_id, short_summary, ai_json)
-        VALUES (?, ?, ?)
+        INSERT INTO clinical_sessions(patient_id, short_summary)
+        VALUES (?, ?)
     """, (
         pid,
-        encrypt_text(summary),
-        json.dumps(res)
+        encrypt_text(data["summary"])
     ))
-
     sid = cur.lastrowid
 
-    # Store structured metrics in email_logs
-    cur.execute("""
-        INSERT INTO email_logs
-        (patient_id, session_id, email_body, recipient_type,
-         anxiety, burnout_risk, depression_risk, self_harm_risk)
-        VALUES (?,?,?,?,?,?,?,?)
-    """, (
-        pid,
-        sid,
-        encrypt_text(res["email_text"]),
-        res["risk"],
-
-        normalize(res["anxiety"]),
-        normalize(res["burnout_risk"]),
-        normalize(res["depression_risk"]),
-        normalize(res["self_harm_risk"])
-    ))
-
     db.commit()
     db.close()
-    from rag_builder import build_rag_index
-    build_rag_index()
-    dispatch_event(
-        SESSION_CREATED,
-        {
-        "session_id": sid,
-        "patient_id": pid
-        }
-    )
+
+    # Likely HIGH-risk sessions are analysed (and emailed) first
+    priority = prescreen(data["summary"])
+    job_id = JOBS.enqueue("analyze_session", {"session_id": sid, "patient_id": pid}, priority)
 
     return jsonify({
-        "recipient": recipient,
-        "risk": res["risk"]
-    })
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": f"/api/jobs/{job_id}"
+    }), 202, {"Location": f"/api/jobs/{job_id}"}
+
+
+# ---------------- ANALYZE SESSION PIPELINE ----------------
+
+@JOBS.handler("analyze_session")
+def run_analysis_job(job, progress):
+    """
+    Stages run in order; each one is recorded in job["state"]["done"] once
+    finished, so a job resumed after a crash does not call Gemini or send
+    the email a second time.
+    """
+    sid = job["payload"]["session_id"]
+    pid = job["payload"]["patient_id"]
+    state = job["state"]
+    state.setdefault("done", [])
+
+    def stage(name, fn):
+        if name in state["done"]:
+            return
+        progress(name)
+        fn()
+        state["done"].append(name)
+        progress(name, state)
+
+    def analysis():
+        db = get_db()
+        cur = db.cursor()
+        cur.execute("SELECT short_summary FROM clinical_sessions WHERE session_id = ?", (sid,))
+        summary = decrypt_text(cur.fetchone()["short_summary"])
+        db.close()
+
+        try:
+            # A prescreened HIGH session never gets the canned MEDIUM
+            # report; a failed analysis is retried instead
+            res = analyze_session(summary, fallback=job["priority"] != "HIGH")
+        except Overloaded as e:
+            # Gemini was not called: wait without using up an attempt
+            delay = ANALYSIS_DEFER
+            if isinstance(e, CircuitOpen):
+                delay = max(delay, LLM_GUARD.breaker.stats()["retry_in_seconds"])
+            raise Defer(delay, f"LLM unavailable: {e}")
+
+        db = get_db()
+        cur = db.cursor()
+        cur.execute("UPDATE clinical_sessions SET ai_json = ? WHERE session_id = ?", (json.dumps(res), sid))
+        db.commit()
+        db.close()
+        state["analysis"] = res
+
+    def insight_webhook():
+        res = state["analysis"]
+        dispatch_event(
+            AI_INSIGHT_GENERATED,
+            {
+            "risk": res["risk"],
+            "signals": list(res.keys()),
+            "engine": "clinical_ai_v1"
+            }
+        )
+
+    def email():
+        res = state["analysis"]
+        db = get_db()
+        cur = db.cursor()
+
+        # Get patient + doctor info for selected patient
+        cur.execute("""
+            SELECT p.email, d.email, d.doctor_id
+            FROM patients p
+            LEFT JOIN doctors d ON d.doctor_id = p.assigned_doctor
+            WHERE p.patient_id = ?
+        """, (pid,))
+        pemail, demail, did = cur.fetchone()
+        db.close()
+
+        recipient = demail if res["risk"] == "HIGH" and demail else pemail
+        state["recipient"] = recipient
+        state["doctor_id"] = did
+        state["digest"] = wants_digest(res, did)
+
+        if state["digest"] and recipient == demail:
+            # Doctor gets this one in the next digest instead
+            return
+
+        # Queued in the mail outbox; the fixed id keeps a retried stage
+        # from queueing it twice
+        send_email(recipient, "HopeQure Follow-up", res["email_text"],
+                   priority=res["risk"], message_id=f"session-{sid}-followup")
+
+    def followup_webhook():
+        dispatch_event(
+            FOLLOWUP_SENT,
+            {
+            "to": state["recipient"],
+            "risk": state["analysis"]["risk"],
+            "session_context": "clinical_followup"
+            }
+        )
+
+    def email_log():
+        res = state["analysis"]
+        db = get_db()
+        cur = db.cursor()
+
+        cur.execute("SELECT 1 FROM email_logs WHERE session_id = ?", (sid,))
+        if cur.fetchone() is None:
+            # Store structured metrics in email_logs
+            cur.execute("""
+                INSERT INTO email_logs
+                (patient_id, session_id, email_body, recipient_type,
+                 anxiety, burnout_risk, depression_risk, self_harm_risk)
+                VALUES (?,?,?,?,?,?,?,?)
+            """, (
+                pid,
+                sid,
+                encrypt_text(res["email_text"]),
+                res["risk"],
+
+                normalize(res["anxiety"]),
+                normalize(res["burnout_risk"]),
+                normalize(res["depression_risk"]),
+                normalize(res["self_harm_risk"])
+            ))
+            db.commit()
+        db.close()
+
+    def digest():
+        if not state.get("digest"):
+            return
+        db = get_db()
+        cur = db.cursor()
+        cur.execute("SELECT log_id FROM email_logs WHERE session_id = ?", (sid,))
+        log_id = cur.fetchone()["log_id"]
+        db.close()
+        queue_for_digest(log_id, state["doctor_id"])
+
+    def session_webhook():
+        dispatch_event(
+            SESSION_CREATED,
+            {
+            "session_id": sid,
+            "patient_id": pid
+            }
+        )
+
+    stage("analysis", analysis)
+    stage("insight_webhook", insight_webhook)
+    stage("email", email)
+    stage("followup_webhook", followup_webhook)
+    stage("email_log", email_log)
+    stage("digest", digest)
+    stage("index", lambda: index_session(sid))
+    stage("session_webhook", session_webhook)
+
+    return {
+        "recipient": state["recipient"],
+        "risk": state["analysis"]["risk"],
+        "digest": state.get("digest", False)
+    }
+
+
+# ---------------- HIGH-RISK ESCALATION ----------------
+# A session prescreened HIGH never gets the canned fallback report, so if
+# its analysis fails for good (Gemini down on every attempt, or the worker
+# lost each time) nothing would reach a doctor. Instead the assigned doctor
+# (or ESCALATION_EMAIL) is alerted on the keyword pre-screen alone and the
+# session is indexed for search. The job stays in the failed list; an admin
+# can requeue it for the full analysis once Gemini is back.
+
+def escalate_unanalysed(sid, pid, error):
+    db = get_db()
+    cur = db.cursor()
+    cur.execute("""
+        SELECT p.name, d.email, c.short_summary
+        FROM patients p
+        JOIN clinical_sessions c ON c.patient_id = p.patient_id
+        LEFT JOIN doctors d ON d.doctor_id = p.assigned_doctor
+        WHERE c.session_id = ? AND p.patient_id = ?
+    """, (sid, pid))
+    row = cur.fetchone()
+    db.close()
+    if row is None:
+        return
+
+    name, demail, summary = row
+    recipient = demail or ESCALATION_EMAIL
+    if recipient:
+        body = (
+            f"Session {sid} of {name} was flagged HIGH risk by the keyword pre-screen, "
+            f"but the AI analysis could not be completed ({error}).\n\n"
+            f"Please review the session directly:\n\n{decrypt_text(summary)}"
+        )
+        # Fixed id: a requeued job that fails again does not alert twice
+        send_email(recipient, "HopeQure: HIGH-risk session needs review", body,
+                   priority="HIGH", message_id=f"session-{sid}-escalation")
+        print(f"🚨 Session {sid} escalated to {recipient} without analysis")
+    else:
+        print(f"🚨 Session {sid} failed analysis and has no doctor or ESCALATION_EMAIL to alert")
+
+    index_session(sid)
+
+
+@JOBS.on_update
+def escalate_failed_analysis(update):
+    if update["kind"] != "analyze_session" or update["priority"] != "HIGH" or update["status"] != FAILED:
+        return
+    job = JOBS.get(update["job_id"])
+    if "analysis" in job["state"].get("done", []):
+        # The analysis was stored; only a later stage failed
+        return
+    escalate_unanalysed(job["payload"]["session_id"], job["payload"]["patient_id"], update["error"])
+
+
+# ---------------- JOB STATUS ----------------
+
+@JOBS.on_update
+def push_job_update(job):
+    socketio.emit("job_update", job, to=f"job:{job['job_id']}")
+
+
+@socketio.on("watch_job")
+def watch_job(data):
+    if not session.get("admin"):
+        return
+
+    job = JOBS.get(data.get("job_id", ""))
+    if not job:
+        emit("job_update", {"job_id": data.get("job_id"), "status": "failed", "error": "Unknown job"})
+        return
+
+    join_room(f"job:{job['job_id']}")
+    # The job may have moved on before the client subscribed
+    emit("job_update", JOBS.public(job))
+
+
+@app.route("/api/jobs/<job_id>")
+def job_status(job_id):
+    if not (session.get("admin") or verify_api_key(request)):
+        return jsonify({"error": "Unauthorized"}), 403
+
+    job = JOBS.get(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(JOBS.public(job))
+
+
+def start_job_workers():
+    for _ in range(JOB_WORKERS):
+        socketio.start_background_task(JOBS.work)
+    print(f"🧵 {JOB_WORKERS} job workers started")
 
 
 # ---------------- VIEW DETAILED REPORT ----------------
@@ -454,11 +759,11 @@ def add_patient():
         INSERT INTO patients (name, email, assigned_doctor)
         VALUES (?, ?, ?)
     """, (name, email, doctor_id))
+    new_pid = cur.lastrowid
 
     db.commit()
     db.close()
-    from rag_builder import build_rag_index
-    build_rag_index()
+    refresh_rag_documents("patient", [new_pid])
 
 
     return jsonify({"status": "success"})
@@ -535,6 +840,15 @@ def webhook_test():
     return {"status": "ok"}, 200
 
 # ---------------- WHISPER AUDIO TRANSCRIPTION ----------------
+# Whisper runs in the TRANSCRIBER worker processes, never on the request
+# thread. The upload is queued and 202 + job_id returned; the text arrives
+# via the "transcription_update" Socket.IO event (after
+# "watch_transcription") or GET /api/transcriptions/<id>.
+#
+# The recording can be POSTed as the raw body (Content-Type audio/* or
+# video/*), which is decoded while it is still uploading, or as the
+# "audio" field of a multipart form as before. Either way only the 16 kHz
+# mono speech parts (audio_prep) reach Whisper.
 
 @app.route("/transcribe-audio", methods=["POST"])
 def transcribe_audio():
@@ -542,36 +856,98 @@ def transcribe_audio():
     if not verify_api_key(request):
         return jsonify({"error": "Invalid API key"}), 401
 
-    if "audio" not in request.files:
+    if request.mimetype.startswith(("audio/", "video/")):
+        upload = request.stream
+    elif "audio" in request.files:
+        upload = request.files["audio"].stream
+    else:
         return jsonify({"error": "No audio file uploaded"}), 400
 
-    audio_file = request.files["audio"]
+    try:
+        audio, seconds = prepare_upload(upload)
+    except DecodeError as e:
+        return jsonify({"error": f"Could not decode audio: {e}"}), 400
 
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".webm") as temp:
-        audio_file.save(temp.name)
-        temp_path = temp.name
+    if not len(audio):
+        # Nothing above the noise floor, no need to wake Whisper
+        return jsonify({"status": "done", "text": ""})
 
     try:
-        result = whisper_model.transcribe(
-            temp_path,
-            language="en",
-            fp16=False
-        )
+        job_id = TRANSCRIBER.submit(audio, duration=len(audio) / SAMPLE_RATE)
+    except Busy as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "10"}
+
+    return jsonify({
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": f"/api/transcriptions/{job_id}"
+    }), 202, {"Location": f"/api/transcriptions/{job_id}"}
+
 
-        transcript = result.get("text", "").strip()
+@app.route("/api/transcriptions/<job_id>")
+def transcription_status(job_id):
+    if not (session.get("admin") or verify_api_key(request)):
+        return jsonify({"error": "Unauthorized"}), 403
 
-        return jsonify({"text": transcript})
+    job = TRANSCRIBER.get(job_id)
+    if not job:
+        return jsonify({"error": "Transcription not found"}), 404
+    return jsonify(TRANSCRIBER.public(job))
 
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
 
-    finally:
-        try:
-            os.remove(temp_path)
-        except:
-            pass
+@TRANSCRIBER.on_update
+def push_transcription_update(job):
+    socketio.emit("transcription_update", job, to=f"transcribe:{job['job_id']}")
+
+
+@socketio.on("watch_transcription")
+def watch_transcription(data):
+    if not session.get("admin"):
+        return
+
+    job = TRANSCRIBER.get(data.get("job_id", ""))
+    if not job:
+        emit("transcription_update", {"job_id": data.get("job_id"), "status": "failed",
+                                      "error": "Unknown transcription"})
+        return
+
+    join_room(f"transcribe:{job['job_id']}")
+    emit("transcription_update", TRANSCRIBER.public(job))
+
+
+# ---------------- LIVE TRANSCRIPTION ----------------
+# "live_start" (acked with a stream_id), then "live_audio" chunks of 16 kHz
+# Int16 PCM while recording, then "live_stop". The server answers with
+# "live_partial" as windows are transcribed and one "live_final".
+
+@socketio.on("live_start")
+def live_start(data=None):
+    if not session.get("admin"):
+        return {"error": "Unauthorized"}
+
+    sid = request.sid
+    stream = LIVE.start(sid, lambda event, payload: socketio.emit(event, payload, to=sid))
+    return {"stream_id": stream.stream_id}
+
+
+@socketio.on("live_audio")
+def live_audio(data):
+    stream = LIVE.get(data.get("stream_id"), request.sid)
+    if stream and isinstance(data.get("pcm"), bytes):
+        stream.add(data["pcm"])
+
+
+@socketio.on("live_stop")
+def live_stop(data):
+    stream = LIVE.get(data.get("stream_id"), request.sid)
+    if stream:
+        stream.stop()
+
+
+@socketio.on("disconnect")
+def handle_disconnect():
+    LIVE.drop_owner(request.sid)
 
-        
 @socketio.on("connect")
 def handle_connect():
     print("CLIENT CONNECTED SOCKET")
@@ -602,16 +978,42 @@ def add_doctor():
         INSERT INTO doctors (name, email)
         VALUES (?, ?)
     """, (name, email))
+    new_did = cur.lastrowid
 
     db.commit()
     db.close()
+    refresh_rag_documents("doctor", [new_did])
 
     return jsonify({"status": "success"})
 
 
+# ---------------- STARTUP ----------------
+# Importing this module starts nothing, so scripts, tests and the gunicorn
+# master can import it freely. The serving process calls
+# start_background_workers() once: below when run directly, or from
+# gunicorn.conf.py's post_worker_init in each worker.
+
+_workers_started = False
+
+
+def start_background_workers():
+    global _workers_started
+    if _workers_started:
+        return
+    _workers_started = True
 
+    start_model_switch()
+    start_job_workers()
+    start_mail_workers(socketio.start_background_task)
+    start_webhook_workers(socketio.start_background_task)
+    # Whisper workers start with the first transcription, or now when the
+    # models were preloaded anyway
+    TRANSCRIBER.start(socketio.start_background_task, eager=PRELOAD_MODELS)
+    if DIGEST_ENABLED:
+        socketio.start_background_task(digest_worker)
 
 
 if __name__ == "__main__":
-    socketio.run(app, host="0.0.0.0", port=9000, debug=True)
+    start_background_workers()
+    socketio.run(app, host="0.0.0.0", port=9000)
 
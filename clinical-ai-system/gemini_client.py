@@ -0,0 +1,144 @@
+import os
+import time
+import random
+import threading
+from collections import Counter, deque
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+from latency_stats import percentiles
+
+load_dotenv()
+
+
+# ---------------- GEMINI HTTP CLIENT ----------------
+# One pooled keep-alive Session shared by ai_engine and rag_engine, so
+# calls reuse TCP+TLS connections instead of opening a new one each time.
+# 429 and 5xx responses and connection failures are retried with jittered
+# exponential backoff (honouring Retry-After); read timeouts are not
+# retried, the caller has already waited long enough.
+
+API_KEY = os.getenv("GEMINI_API_KEY")
+BASE_URL = os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com/v1beta").rstrip("/")
+MODEL = os.getenv("GEMINI_MODEL", "gemini-3-flash-preview")
+
+POOL_SIZE = int(os.getenv("GEMINI_POOL_SIZE", "10"))
+CONNECT_TIMEOUT = float(os.getenv("GEMINI_CONNECT_TIMEOUT", "5"))
+MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "3"))
+BACKOFF_BASE = float(os.getenv("GEMINI_BACKOFF_BASE", "0.5"))
+BACKOFF_MAX = float(os.getenv("GEMINI_BACKOFF_MAX", "8"))
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+LATENCY_WINDOW = 500
+
+
+class GeminiClient:
+
+    def __init__(self, base_url=BASE_URL, model=MODEL, api_key=API_KEY,
+                 pool_size=POOL_SIZE, max_retries=MAX_RETRIES):
+        self.base_url = base_url
+        self.model = model
+        self.max_retries = max_retries
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=False)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "Content-Type": "application/json",
+            "x-goog-api-key": api_key or "",
+        })
+
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.statuses = Counter()
+
+    def _url(self, method):
+        url = f"{self.base_url}/models/{self.model}:{method}"
+        return url + "?alt=sse" if method == "streamGenerateContent" else url
+
+    def _backoff(self, attempt, response=None):
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), BACKOFF_MAX)
+            except ValueError:
+                pass
+        # Full jitter: uniform over [0, base * 2^attempt]
+        return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+    def _record(self, started, status, retries, failed):
+        with self._lock:
+            self.calls += 1
+            self.retries += retries
+            self.statuses[str(status)] += 1
+            if failed:
+                self.failures += 1
+            self._latencies.append(time.perf_counter() - started)
+
+    def post(self, method, payload, timeout=30, stream=False):
+        """
+        POST payload to models/<model>:<method>. Returns the last Response
+        (possibly still an error status once retries run out); raises on
+        read timeouts and on connection errors after the last retry.
+        """
+        started = time.perf_counter()
+        attempt = 0
+
+        while True:
+            try:
+                res = self.session.post(
+                    self._url(method),
+                    json=payload,
+                    timeout=(CONNECT_TIMEOUT, timeout),
+                    stream=stream
+                )
+            except requests.exceptions.ConnectionError as e:
+                # Includes ConnectTimeout and keep-alive connections dropped by the server
+                if attempt >= self.max_retries:
+                    self._record(started, type(e).__name__, attempt, True)
+                    raise
+                delay = self._backoff(attempt)
+                print(f"⚠️ Gemini connection error, retry {attempt + 1} in {delay:.2f}s:", e)
+            except requests.exceptions.Timeout as e:
+                self._record(started, type(e).__name__, attempt, True)
+                raise
+            else:
+                if res.status_code not in RETRY_STATUS or attempt >= self.max_retries:
+                    self._record(started, res.status_code, attempt, res.status_code >= 400)
+                    return res
+                delay = self._backoff(attempt, res)
+                print(f"⚠️ Gemini returned {res.status_code}, retry {attempt + 1} in {delay:.2f}s")
+                res.close()
+
+            time.sleep(delay)
+            attempt += 1
+
+    def generate(self, payload, timeout=30):
+        return self.post("generateContent", payload, timeout)
+
+    def stream_generate(self, payload, timeout=45):
+        """
+        Server-sent events response; latency is recorded at the headers,
+        i.e. time to first byte.
+        """
+        return self.post("streamGenerateContent", payload, timeout, stream=True)
+
+    def stats(self):
+        with self._lock:
+            latencies = list(self._latencies)
+            return {
+                "calls": self.calls,
+                "retries": self.retries,
+                "failures": self.failures,
+                "statuses": dict(self.statuses),
+                "latency_ms": percentiles(latencies, scale=1000),
+                "pool_size": POOL_SIZE,
+                "base_url": self.base_url,
+            }
+
+
+GEMINI = GeminiClient()
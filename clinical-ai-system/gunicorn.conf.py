@@ -0,0 +1,27 @@
+import os
+
+# ---------------- GUNICORN ----------------
+# Picked up automatically by the procfile's gunicorn command.
+#
+# PRELOAD_MODELS=1: the embedding model (and Whisper, unless
+# PRELOAD_WHISPER=0) is loaded once in the master before the workers are
+# forked, so all of them share the weights copy-on-write. The app itself
+# is not preloaded (no preload_app): each worker still imports
+# followup_service after the eventlet worker has monkey-patched it.
+#
+# Background workers (jobs, mail, webhooks, digest, Whisper pool) are
+# started per worker in post_worker_init, which runs after the app is
+# loaded in the patched worker; post_fork would run before the patching.
+#
+#   PRELOAD_MODELS=1 gunicorn -k eventlet -w 4 followup_service:app
+
+
+def on_starting(server):
+    if os.getenv("PRELOAD_MODELS", "0") == "1":
+        from model_loader import preload
+        preload()
+
+
+def post_worker_init(worker):
+    from followup_service import start_background_workers
+    start_background_workers()
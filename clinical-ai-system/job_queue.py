@@ -0,0 +1,412 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from collections import Counter, deque
+from dotenv import load_dotenv
+from latency_stats import percentiles
+
+load_dotenv()
+
+
+# ---------------- DURABLE JOB QUEUE ----------------
+# Background work (session analysis, follow-up email, indexing, webhooks)
+# is recorded in an SQLite jobs table and run by worker threads, so the
+# HTTP request only has to insert a row. A worker claims a job by taking a
+# lease; if the process dies mid-job the lease expires and the job is picked
+# up again. Failed jobs are retried with exponential backoff. Handlers
+# checkpoint their progress in the job's `state`, so a resumed job skips
+# the stages that already finished.
+#
+# Each JobQueue owns one table (the mail outbox is another instance), all
+# in jobs.db. That file is kept apart from clinic.db: job bookkeeping must
+# not bump clinic.db's data_version (which would flush the answer cache and
+# the snapshot on every progress update) or contend with clinical writes.
+#
+# Jobs carry a priority class (HIGH, MEDIUM, LOW). Workers take the job
+# with the smallest created_at + rank * PRIORITY_AGING, so a HIGH job jumps
+# ahead of LOW work queued up to 2 * PRIORITY_AGING seconds earlier, and a
+# LOW job that has waited that long is served before newer HIGH ones
+# instead of starving.
+#
+# Jobs enqueued with the same `group` can be coalesced: a queue created with
+# batch_limit > 1 hands the worker up to that many due jobs of the group at
+# once (job["batch"] holds the extra ones) and settles them together.
+
+JOBS_DB = os.getenv("JOBS_DB", "jobs.db")
+LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "300"))
+MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+RETRY_DELAY = float(os.getenv("JOB_RETRY_DELAY", "10"))
+POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "2"))
+PRIORITY_AGING = float(os.getenv("JOB_PRIORITY_AGING", "120"))
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+PRIORITIES = {"HIGH": 0, "MEDIUM": 1, "LOW": 2}
+WAIT_WINDOW = 500
+
+
+class Defer(Exception):
+    """
+    Raised by a handler to put the job back for `delay` seconds without
+    counting an attempt, e.g. while a per-target limit is reached.
+    """
+
+    def __init__(self, delay, reason="deferred"):
+        super().__init__(reason)
+        self.delay = delay
+
+
+class GiveUp(Exception):
+    """
+    Raised by a handler for failures a retry cannot fix; the job fails
+    immediately.
+    """
+
+
+class JobQueue:
+
+    def __init__(self, path=JOBS_DB, table="jobs", max_attempts=MAX_ATTEMPTS, retry_delay=RETRY_DELAY,
+                 batch_limit=1):
+        self.path = path
+        self.table = table
+        self.batch_limit = batch_limit
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._wakeup = threading.Event()
+        self._handlers = {}
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._created = False
+        self.completed = 0
+        self.failed = 0
+        self._started = 0
+        self._wait_total = 0.0
+        self._run_total = 0.0
+        self._waits = {p: deque(maxlen=WAIT_WINDOW) for p in PRIORITIES}
+        self._waited = Counter()
+
+    def _db(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        if not self._created:
+            t = self.table
+            conn.executescript(f"""
+                PRAGMA journal_mode=WAL;
+                CREATE TABLE IF NOT EXISTS {t} (
+                    job_id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    state TEXT NOT NULL DEFAULT '{{}}',
+                    status TEXT NOT NULL,
+                    stage TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    run_after REAL NOT NULL,
+                    lease_until REAL,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    priority TEXT NOT NULL DEFAULT 'MEDIUM',
+                    sort_key REAL,
+                    group_key TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_{t}_pending ON {t}(status, run_after);
+            """)
+            cols = {r[1] for r in conn.execute(f"PRAGMA table_info({t})")}
+            if "priority" not in cols:
+                # jobs.db created before priority scheduling
+                conn.executescript(f"""
+                    ALTER TABLE {t} ADD COLUMN priority TEXT NOT NULL DEFAULT 'MEDIUM';
+                    ALTER TABLE {t} ADD COLUMN sort_key REAL;
+                    UPDATE {t} SET sort_key = created_at + {PRIORITY_AGING};
+                """)
+            if "group_key" not in cols:
+                conn.execute(f"ALTER TABLE {t} ADD COLUMN group_key TEXT")
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{t}_order ON {t}(status, sort_key)")
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{t}_group ON {t}(group_key, status) WHERE group_key IS NOT NULL")
+            conn.commit()
+            self._created = True
+        return conn
+
+    # ---- producer side ----
+
+    def enqueue(self, kind, payload, priority="MEDIUM", job_id=None, group=None, delay=0):
+        """
+        Returns the job id. Passing a fixed job_id makes enqueue idempotent:
+        a second call with the same id is a no-op. `delay` holds the job
+        back for that many seconds, e.g. to let a group fill up.
+        """
+        job_id = job_id or uuid.uuid4().hex
+        priority = priority if priority in PRIORITIES else "MEDIUM"
+        now = time.time()
+        sort_key = now + PRIORITIES[priority] * PRIORITY_AGING
+        db = self._db()
+        db.execute(f"""
+            INSERT OR IGNORE INTO {self.table}
+                (job_id, kind, payload, status, stage, run_after, created_at, priority, sort_key, group_key)
+            VALUES (?, ?, ?, ?, 'queued', ?, ?, ?, ?, ?)
+        """, (job_id, kind, json.dumps(payload), QUEUED, now + delay, now, priority, sort_key, group))
+        db.commit()
+        db.close()
+        self._wakeup.set()
+        return job_id
+
+    def get(self, job_id):
+        db = self._db()
+        row = db.execute(f"SELECT * FROM {self.table} WHERE job_id = ?", (job_id,)).fetchone()
+        db.close()
+        return self._as_dict(row) if row else None
+
+    def _as_dict(self, row):
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["state"] = json.loads(job["state"] or "{}")
+        return job
+
+    def public(self, job):
+        """
+        What clients may see: no payload, and the handler's result only
+        once the job is done.
+        """
+        return {
+            "job_id": job["job_id"],
+            "kind": job["kind"],
+            "priority": job["priority"],
+            "status": job["status"],
+            "stage": job["stage"],
+            "attempts": job["attempts"],
+            "error": job["error"] if job["status"] == FAILED else None,
+            "result": job["state"].get("result") if job["status"] == DONE else None,
+        }
+
+    # ---- worker side ----
+
+    def handler(self, kind):
+        def register(fn):
+            self._handlers[kind] = fn
+            return fn
+        return register
+
+    def on_update(self, fn):
+        """
+        fn(public job dict) is called on every stage change and completion.
+        """
+        self._listeners.append(fn)
+        return fn
+
+    def _notify(self, job_id):
+        if not self._listeners:
+            return
+        job = self.get(job_id)
+        for fn in self._listeners:
+            try:
+                fn(self.public(job))
+            except Exception as e:
+                print("JOB LISTENER ERROR:", e)
+
+    def _claim(self):
+        now = time.time()
+        db = self._db()
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            # Queued jobs that are due, or running jobs whose worker died
+            row = db.execute(f"""
+                SELECT * FROM {self.table}
+                WHERE (status = ? AND run_after <= ?)
+                   OR (status = ? AND lease_until < ?)
+                ORDER BY sort_key
+                LIMIT 1
+            """, (QUEUED, now, RUNNING, now)).fetchone()
+
+            if row is None:
+                db.rollback()
+                return None
+
+            if row["status"] == RUNNING:
+                if row["attempts"] >= self.max_attempts:
+                    # Lost its worker every time; do not let it crash-loop
+                    db.execute(f"""
+                        UPDATE {self.table} SET status = ?, stage = 'failed', error = ?,
+                            lease_until = NULL, finished_at = ?
+                        WHERE job_id = ?
+                    """, (FAILED, "Worker lost during every attempt", now, row["job_id"]))
+                    db.commit()
+                    print(f"❌ Job {row['job_id']} abandoned after {row['attempts']} attempts")
+                    self._notify(row["job_id"])
+                    return None
+                print(f"♻️ Recovering job {row['job_id']} from stage {row['stage']}")
+
+            rows = [row]
+            if row["group_key"] is not None and self.batch_limit > 1:
+                rows += db.execute(f"""
+                    SELECT * FROM {self.table}
+                    WHERE group_key = ? AND status = ? AND run_after <= ? AND job_id != ?
+                    ORDER BY sort_key
+                    LIMIT ?
+                """, (row["group_key"], QUEUED, now, row["job_id"], self.batch_limit - 1)).fetchall()
+
+            db.executemany(f"""
+                UPDATE {self.table}
+                SET status = ?, lease_until = ?, attempts = attempts + 1,
+                    started_at = COALESCE(started_at, ?)
+                WHERE job_id = ?
+            """, [(RUNNING, now + LEASE_SECONDS, now, r["job_id"]) for r in rows])
+            db.commit()
+        finally:
+            db.close()
+
+        jobs = [self._as_dict(r) for r in rows]
+        for job in jobs:
+            job["attempts"] += 1
+            if job["attempts"] == 1:
+                # run_after is the enqueue time (or the requeue time of a dead letter)
+                waited = max(0.0, now - job["run_after"])
+                with self._lock:
+                    self._started += 1
+                    self._wait_total += waited
+                    self._waited[job["priority"]] += 1
+                    self._waits[job["priority"]].append(waited)
+
+        job = jobs[0]
+        job["batch"] = jobs[1:]
+        return job
+
+    def _update(self, job_id, **fields):
+        if "state" in fields:
+            fields["state"] = json.dumps(fields["state"])
+        cols = ", ".join(f"{k} = ?" for k in fields)
+        db = self._db()
+        db.execute(f"UPDATE {self.table} SET {cols} WHERE job_id = ?", (*fields.values(), job_id))
+        db.commit()
+        db.close()
+
+    def _run(self, job):
+        job_id = job["job_id"]
+        members = [job] + job.get("batch", [])
+        started = time.time()
+
+        def progress(stage, state=None):
+            # Persists the stage (and checkpoint), renews the lease
+            fields = {"stage": stage, "lease_until": time.time() + LEASE_SECONDS}
+            if state is not None:
+                fields["state"] = state
+            self._update(job_id, **fields)
+            self._notify(job_id)
+
+        try:
+            fn = self._handlers[job["kind"]]
+            result = fn(job, progress)
+            for m in members:
+                # Checkpoints are not needed any more, keep only the result
+                self._update(m["job_id"], status=DONE, stage="done", state={"result": result},
+                             lease_until=None, finished_at=time.time(), error=None)
+            with self._lock:
+                self.completed += len(members)
+                self._run_total += (time.time() - started) * len(members)
+            print(f"✅ Job {job_id} ({job['kind']}{f', +{len(members) - 1} batched' if len(members) > 1 else ''}) "
+                  f"done in {time.time() - started:.2f}s")
+
+        except Defer as e:
+            for m in members:
+                self._update(m["job_id"], status=QUEUED, lease_until=None, attempts=m["attempts"] - 1,
+                             run_after=time.time() + e.delay)
+            return
+
+        except Exception as e:
+            print(f"❌ Job {job_id} failed (attempt {job['attempts']}):", e)
+            for m in members:
+                if isinstance(e, GiveUp) or m["attempts"] >= self.max_attempts:
+                    self._update(m["job_id"], status=FAILED, stage="failed", error=str(e),
+                                 lease_until=None, finished_at=time.time())
+                    with self._lock:
+                        self.failed += 1
+                else:
+                    self._update(m["job_id"], status=QUEUED, error=str(e), lease_until=None,
+                                 run_after=time.time() + self.retry_delay * 2 ** (m["attempts"] - 1))
+
+        for m in members:
+            self._notify(m["job_id"])
+
+    def work(self):
+        """
+        Worker loop; run one per worker thread / green thread.
+        """
+        while True:
+            try:
+                job = self._claim()
+            except Exception as e:
+                print("JOB QUEUE ERROR:", e)
+                job = None
+
+            if job is None:
+                self._wakeup.wait(POLL_INTERVAL)
+                self._wakeup.clear()
+                continue
+
+            self._run(job)
+
+    def failed_jobs(self, limit=50):
+        """
+        Most recent jobs that failed for good (the dead-letter list).
+        """
+        db = self._db()
+        rows = db.execute(f"""
+            SELECT * FROM {self.table} WHERE status = ?
+            ORDER BY finished_at DESC LIMIT ?
+        """, (FAILED, limit)).fetchall()
+        db.close()
+        return [self._as_dict(r) for r in rows]
+
+    def requeue(self, job_id):
+        """
+        Gives a failed job a fresh set of attempts. Returns False if the
+        job does not exist or has not failed.
+        """
+        db = self._db()
+        cur = db.execute(f"""
+            UPDATE {self.table}
+            SET status = ?, stage = 'queued', attempts = 0, error = NULL,
+                run_after = ?, finished_at = NULL
+            WHERE job_id = ? AND status = ?
+        """, (QUEUED, time.time(), job_id, FAILED))
+        db.commit()
+        db.close()
+        if cur.rowcount:
+            self._wakeup.set()
+        return bool(cur.rowcount)
+
+    def stats(self):
+        db = self._db()
+        counts = dict(db.execute(f"SELECT status, COUNT(*) FROM {self.table} GROUP BY status").fetchall())
+        queued = dict(db.execute(
+            f"SELECT priority, COUNT(*) FROM {self.table} WHERE status = ? GROUP BY priority", (QUEUED,)
+        ).fetchall())
+        db.close()
+        with self._lock:
+            runs = self.completed
+            started = self._started
+            return {
+                "queued": counts.get(QUEUED, 0),
+                "running": counts.get(RUNNING, 0),
+                "done": counts.get(DONE, 0),
+                "failed": counts.get(FAILED, 0),
+                "completed_since_start": runs,
+                "failed_since_start": self.failed,
+                "avg_queue_wait_ms": round(self._wait_total / started * 1000, 1) if started else 0,
+                "avg_run_ms": round(self._run_total / runs * 1000, 1) if runs else 0,
+                "priority_aging_seconds": PRIORITY_AGING,
+                "by_priority": {
+                    p: dict(queued=queued.get(p, 0), started=self._waited[p], **self._wait_stats(p))
+                    for p in PRIORITIES
+                },
+            }
+
+    def _wait_stats(self, priority):
+        waits = percentiles(self._waits[priority], scale=1000)
+        return {"avg_wait_ms": waits["avg"], "p95_wait_ms": waits["p95"], "max_wait_ms": waits["max"]}
+
+
+JOBS = JobQueue()
@@ -0,0 +1,20 @@
+# ---------------- LATENCY STATS ----------------
+# The avg / p50 / p95 / max summary reported on /api/metrics for a window
+# of recent latencies.
+
+
+def percentiles(values, digits=1, scale=1):
+    """
+    Summary of values (any order), each multiplied by scale (e.g. 1000 for
+    seconds to ms) and rounded to digits; all zeros when empty.
+    """
+    values = sorted(values)
+    if not values:
+        return {"avg": 0, "p50": 0, "p95": 0, "max": 0}
+    pick = lambda p: round(values[min(len(values) - 1, int(p * len(values)))] * scale, digits)
+    return {
+        "avg": round(sum(values) / len(values) * scale, digits),
+        "p50": pick(0.5),
+        "p95": pick(0.95),
+        "max": round(values[-1] * scale, digits),
+    }
@@ -0,0 +1,214 @@
+import os
+import re
+import time
+import uuid
+import threading
+from difflib import SequenceMatcher
+import numpy as np
+from dotenv import load_dotenv
+from transcriber import TRANSCRIBER, Busy
+from audio_prep import has_speech
+
+load_dotenv()
+
+
+# ---------------- LIVE TRANSCRIPTION ----------------
+# While recording, the browser sends 16 kHz mono Int16 PCM chunks over
+# Socket.IO. Once LIVE_STEP seconds of new audio are buffered, the last
+# LIVE_WINDOW seconds go to the TRANSCRIBER pool. Each window starts at
+# least LIVE_OVERLAP seconds before the previous one ended, so no audio is
+# skipped even when the pool falls behind (windows are capped at
+# LIVE_MAX_WINDOW, Whisper's 30 s input).
+#
+# The overlap is transcribed twice. Its text is matched against the
+# previous window's words and the newer version wins, since it has the
+# later context and the previous window may have cut the last word. Only
+# one window per stream is in flight; on stop, the remaining audio is
+# transcribed and the final text pushed. Windows without speech (VAD) are
+# not sent to Whisper at all.
+
+LIVE_SAMPLE_RATE = 16000
+LIVE_STEP = float(os.getenv("LIVE_STEP", "4"))
+LIVE_WINDOW = float(os.getenv("LIVE_WINDOW", "10"))
+LIVE_OVERLAP = float(os.getenv("LIVE_OVERLAP", "2"))
+LIVE_MAX_WINDOW = float(os.getenv("LIVE_MAX_WINDOW", "28"))
+LIVE_MAX_SECONDS = float(os.getenv("LIVE_MAX_SECONDS", "5400"))  # per stream
+MIN_OVERLAP_WORDS = 2
+
+_WORD = re.compile(r"[\w']+")
+
+
+def _norm(word):
+    return "".join(_WORD.findall(word.lower()))
+
+
+def merge_words(words, window_start, new_words):
+    """
+    Merges a window's words into the transcript. words[window_start:] came
+    from the previous window; returns (words, start of the new window).
+    """
+    prev = [_norm(w) for w in words[window_start:]]
+    new = [_norm(w) for w in new_words]
+    match = SequenceMatcher(None, prev, new, autojunk=False).find_longest_match(0, len(prev), 0, len(new))
+
+    if match.size >= min(MIN_OVERLAP_WORDS, len(new)) and match.size:
+        # Keep the older text up to the match, the newer text from there on
+        cut = window_start + match.a
+        return words[:cut] + new_words[match.b:], max(0, cut - match.b)
+
+    # No common words, e.g. the overlap was silence
+    return words + new_words, len(words)
+
+
+class LiveStream:
+
+    def __init__(self, push):
+        self.stream_id = uuid.uuid4().hex
+        self.push = push
+        self._lock = threading.Lock()
+        self._pcm = bytearray()
+        self._offset = 0           # samples trimmed from the front of _pcm
+        self._total = 0            # samples received
+        self._sent_end = 0         # end sample of the last window submitted
+        self._in_flight = False
+        self._stopping = False
+        self.words = []
+        self._window_start = 0
+        self.windows = 0
+        self.skipped = 0
+        self.started_at = time.time()
+
+    def _window(self):
+        # Caller holds the lock
+        end = self._total
+        start = min(max(0, end - int(LIVE_WINDOW * LIVE_SAMPLE_RATE)),
+                    max(0, self._sent_end - int(LIVE_OVERLAP * LIVE_SAMPLE_RATE)))
+        end = min(end, start + int(LIVE_MAX_WINDOW * LIVE_SAMPLE_RATE))
+
+        pcm = self._pcm[(start - self._offset) * 2:(end - self._offset) * 2]
+        audio = np.frombuffer(bytes(pcm), dtype=np.int16).astype(np.float32) / 32768.0
+        return audio, end
+
+    def _trim(self, end):
+        # Caller holds the lock. Only once the window ending at `end` has
+        # been accepted (or skipped): nothing before the next window's
+        # earliest start is needed again.
+        keep_from = max(0, end - int(max(LIVE_WINDOW, LIVE_OVERLAP) * LIVE_SAMPLE_RATE))
+        if keep_from > self._offset:
+            del self._pcm[:(keep_from - self._offset) * 2]
+            self._offset = keep_from
+
+    def _maybe_submit(self):
+        # Caller holds the lock
+        if self._in_flight:
+            return
+        pending = self._total - self._sent_end
+        if pending < LIVE_STEP * LIVE_SAMPLE_RATE and not (self._stopping and pending > 0.3 * LIVE_SAMPLE_RATE):
+            if self._stopping:
+                self._finish()
+            return
+
+        audio, end = self._window()
+        if not has_speech(audio):
+            self._sent_end = end
+            self._trim(end)
+            self.skipped += 1
+            self._maybe_submit()
+            return
+
+        try:
+            TRANSCRIBER.submit(audio, duration=len(audio) / LIVE_SAMPLE_RATE,
+                               on_done=lambda job: self._done(job, end))
+        except Busy:
+            # The buffer is untouched, so the next chunk (or, once stopped,
+            # the retry shortly) submits the same start again
+            if self._stopping:
+                threading.Timer(1.0, self.stop).start()
+            return
+        self._in_flight = True
+        self._trim(end)
+
+    def _done(self, job, end):
+        with self._lock:
+            self._in_flight = False
+            self._sent_end = end
+            self.windows += 1
+            if job["status"] == "done" and job["text"]:
+                self.words, self._window_start = merge_words(self.words, self._window_start, job["text"].split())
+                self.push("live_partial", {"stream_id": self.stream_id, "text": self.text()})
+            self._maybe_submit()
+
+    def _finish(self):
+        self.push("live_final", {"stream_id": self.stream_id, "text": self.text()})
+        LIVE.drop(self.stream_id)
+
+    def add(self, pcm):
+        with self._lock:
+            if self._stopping:
+                return
+            if self._total / LIVE_SAMPLE_RATE > LIVE_MAX_SECONDS:
+                self._stopping = True
+            self._pcm += pcm[:len(pcm) - len(pcm) % 2]
+            self._total += len(pcm) // 2
+            self._maybe_submit()
+
+    def stop(self):
+        with self._lock:
+            self._stopping = True
+            self._maybe_submit()
+
+    def text(self):
+        return " ".join(self.words)
+
+
+class LiveStreams:
+
+    def __init__(self):
+        self._streams = {}
+        self._owners = {}
+        self._lock = threading.Lock()
+        self.started = 0
+        self.finished = 0
+
+    def start(self, owner, push):
+        """
+        push(event, data) sends to the recording client. owner is its
+        Socket.IO sid; its streams are dropped when it disconnects.
+        """
+        stream = LiveStream(push)
+        with self._lock:
+            self._streams[stream.stream_id] = stream
+            self._owners[stream.stream_id] = owner
+            self.started += 1
+        return stream
+
+    def get(self, stream_id, owner):
+        with self._lock:
+            if self._owners.get(stream_id) != owner:
+                return None
+            return self._streams.get(stream_id)
+
+    def drop(self, stream_id):
+        with self._lock:
+            if self._streams.pop(stream_id, None):
+                self._owners.pop(stream_id, None)
+                self.finished += 1
+
+    def drop_owner(self, owner):
+        with self._lock:
+            for stream_id in [s for s, o in self._owners.items() if o == owner]:
+                del self._streams[stream_id]
+                del self._owners[stream_id]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "active_streams": len(self._streams),
+                "started": self.started,
+                "finished": self.finished,
+                "step_seconds": LIVE_STEP,
+                "window_seconds": LIVE_WINDOW,
+            }
+
+
+LIVE = LiveStreams()
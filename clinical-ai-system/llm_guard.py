@@ -0,0 +1,226 @@
+import os
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+# ---------------- LLM ADMISSION CONTROL ----------------
+# The app runs as one eventlet worker, so a slow Gemini holds every
+# /analyze-session and admin-search request open for up to 45s and the
+# worker piles up. Every LLM call now passes through LLM_GUARD:
+#
+# - at most MAX_INFLIGHT calls run at once; further callers wait in a
+#   queue of at most QUEUE_SIZE for up to QUEUE_TIMEOUT seconds
+# - a circuit breaker watches the last BREAKER_WINDOW outcomes and opens
+#   when the error rate reaches BREAKER_ERROR_RATE; while open, calls are
+#   rejected immediately for BREAKER_COOLDOWN seconds, then one trial call
+#   decides whether it closes again
+#
+# Rejected calls raise Overloaded and callers fall back (a cached
+# admin-search answer) or wait (the analyze_session job is deferred).
+
+MAX_INFLIGHT = int(os.getenv("LLM_MAX_INFLIGHT", "4"))
+QUEUE_SIZE = int(os.getenv("LLM_QUEUE_SIZE", "16"))
+QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "10"))
+
+BREAKER_WINDOW = int(os.getenv("LLM_BREAKER_WINDOW", "20"))
+BREAKER_MIN_CALLS = int(os.getenv("LLM_BREAKER_MIN_CALLS", "5"))
+BREAKER_ERROR_RATE = float(os.getenv("LLM_BREAKER_ERROR_RATE", "0.5"))
+BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+
+
+class Overloaded(Exception):
+    """
+    The call was not made: queue full, wait deadline passed or circuit open.
+    """
+
+
+class CircuitOpen(Overloaded):
+    pass
+
+
+def healthy_status(status_code):
+    # 4xx other than 429 are our own request errors, not Gemini failing
+    return status_code < 500 and status_code != 429
+
+
+class CircuitBreaker:
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, window=BREAKER_WINDOW, min_calls=BREAKER_MIN_CALLS,
+                 error_rate=BREAKER_ERROR_RATE, cooldown=BREAKER_COOLDOWN):
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._outcomes = deque(maxlen=window)
+        self.state = self.CLOSED
+        self._opened_at = 0.0
+        self._trial = False
+        self.opened = 0
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.cooldown:
+                    return False
+                self.state = self.HALF_OPEN
+                self._trial = False
+
+            if self.state == self.HALF_OPEN:
+                if self._trial:
+                    return False
+                self._trial = True
+            return True
+
+    def record(self, ok):
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                if ok:
+                    print("✅ LLM circuit closed")
+                    self.state = self.CLOSED
+                    self._outcomes.clear()
+                else:
+                    self._open()
+                return
+
+            self._outcomes.append(ok)
+            failures = self._outcomes.count(False)
+            if (
+                self.state == self.CLOSED
+                and len(self._outcomes) >= self.min_calls
+                and failures / len(self._outcomes) >= self.error_rate
+            ):
+                self._open()
+
+    def _open(self):
+        print(f"⛔ LLM circuit open for {self.cooldown:.0f}s")
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._trial = False
+        self._outcomes.clear()
+        self.opened += 1
+
+    def stats(self):
+        with self._lock:
+            n = len(self._outcomes)
+            retry_in = 0
+            if self.state == self.OPEN:
+                retry_in = max(0, self.cooldown - (time.monotonic() - self._opened_at))
+            return {
+                "state": self.state,
+                "error_rate": round(self._outcomes.count(False) / n, 3) if n else 0,
+                "window_calls": n,
+                "times_opened": self.opened,
+                "retry_in_seconds": round(retry_in, 1),
+            }
+
+
+class _Admission:
+
+    def __init__(self):
+        self.ok = True
+
+    def check(self, response):
+        self.ok = healthy_status(response.status_code)
+        return response
+
+
+class LLMGuard:
+
+    def __init__(self, max_inflight=MAX_INFLIGHT, queue_size=QUEUE_SIZE, queue_timeout=QUEUE_TIMEOUT):
+        self.max_inflight = max_inflight
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.breaker = CircuitBreaker()
+
+        self._cond = threading.Condition()
+        self.inflight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = {"circuit_open": 0, "queue_full": 0, "wait_timeout": 0}
+        self._wait_total = 0.0
+
+    def _reject(self, reason, message):
+        self.rejected[reason] += 1
+        print(f"⚠️ LLM call rejected ({reason})")
+        if reason == "circuit_open":
+            raise CircuitOpen(message)
+        raise Overloaded(message)
+
+    def _acquire(self):
+        started = time.monotonic()
+        deadline = started + self.queue_timeout
+
+        with self._cond:
+            if self.inflight >= self.max_inflight and self.waiting >= self.queue_size:
+                self._reject("queue_full", "LLM wait queue is full")
+
+            self.waiting += 1
+            try:
+                while self.inflight >= self.max_inflight:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._reject("wait_timeout", "Timed out waiting for an LLM slot")
+                    self._cond.wait(remaining)
+            finally:
+                self.waiting -= 1
+
+            self.inflight += 1
+            self.admitted += 1
+            self._wait_total += time.monotonic() - started
+
+    def _release(self):
+        with self._cond:
+            self.inflight -= 1
+            self._cond.notify()
+
+    @contextmanager
+    def admit(self):
+        """
+        Holds one LLM slot for the body of the with-block. The body passes
+        the Gemini response to call.check(); exceptions count as failures.
+        """
+        if not self.breaker.allow():
+            with self._cond:
+                self._reject("circuit_open", "LLM circuit breaker is open")
+
+        call = _Admission()
+        try:
+            self._acquire()
+        except Overloaded:
+            # A half-open trial that never ran must not wedge the breaker
+            if self.breaker.state == CircuitBreaker.HALF_OPEN:
+                self.breaker.record(False)
+            raise
+
+        try:
+            yield call
+        except Exception:
+            call.ok = False
+            raise
+        finally:
+            self._release()
+            self.breaker.record(call.ok)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "inflight": self.inflight,
+                "queue_depth": self.waiting,
+                "max_inflight": self.max_inflight,
+                "queue_size": self.queue_size,
+                "queue_timeout_seconds": self.queue_timeout,
+                "admitted": self.admitted,
+                "rejected": dict(self.rejected),
+                "avg_wait_ms": round(self._wait_total / self.admitted * 1000, 1) if self.admitted else 0,
+                "breaker": self.breaker.stats(),
+            }
+
+
+LLM_GUARD = LLMGuard()
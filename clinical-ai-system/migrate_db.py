@@ -10,6 +10,7 @@ CREATE TABLE IF NOT EXISTS webhook_subscribers (
     target_url TEXT NOT NULL,
     secret TEXT NOT NULL,
     active INTEGER DEFAULT 1,
+    batch_events INTEGER DEFAULT 0,
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP
 )
 """)
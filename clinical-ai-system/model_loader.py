@@ -0,0 +1,102 @@
+import os
+import gc
+import time
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+# ---------------- LAZY MODELS ----------------
+# Importing rag_engine used to load SentenceTransformer (and with it torch)
+# at import time, and followup_service did the same for Whisper, so every
+# start, the start.py launcher and one-off scripts paid seconds and
+# hundreds of MB before doing anything. Models are now LazyModel handles
+# that load on first use; cached embeddings never need the model at all.
+#
+# Handles are shared per name, so a model loaded once stays loaded for the
+# whole process, and for processes forked from it. That is the preload
+# mode: with PRELOAD_MODELS=1, gunicorn.conf.py calls preload() in the
+# gunicorn master, and every worker (and its Whisper pool processes) uses
+# the same weights copy-on-write instead of loading its own copy.
+
+EMBED_MODEL = os.getenv("RAG_EMBED_MODEL", "all-MiniLM-L6-v2")
+PRELOAD_MODELS = os.getenv("PRELOAD_MODELS", "0") == "1"
+PRELOAD_WHISPER = os.getenv("PRELOAD_WHISPER", "1") == "1"
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+class LazyModel:
+
+    def __init__(self, name, load):
+        self.name = name
+        self._load = load
+        self._model = None
+        self._lock = threading.Lock()
+        self.load_seconds = None
+
+    @property
+    def loaded(self):
+        return self._model is not None
+
+    def get(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    started = time.perf_counter()
+                    model = self._load()
+                    self.load_seconds = time.perf_counter() - started
+                    self._model = model
+                    print(f"🧠 {self.name} loaded in {self.load_seconds:.1f}s (pid {os.getpid()})")
+        return self._model
+
+    def __getattr__(self, attr):
+        # model.encode(...) etc. load on first call
+        return getattr(self.get(), attr)
+
+
+def _shared(key, name, load):
+    with _registry_lock:
+        if key not in _registry:
+            _registry[key] = LazyModel(name, load)
+        return _registry[key]
+
+
+def embedder(name=EMBED_MODEL):
+    def load():
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(name)
+    return _shared(("embedder", name), name, load)
+
+
+def whisper_model(config):
+    from whisper_backend import describe, load_backend
+    return _shared(("whisper",) + tuple(sorted(config.items())), describe(config), lambda: load_backend(config))
+
+
+def preload(whisper=PRELOAD_WHISPER, workers=None):
+    """
+    Loads the models now, e.g. in a parent process before it forks.
+    """
+    embedder().get()
+    if whisper:
+        from transcriber import TRANSCRIBE_WORKERS
+        from whisper_backend import backend_config
+        whisper_model(backend_config(workers or TRANSCRIBE_WORKERS)).get()
+    # Keep the garbage collector from touching (and so un-sharing) the
+    # pages of everything loaded so far
+    gc.freeze()
+
+
+def model_stats():
+    with _registry_lock:
+        models = list(_registry.values())
+    return {
+        "preload": PRELOAD_MODELS,
+        "models": {
+            m.name: {"loaded": m.loaded, "load_seconds": round(m.load_seconds, 2) if m.load_seconds else None}
+            for m in models
+        },
+    }
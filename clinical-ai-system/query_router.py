@@ -0,0 +1,361 @@
+import re
+import threading
+from collections import Counter
+from db import get_db
+from rag_snapshot import SNAPSHOT
+
+
+# ---------------- SQL FAST PATH ----------------
+# Many admin-search questions are plain aggregates ("how many high risk
+# sessions this week", "average anxiety", "list Dr Sanjeev Kumar's
+# patients"). Those are answered straight from SQLite in the same
+# report-style prose the RAG prompt asks Gemini for; anything the router
+# does not recognise with confidence returns None and goes through the
+# normal RAG path.
+#
+# "With confidence" means every word of the question is accounted for:
+# either it is in VOCABULARY or it belongs to a patient / doctor named in
+# full. A first name alone ("Vidushi"), an unknown doctor ("Dr Sanjeev")
+# or a qualifier the SQL cannot express ("mention insomnia", "reported
+# suicidal thoughts", "since March") leaves a word over and falls through,
+# rather than being answered as if it were a clinic-wide total.
+
+_PUNCT = re.compile(r"[^\w\s@.]")
+
+# Open-ended questions always go to the model
+_OPEN_ENDED = re.compile(
+    r"\b(why|explain|trend|trends|pattern|patterns|summar\w*|describe|compare|recommend\w*|"
+    r"improv\w*|worse\w*|should|insight\w*)\b"
+)
+
+_LIST_PATIENTS = re.compile(r"\b(list|show|which|who are|who is|name)\b.*\bpatients?\b|\bpatients? (of|assigned to|under)\b")
+_RISK = re.compile(r"\b(high|medium|moderate|low) ?risk\b")
+_HOW_MANY = re.compile(r"\b(how many|number of|count of|total)\b")
+_AVERAGE = re.compile(r"\b(average|avg|mean)\b")
+_SESSIONS = re.compile(r"\bsessions?\b")
+_PATIENTS = re.compile(r"\bpatients?\b")
+_DOCTORS = re.compile(r"\bdoctors?\b")
+_EMAILS = re.compile(r"\b(emails?|follow ?ups?)\b")
+
+SCORES = {
+    "anxiety": ("anxiety", "anxiety"),
+    "burnout": ("burnout_risk", "burnout risk"),
+    "depression": ("depression_risk", "depression risk"),
+    "self harm": ("self_harm_risk", "self harm risk"),
+}
+
+WINDOWS = [
+    (re.compile(r"\btoday\b"), "date({col}) = date('now')", "today"),
+    (re.compile(r"\b(this|past|last) week\b|\blast 7 days\b"), "{col} >= datetime('now', '-7 days')", "in the past seven days"),
+    (re.compile(r"\b(this|past|last) month\b|\blast 30 days\b"), "{col} >= datetime('now', '-30 days')", "in the past thirty days"),
+    (re.compile(r"\b(this|past|last) year\b"), "{col} >= datetime('now', '-365 days')", "in the past year"),
+]
+
+# Words the intents above understand; anything else must be part of a
+# resolved name or email
+VOCABULARY = set("""
+    a an the of to in for by at on is are was were be been has have had do does did
+    there what whats which who name names list show me all our my so far overall currently
+    how many number count total average avg mean score scores level levels
+    session sessions patient patients doctor doctors dr email emails sent
+    follow up ups followup followups assigned under registered recorded clinic s
+    high medium moderate low risk anxiety burnout depression self harm
+    today this past last week month year days 7 30
+""".split())
+
+# Only valid next to a doctor the question names in full
+_TITLES = {"dr", "doctor"}
+
+
+def _normalize(question):
+    return " ".join(_PUNCT.sub(" ", question.lower().replace("-", " ")).split())
+
+
+def _plural(n, word):
+    return f"{n} {word}" if n == 1 else f"{n} {word}s"
+
+
+class QueryRouter:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = Counter()
+
+    def _record(self, intent):
+        with self._lock:
+            self.counts[intent] += 1
+
+    def stats(self):
+        with self._lock:
+            routed = sum(v for k, v in self.counts.items() if k != "rag")
+            total = routed + self.counts["rag"]
+            return {
+                "routed": routed,
+                "fallthrough": self.counts["rag"],
+                "hit_rate": round(routed / total, 3) if total else 0,
+                "by_intent": dict(self.counts),
+            }
+
+    def route(self, question, filters=None):
+        """
+        Returns a finished answer for aggregate questions, else None.
+        """
+        filters = filters or {}
+        if any(filters.get(k) for k in ("type", "from", "to")):
+            self._record("rag")
+            return None
+
+        q = _normalize(question)
+        answer, intent = None, None
+
+        if not _OPEN_ENDED.search(q):
+            try:
+                answer, intent = self._answer(q, question, filters)
+            except Exception as e:
+                print("QUERY ROUTER ERROR:", e)
+                answer = None
+
+        self._record(intent if answer else "rag")
+        return answer
+
+    # ---- intent handlers ----
+
+    def _scope(self, question, filters):
+        """
+        (patient_ids, doctor_ids) to answer for, or None when the question
+        names someone outside the request's filters.
+        """
+        mentioned = SNAPSHOT.mentioned(question)
+        patient_ids = {int(filters["patient_id"])} if filters.get("patient_id") else set()
+        doctor_ids = {int(filters["doctor_id"])} if filters.get("doctor_id") else set()
+        if not patient_ids and not doctor_ids:
+            return mentioned
+        if not mentioned[0] <= patient_ids or not mentioned[1] <= doctor_ids:
+            return None
+        return patient_ids, doctor_ids
+
+    def _unexplained(self, cur, q, patient_ids, doctor_ids):
+        """
+        Words of the question that are neither VOCABULARY nor part of a
+        named patient's or doctor's name / email.
+        """
+        known = set(VOCABULARY)
+        if not doctor_ids:
+            known -= _TITLES
+        for table, key, ids in (("patients", "patient_id", patient_ids), ("doctors", "doctor_id", doctor_ids)):
+            if ids:
+                cur.execute(
+                    f"SELECT name, email FROM {table} WHERE {key} IN ({','.join('?' * len(ids))})",
+                    sorted(ids)
+                )
+                for r in cur.fetchall():
+                    known.update(_normalize(r["name"] or "").split())
+                    known.add((r["email"] or "").lower())
+        words = {w.strip(".") for w in q.split()}
+        return {w for w in words if w and w not in known}
+
+    def _answer(self, q, question, filters):
+        scope = self._scope(question, filters)
+        if scope is None:
+            return None, None
+        patient_ids, doctor_ids = scope
+        named_patients = bool(patient_ids)
+
+        window_sql, window_text = None, ""
+        for pattern, sql, text in WINDOWS:
+            if pattern.search(q):
+                window_sql, window_text = sql, text
+                break
+
+        risk = _RISK.search(q)
+        scores = [v for k, v in SCORES.items() if k in q]
+
+        db = get_db()
+        cur = db.cursor()
+        try:
+            if self._unexplained(cur, q, patient_ids, doctor_ids):
+                return None, None
+
+            # A risk level or score is only honoured by the intent that
+            # filters on it; anywhere else it would be silently dropped
+            plain = not risk and not scores
+
+            if doctor_ids and not _HOW_MANY.search(q) and _LIST_PATIENTS.search(q) and plain and not window_sql:
+                return self._doctor_patients(cur, doctor_ids), "doctor_patients"
+
+            # Doctor named in a count/average question: scope to their caseload
+            if doctor_ids:
+                scope = f"for patients of {self._doctor_names(cur, doctor_ids)}"
+                patient_ids = patient_ids | SNAPSHOT.caseload(doctor_ids) or {-1}
+            else:
+                scope = self._scope_text(cur, patient_ids)
+
+            if risk and not scores and _HOW_MANY.search(q):
+                level = "MEDIUM" if risk.group(1) in ("medium", "moderate") else risk.group(1).upper()
+                return self._risk_count(cur, level, _PATIENTS.search(q) and not _SESSIONS.search(q),
+                                        patient_ids, scope, window_sql, window_text), "risk_count"
+
+            if _AVERAGE.search(q) and scores and not risk:
+                return self._averages(cur, scores, patient_ids, scope, window_sql, window_text), "average_score"
+
+            if not plain:
+                return None, None
+
+            if _HOW_MANY.search(q) and _EMAILS.search(q):
+                return self._email_count(cur, patient_ids, scope, window_sql, window_text), "email_count"
+
+            if _HOW_MANY.search(q) and _SESSIONS.search(q):
+                return self._session_count(cur, patient_ids, scope, window_sql, window_text), "session_count"
+
+            if _HOW_MANY.search(q) and _PATIENTS.search(q) and not window_sql and not named_patients:
+                return self._patient_count(cur, doctor_ids), "patient_count"
+
+            if _HOW_MANY.search(q) and _DOCTORS.search(q) and not window_sql and not patient_ids and not doctor_ids:
+                return self._doctor_count(cur), "doctor_count"
+
+            return None, None
+        finally:
+            db.close()
+
+    def _where(self, patient_ids, window_sql):
+        conditions, params = [], []
+        if patient_ids:
+            conditions.append(f"patient_id IN ({','.join('?' * len(patient_ids))})")
+            params.extend(sorted(patient_ids))
+        if window_sql:
+            conditions.append(window_sql.format(col="created_at"))
+        return (" WHERE " + " AND ".join(conditions) if conditions else ""), params
+
+    def _scope_text(self, cur, patient_ids):
+        if not patient_ids:
+            return "across the clinic"
+        cur.execute(
+            f"SELECT name FROM patients WHERE patient_id IN ({','.join('?' * len(patient_ids))}) ORDER BY name",
+            sorted(patient_ids)
+        )
+        names = [r["name"] for r in cur.fetchall()]
+        if len(names) == 1:
+            return f"for {names[0]}"
+        if len(names) <= 5:
+            return "for " + ", ".join(names[:-1]) + f" and {names[-1]}"
+        return f"for the {len(names)} selected patients"
+
+    def _period(self, window_text):
+        return f" {window_text}" if window_text else " to date"
+
+    def _session_count(self, cur, patient_ids, scope, window_sql, window_text):
+        where, params = self._where(patient_ids, window_sql)
+        cur.execute(f"SELECT COUNT(*) FROM clinical_sessions{where}", params)
+        n = cur.fetchone()[0]
+        return (
+            f"{_plural(n, 'clinical session').capitalize()} "
+            f"{'has' if n == 1 else 'have'} been recorded {scope}"
+            f"{self._period(window_text)}."
+        )
+
+    def _risk_count(self, cur, level, by_patient, patient_ids, scope, window_sql, window_text):
+        where, params = self._where(patient_ids, window_sql)
+        where += (" AND " if where else " WHERE ") + "recipient_type = ?"
+        params.append(level)
+
+        if by_patient:
+            cur.execute(f"SELECT COUNT(DISTINCT patient_id) FROM email_logs{where}", params)
+            n = cur.fetchone()[0]
+            return (
+                f"{_plural(n, 'patient').capitalize()} {'has' if n == 1 else 'have'} at least one session "
+                f"assessed as {level.lower()} risk {scope}{self._period(window_text)}."
+            )
+
+        cur.execute(f"SELECT COUNT(*) FROM email_logs{where}", params)
+        n = cur.fetchone()[0]
+        return (
+            f"{_plural(n, 'session').capitalize()} {'was' if n == 1 else 'were'} assessed as "
+            f"{level.lower()} risk {scope}{self._period(window_text)}."
+        )
+
+    def _averages(self, cur, scores, patient_ids, scope, window_sql, window_text):
+        where, params = self._where(patient_ids, window_sql)
+        cols = ", ".join(f"AVG({col}), COUNT({col})" for col, _ in scores)
+        cur.execute(f"SELECT {cols} FROM email_logs{where}", params)
+        row = cur.fetchone()
+
+        parts = []
+        for i, (_, label) in enumerate(scores):
+            avg, n = row[2 * i], row[2 * i + 1]
+            if not n:
+                parts.append(f"no {label} scores are documented")
+            else:
+                parts.append(f"the average {label} score is {round(avg, 2)} out of 10 across {_plural(n, 'session')}")
+
+        text = " and ".join(parts)
+        return f"{scope[0].upper() + scope[1:]}{self._period(window_text)}, {text}."
+
+    def _email_count(self, cur, patient_ids, scope, window_sql, window_text):
+        where, params = self._where(patient_ids, window_sql)
+        cur.execute(f"""
+            SELECT
+                COUNT(*),
+                SUM(CASE WHEN recipient_type='HIGH' THEN 1 ELSE 0 END)
+            FROM email_logs{where}
+        """, params)
+        n, doctor = cur.fetchone()
+        doctor = doctor or 0
+        return (
+            f"{_plural(n, 'follow-up email').capitalize()} {'has' if n == 1 else 'have'} been sent "
+            f"{scope}{self._period(window_text)}, of which {doctor} "
+            f"{'was' if doctor == 1 else 'were'} escalated to the assigned doctor because of high risk."
+        )
+
+    def _patient_count(self, cur, doctor_ids):
+        if doctor_ids:
+            cur.execute(
+                f"SELECT COUNT(*) FROM patients WHERE assigned_doctor IN ({','.join('?' * len(doctor_ids))})",
+                sorted(doctor_ids)
+            )
+            n = cur.fetchone()[0]
+            return f"{_plural(n, 'patient').capitalize()} {'is' if n == 1 else 'are'} assigned to {self._doctor_names(cur, doctor_ids)}."
+
+        cur.execute("SELECT COUNT(*) FROM patients")
+        n = cur.fetchone()[0]
+        return f"The clinic currently has {_plural(n, 'registered patient')}."
+
+    def _doctor_count(self, cur):
+        cur.execute("SELECT COUNT(*) FROM doctors")
+        n = cur.fetchone()[0]
+        return f"The clinic currently has {_plural(n, 'registered doctor')}."
+
+    def _doctor_names(self, cur, doctor_ids):
+        cur.execute(
+            f"SELECT name FROM doctors WHERE doctor_id IN ({','.join('?' * len(doctor_ids))}) ORDER BY name",
+            sorted(doctor_ids)
+        )
+        names = [r["name"] for r in cur.fetchall()]
+        return " and ".join(names) if names else "the selected doctor"
+
+    def _doctor_patients(self, cur, doctor_ids):
+        cur.execute(f"""
+            SELECT p.name, p.email, COUNT(c.session_id) AS sessions
+            FROM patients p
+            LEFT JOIN clinical_sessions c ON c.patient_id = p.patient_id
+            WHERE p.assigned_doctor IN ({','.join('?' * len(doctor_ids))})
+            GROUP BY p.patient_id
+            ORDER BY p.name
+        """, sorted(doctor_ids))
+        rows = cur.fetchall()
+        doctors = self._doctor_names(cur, doctor_ids)
+
+        if not rows:
+            return f"No patients are currently assigned to {doctors}."
+
+        listed = "; ".join(
+            f"{r['name']} ({r['email']}), with {_plural(r['sessions'], 'recorded session')}"
+            for r in rows
+        )
+        return f"{doctors} currently {'has' if len(doctor_ids) == 1 else 'have'} {_plural(len(rows), 'assigned patient')}: {listed}."
+
+
+ROUTER = QueryRouter()
+
+
+def route_query(question, filters=None):
+    return ROUTER.route(question, filters)
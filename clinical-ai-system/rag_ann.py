@@ -0,0 +1,187 @@
+import os
+import math
+import faiss
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+# ---------------- INDEX TYPES ----------------
+# RAG_INDEX_TYPE picks the FAISS structure used by build_rag_index:
+#   flat      exact brute-force scan (IndexFlatL2)
+#   ivf_flat  inverted lists over k-means cells, exact vectors
+#   ivf_pq    inverted lists with product-quantized vectors (smallest memory)
+#   hnsw      graph index, fast queries but no in-place deletes
+#   auto      flat for small corpora, IVF once the corpus grows (default)
+# Training and parameters (nlist, nprobe, PQ size, HNSW M/efSearch) are
+# derived from the corpus size; RAG_IVF_NPROBE, RAG_PQ_M, RAG_HNSW_M and
+# RAG_HNSW_EF override them.
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+INDEX_TYPE = os.getenv("RAG_INDEX_TYPE", "auto").lower()
+
+FLAT_LIMIT = int(os.getenv("RAG_FLAT_LIMIT", "20000"))
+IVF_FLAT_LIMIT = int(os.getenv("RAG_IVF_FLAT_LIMIT", "500000"))
+
+NPROBE = os.getenv("RAG_IVF_NPROBE")
+PQ_M = os.getenv("RAG_PQ_M")
+HNSW_M = int(os.getenv("RAG_HNSW_M", "32"))
+HNSW_EF_SEARCH = int(os.getenv("RAG_HNSW_EF", "64"))
+
+# FAISS k-means wants ~39 training points per centroid
+MIN_POINTS_PER_CELL = 39
+
+
+def choose_index_type(n, requested=None):
+    kind = (requested or INDEX_TYPE).lower()
+    if kind in INDEX_TYPES:
+        return kind
+    if n < FLAT_LIMIT:
+        return "flat"
+    if n < IVF_FLAT_LIMIT:
+        return "ivf_flat"
+    return "ivf_pq"
+
+
+def ivf_nlist(n):
+    nlist = int(4 * math.sqrt(n))
+    return max(1, min(nlist, n // MIN_POINTS_PER_CELL))
+
+
+def ivf_nprobe(nlist):
+    if NPROBE:
+        return min(nlist, int(NPROBE))
+    return min(nlist, max(8, nlist // 16))
+
+
+def pq_params(dim, n):
+    if PQ_M and dim % int(PQ_M) == 0:
+        m = int(PQ_M)
+    else:
+        # Sub-quantizers of at least 8 dimensions each (48 for MiniLM's 384)
+        m = next((m for m in (64, 48, 32, 24, 16, 12, 8, 4, 2) if dim % m == 0 and dim // m >= 8), 1)
+    # 2^nbits centroids per sub-quantizer need enough training points
+    nbits = max(4, min(8, int(math.log2(max(2, n // MIN_POINTS_PER_CELL)))))
+    return m, nbits
+
+
+def index_kind(index):
+    base = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+    if isinstance(base, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(base, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(base, faiss.IndexIVF):
+        return "ivf_flat"
+    return "flat"
+
+
+def train_sample_size(n, kind):
+    if kind not in ("ivf_flat", "ivf_pq"):
+        return 0
+    need = 2 * MIN_POINTS_PER_CELL * ivf_nlist(n)
+    if kind == "ivf_pq":
+        need = max(need, MIN_POINTS_PER_CELL * 256)
+    return min(n, need)
+
+
+class IndexBuilder:
+    """
+    Builds an index from vectors that arrive in batches. IVF types buffer
+    only their training sample; every other batch goes straight into the
+    index, so memory does not grow with the corpus.
+    """
+
+    def __init__(self, n, kind=None):
+        self.n = n
+        self.kind = choose_index_type(n, kind)
+
+        # Too few points to train cells, fall back to exact search
+        if self.kind in ("ivf_flat", "ivf_pq") and n < 2 * MIN_POINTS_PER_CELL:
+            self.kind = "flat"
+
+        self.index = None
+        self.sample = train_sample_size(n, self.kind)
+        self._pending = []
+        self._pending_count = 0
+
+    def _create(self, dim):
+        if self.kind == "flat":
+            return faiss.IndexIDMap2(faiss.IndexFlatL2(dim))
+
+        if self.kind == "hnsw":
+            hnsw = faiss.IndexHNSWFlat(dim, HNSW_M)
+            hnsw.hnsw.efConstruction = max(40, 2 * HNSW_M)
+            hnsw.hnsw.efSearch = HNSW_EF_SEARCH
+            return faiss.IndexIDMap2(hnsw)
+
+        nlist = ivf_nlist(self.n)
+        quantizer = faiss.IndexFlatL2(dim)
+        if self.kind == "ivf_pq":
+            m, nbits = pq_params(dim, self.n)
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, m, nbits)
+        else:
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist)
+        index.nprobe = ivf_nprobe(nlist)
+        return index
+
+    def _flush(self):
+        vectors = np.vstack([v for v, _ in self._pending])
+        ids = np.concatenate([i for _, i in self._pending])
+        self._pending, self._pending_count = [], 0
+
+        if not self.index.is_trained:
+            self.index.train(vectors)
+        self.index.add_with_ids(vectors, ids)
+
+    def add(self, vectors, ids):
+        vectors = np.ascontiguousarray(vectors, dtype="float32")
+        ids = np.asarray(ids, dtype="int64")
+
+        if self.index is None:
+            self.index = self._create(vectors.shape[1])
+
+        if self.index.is_trained:
+            self.index.add_with_ids(vectors, ids)
+            return
+
+        self._pending.append((vectors, ids))
+        self._pending_count += len(ids)
+        if self._pending_count >= self.sample:
+            self._flush()
+
+    def finish(self):
+        if self._pending:
+            self._flush()
+        return self.index
+
+
+def build_index(vectors, ids, kind=None):
+    """
+    Builds, trains and fills an index for the given vectors/ids. Every
+    returned index accepts add_with_ids() with our stable document ids.
+    """
+    builder = IndexBuilder(len(vectors), kind)
+    builder.add(vectors, ids)
+    return builder.finish()
+
+
+def supports_remove(index):
+    return index_kind(index) != "hnsw"
+
+
+def needs_rebuild(index):
+    """
+    True once the corpus has outgrown the structure it was built with:
+    a flat index past the flat limit under auto mode, or IVF cells that
+    are now far too coarse for the number of vectors.
+    """
+    n = index.ntotal
+    kind = index_kind(index)
+
+    if kind == "flat" and INDEX_TYPE not in INDEX_TYPES and choose_index_type(n) != "flat":
+        return True
+    if kind in ("ivf_flat", "ivf_pq"):
+        return ivf_nlist(n) > 4 * faiss.extract_index_ivf(index).nlist
+    return False
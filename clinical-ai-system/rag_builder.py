@@ -1,4 +1,6 @@
 from rag_engine import build_rag_index
 
 build_rag_index()
-#Run this whenever new sessions are added.
\ No newline at end of file
+# Full rebuild. The service keeps the index current incrementally
+# (rag_engine.refresh_rag_documents); run this after bulk imports or
+# manual database edits.
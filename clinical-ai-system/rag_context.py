@@ -0,0 +1,143 @@
+import os
+import re
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+# ---------------- CONTEXT ASSEMBLY ----------------
+# Picks which retrieved documents and snapshot lines go into the Gemini
+# prompt. Retrieved hits are deduplicated, reranked with maximal marginal
+# relevance (relevant to the question but not repeating each other) and
+# added until the token budget is used up.
+
+CONTEXT_TOKENS = int(os.getenv("RAG_CONTEXT_TOKENS", "1500"))
+SNAPSHOT_SHARE = float(os.getenv("RAG_SNAPSHOT_SHARE", "0.4"))
+MMR_LAMBDA = float(os.getenv("RAG_MMR_LAMBDA", "0.7"))
+DUPLICATE_SIMILARITY = 0.97
+
+_SPACES = re.compile(r"\s+")
+
+
+def estimate_tokens(text):
+    # Gemini averages roughly four characters per token for English text
+    return max(1, (len(text) + 3) // 4)
+
+
+def _normalize(text):
+    return _SPACES.sub(" ", text.strip().lower())
+
+
+def _unit(vectors):
+    vectors = np.asarray(vectors, dtype="float32")
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+def mmr_order(query_vec, doc_vecs, lambda_=MMR_LAMBDA, relevance=None):
+    """
+    Returns document positions in maximal-marginal-relevance order.
+    relevance overrides the query/document cosine (e.g. fused rank scores).
+    """
+    if len(doc_vecs) == 0:
+        return []
+
+    q = _unit(query_vec).reshape(-1)
+    d = _unit(doc_vecs)
+
+    if relevance is None:
+        relevance = d @ q
+    else:
+        relevance = np.asarray(relevance, dtype="float32")
+        relevance = relevance / (relevance.max() or 1)
+    pairwise = d @ d.T
+
+    order = []
+    redundancy = np.full(len(d), -np.inf)
+    remaining = np.ones(len(d), dtype=bool)
+
+    for _ in range(len(d)):
+        if order:
+            redundancy = np.maximum(redundancy, pairwise[order[-1]])
+            score = lambda_ * relevance - (1 - lambda_) * redundancy
+        else:
+            score = relevance.copy()
+
+        score[~remaining] = -np.inf
+        best = int(np.argmax(score))
+        order.append(best)
+        remaining[best] = False
+
+    return order
+
+
+def _take(lines, budget):
+    picked, used = [], 0
+    for line in lines:
+        cost = estimate_tokens(line)
+        if used + cost > budget:
+            continue
+        picked.append(line)
+        used += cost
+    return picked, used
+
+
+def build_context(query_vec, docs, doc_vecs, snapshot_lines, budget=CONTEXT_TOKENS, relevance=None):
+    """
+    Returns (context_text, usage). usage reports the tokens spent on
+    retrieved documents and on the snapshot, plus how many hits were
+    dropped as duplicates or for lack of budget.
+    """
+    # Exact duplicates (after whitespace/case folding) first
+    seen = set()
+    keep = []
+    for i, text in enumerate(docs):
+        key = _normalize(text)
+        if key not in seen:
+            seen.add(key)
+            keep.append(i)
+
+    duplicates = len(docs) - len(keep)
+    docs = [docs[i] for i in keep]
+    doc_vecs = np.asarray(doc_vecs, dtype="float32")[keep]
+    if relevance is not None:
+        relevance = [relevance[i] for i in keep]
+
+    snapshot, snapshot_tokens = _take(snapshot_lines, int(budget * SNAPSHOT_SHARE))
+    remaining = budget - snapshot_tokens
+
+    retrieved = []
+    retrieved_tokens = 0
+    chosen = []
+    over_budget = 0
+    unit = _unit(doc_vecs) if docs else doc_vecs
+
+    for pos in mmr_order(query_vec, doc_vecs, relevance=relevance):
+        # Near-identical texts (e.g. RISK_LOG lines with the same scores)
+        if chosen and float(np.max(unit[chosen] @ unit[pos])) >= DUPLICATE_SIMILARITY:
+            duplicates += 1
+            continue
+
+        cost = estimate_tokens(docs[pos])
+        if retrieved_tokens + cost > remaining:
+            over_budget += 1
+            continue
+
+        chosen.append(pos)
+        retrieved.append(docs[pos])
+        retrieved_tokens += cost
+
+    context = "\n".join(retrieved + ["--- DATABASE SNAPSHOT ---"] + snapshot)
+
+    usage = {
+        "budget": budget,
+        "retrieved_tokens": retrieved_tokens,
+        "snapshot_tokens": snapshot_tokens,
+        "total_tokens": estimate_tokens(context),
+        "retrieved_docs": len(retrieved),
+        "duplicates_dropped": duplicates,
+        "over_budget_dropped": over_budget,
+    }
+    return context, usage
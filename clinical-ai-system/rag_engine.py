@@ -1,127 +1,567 @@
-import os, faiss, pickle, numpy as np, requests
-from sentence_transformers import SentenceTransformer
-from db import get_db
-from crypto_utils import decrypt_text
+import os, json, time, atexit, faiss, threading, numpy as np, requests
+from db import get_db, data_version
+from crypto_utils import decrypt_many
+from rag_store import IndexStore
+from answer_cache import AnswerCache, normalize_question
+from query_router import route_query
+from gemini_client import GEMINI
+from llm_guard import LLM_GUARD, Overloaded
+from embedding_cache import EmbeddingCache
+from rag_lexical import LexicalIndex, reciprocal_rank_fusion
+from rag_snapshot import SNAPSHOT, snapshot_context
+from rag_filters import metadata_index, filtered_search
+from rag_context import build_context
+from rag_ann import IndexBuilder, index_kind, supports_remove, needs_rebuild
+from model_loader import EMBED_MODEL, embedder
 from dotenv import load_dotenv
 
 load_dotenv()
 
-API_KEY = os.getenv("GEMINI_API_KEY")
-
-URL = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-3-flash-preview:generateContent?key={API_KEY}"
-
-MODEL = SentenceTransformer("all-MiniLM-L6-v2")
+MODEL_NAME = EMBED_MODEL
+MODEL = embedder(MODEL_NAME)   # loaded on the first cache miss
+EMBEDDINGS = EmbeddingCache()
 IDX_FILE = "rag_index.faiss"
 DOC_FILE = "rag_docs.pkl"
+LEX_FILE = "rag_lexical.pkl"
+
+# Hits fetched from FAISS before deduplication and MMR reranking
+CANDIDATES = int(os.getenv("RAG_CANDIDATES", "30"))
+
+# Rebuild pipeline: rows read per page and documents embedded per batch
+PAGE_SIZE = int(os.getenv("RAG_PAGE_SIZE", "500"))
+EMBED_BATCH = int(os.getenv("RAG_EMBED_BATCH", "256"))
+
+# Seconds incremental updates are served from memory before the files are
+# rewritten; 0 writes on every update
+PUBLISH_DELAY = float(os.getenv("RAG_PUBLISH_DELAY", "2"))
+
+
+# ---------------- DOCUMENT IDS ----------------
+# Every vector carries a stable id derived from its source row, so a single
+# session, patient, doctor or risk log can be re-embedded or removed without
+# touching the rest of the index.
+
+DOC_KINDS = {"session": 1, "patient": 2, "doctor": 3, "risk": 4}
+ID_STRIDE = 10 ** 12
+
+_INDEX_LOCK = threading.RLock()
+
+
+def doc_id(kind, row_id):
+    return DOC_KINDS[kind] * ID_STRIDE + int(row_id)
+
+
+def _placeholders(ids):
+    return ",".join("?" * len(ids))
+
+
+def _doc(kind, text, patient_id=None, doctor_id=None, date=None):
+    return {
+        "type": kind,
+        "text": text,
+        "patient_id": patient_id,
+        "doctor_id": doctor_id,
+        "date": date,
+    }
+
+
+# Source query per kind; the row key comes first so reads can be paged by
+# keyset (key > last seen) instead of loading whole tables.
+DOC_SOURCES = {
+    "session": ("c.session_id", """
+        SELECT c.session_id, c.patient_id, c.short_summary, c.created_at, p.assigned_doctor
+        FROM clinical_sessions c
+        LEFT JOIN patients p ON c.patient_id = p.patient_id
+    """),
+    "patient": ("patient_id", """
+        SELECT patient_id, name, email, assigned_doctor FROM patients
+    """),
+    "doctor": ("doctor_id", """
+        SELECT doctor_id, name, email FROM doctors
+    """),
+    "risk": ("e.log_id", """
+        SELECT e.log_id, e.patient_id, e.created_at, p.assigned_doctor,
+               e.anxiety, e.burnout_risk, e.depression_risk, e.self_harm_risk
+        FROM email_logs e
+        LEFT JOIN patients p ON e.patient_id = p.patient_id
+    """),
+}
+
+
+def _rows(cur, kind, ids=None, after=None, limit=None):
+    key, sql = DOC_SOURCES[kind]
+    conditions, params = [], []
+
+    if ids is not None:
+        conditions.append(f"{key} IN ({_placeholders(ids)})")
+        params.extend(ids)
+    if after is not None:
+        conditions.append(f"{key} > ?")
+        params.append(after)
+
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += f" ORDER BY {key}"
+    if limit:
+        sql += " LIMIT ?"
+        params.append(limit)
+
+    cur.execute(sql, params)
+    return cur.fetchall()
+
+
+def _docs(kind, rows):
+    """
+    Turns one page of source rows into [(doc id, document)].
+    """
+    if kind == "session":
+        # One AES-GCM context for the whole page
+        summaries = decrypt_many([r["short_summary"] for r in rows])
+        return [
+            (doc_id("session", r["session_id"]), _doc(
+                "session", "CLINICAL_SESSION: " + text,
+                r["patient_id"], r["assigned_doctor"], r["created_at"]
+            ))
+            for r, text in zip(rows, summaries)
+        ]
+
+    if kind == "patient":
+        return [
+            (doc_id("patient", r["patient_id"]), _doc(
+                "patient", f"PATIENT: {r['name']} | {r['email']}",
+                r["patient_id"], r["assigned_doctor"]
+            ))
+            for r in rows
+        ]
+
+    if kind == "doctor":
+        return [
+            (doc_id("doctor", r["doctor_id"]), _doc(
+                "doctor", f"DOCTOR: {r['name']} | {r['email']}", doctor_id=r["doctor_id"]
+            ))
+            for r in rows
+        ]
+
+    return [
+        (doc_id("risk", r["log_id"]), _doc(
+            "risk",
+            f"RISK_LOG: Anxiety={r['anxiety']} Burnout={r['burnout_risk']} "
+            f"Depression={r['depression_risk']} SelfHarm={r['self_harm_risk']}",
+            r["patient_id"], r["assigned_doctor"], r["created_at"]
+        ))
+        for r in rows
+    ]
 
 
-# ---------------- BUILD INDEX ----------------
+def _load_docs(cur, kind, ids):
+    return _docs(kind, _rows(cur, kind, ids=ids))
 
-def build_rag_index():
+
+def _iter_doc_pages(page_size=None):
+    """
+    Yields every document as pages of [(doc id, document)], reading each
+    table PAGE_SIZE rows at a time.
+    """
+    page_size = page_size or PAGE_SIZE
     db = get_db()
     cur = db.cursor()
-    documents = []
-
-    cur.execute("SELECT short_summary FROM clinical_sessions")
-    for r in cur.fetchall():
-        try:
-            documents.append("CLINICAL_SESSION: " + decrypt_text(r["short_summary"]))
-        except:
-            pass
-
-    cur.execute("SELECT name,email FROM patients")
-    for r in cur.fetchall():
-        documents.append(f"PATIENT: {r['name']} | {r['email']}")
-
-    cur.execute("SELECT name,email FROM doctors")
-    for r in cur.fetchall():
-        documents.append(f"DOCTOR: {r['name']} | {r['email']}")
-
-    cur.execute("SELECT anxiety,burnout_risk,depression_risk,self_harm_risk FROM email_logs")
-    for r in cur.fetchall():
-        documents.append(
-            f"RISK_LOG: Anxiety={r['anxiety']} Burnout={r['burnout_risk']} "
-            f"Depression={r['depression_risk']} SelfHarm={r['self_harm_risk']}"
-        )
+    try:
+        for kind in DOC_SOURCES:
+            after = None
+            while True:
+                rows = _rows(cur, kind, after=after, limit=page_size)
+                if not rows:
+                    break
+                after = rows[-1][0]
+                yield _docs(kind, rows)
+    finally:
+        db.close()
+
 
+def _count_documents():
+    db = get_db()
+    cur = db.cursor()
+    total = 0
+    for table in ("clinical_sessions", "patients", "doctors", "email_logs"):
+        cur.execute(f"SELECT COUNT(*) FROM {table}")
+        total += cur.fetchone()[0]
     db.close()
+    return total
 
-    if not documents:
-        print("⚠️ No clinical data found to index.")
+
+STORE = IndexStore(IDX_FILE, DOC_FILE, LEX_FILE)
+
+
+def _load_index():
+    """
+    Returns the resident (index, documents, lexical) or (None, None, None)
+    when there is no index yet or it was written in an older format without
+    metadata.
+    """
+    index, documents, lexical = STORE.get()
+    if documents and not isinstance(next(iter(documents.values())), dict):
+        return None, None, None
+    return index, documents, lexical
+
+
+def _save_index(index, documents, lexical):
+    STORE.publish(index, documents, lexical)
+
+
+# ---------------- COALESCED WRITES ----------------
+# Rewriting the index files (FAISS index + two pickles) is O(corpus) and
+# dominated every single-row update: ~420 ms at 100k documents against
+# ~80 ms for the copy-on-write clone below and ~1 ms for the change
+# itself. Incremental updates therefore only swap the served copy and
+# schedule one write PUBLISH_DELAY seconds later, which covers every update
+# made meanwhile. Other processes see the change once it is written; if
+# this one dies first, rag_builder.py rebuilds from the database.
+#
+# The clone stays: searches run without _INDEX_LOCK, so the published
+# index must never be mutated under them.
+
+_persist_timer = None
+_persist_lock = threading.Lock()
+
+
+def _persist():
+    global _persist_timer
+    with _persist_lock:
+        _persist_timer = None
+    try:
+        if STORE.persist():
+            print("💾 RAG index written")
+    except Exception as e:
+        print("RAG PERSIST ERROR:", e)
+
+
+def _swap_index(index, documents, lexical):
+    global _persist_timer
+    if PUBLISH_DELAY <= 0:
+        STORE.publish(index, documents, lexical)
         return
 
-    embeddings = MODEL.encode(documents, show_progress_bar=True)
-    index = faiss.IndexFlatL2(embeddings.shape[1])
-    index.add(np.array(embeddings))
+    STORE.swap(index, documents, lexical)
+    with _persist_lock:
+        if _persist_timer is None:
+            _persist_timer = threading.Timer(PUBLISH_DELAY, _persist)
+            _persist_timer.daemon = True
+            _persist_timer.start()
 
-    faiss.write_index(index, IDX_FILE)
-    pickle.dump(documents, open(DOC_FILE, "wb"))
 
-    print("✅ Clinical RAG vector index built successfully.")
+atexit.register(_persist)
 
 
-# ---------------- QUERY ENGINE ----------------
+# ---------------- BUILD INDEX ----------------
 
-def query_rag(question):
+def _peak_rss_mb():
     try:
-        index = faiss.read_index(IDX_FILE)
-        documents = pickle.load(open(DOC_FILE, "rb"))
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    except ImportError:
+        return 0
+
+
+def _iter_batches(size):
+    """
+    Re-chunks the paged documents into fixed-size embedding batches.
+    """
+    batch = []
+    for page in _iter_doc_pages():
+        for item in page:
+            batch.append(item)
+            if len(batch) >= size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
 
-        q_emb = MODEL.encode([question])
-        k = min(12, len(documents))
-        _, I = index.search(np.array(q_emb), k=k)
 
+def build_rag_index():
+    # Held for the whole build so incremental updates written meanwhile are
+    # not overwritten; with a warm embedding cache this takes seconds
+    with _INDEX_LOCK:
+        started = time.perf_counter()
+        total = _count_documents()
 
+        if not total:
+            print("⚠️ No clinical data found to index.")
+            return
 
-        retrieved_docs = [documents[i] for i in I[0]]
+        # Rows are read a page at a time, decrypted per page, embedded in
+        # fixed batches and added to the index batch by batch: only the
+        # document map itself grows with the corpus
+        builder = IndexBuilder(total)
+        documents = {}
+        lexical = LexicalIndex()
+        misses = EMBEDDINGS.misses
 
-# ===== ADD LIVE DATABASE SNAPSHOT =====
-        db = get_db()
-        cur = db.cursor()
+        for batch in _iter_batches(EMBED_BATCH):
+            ids = np.array([i for i, _ in batch], dtype="int64")
+            embeddings = EMBEDDINGS.encode(MODEL_NAME, MODEL, [d["text"] for _, d in batch])
+            builder.add(embeddings, ids)
 
-        cur.execute("SELECT name,email FROM patients")
-        patients = [
-        f"Patient: {r['name']} Email: {r['email']}"
-        for r in cur.fetchall()
-]
+            for i, d in batch:
+                documents[i] = d
+                lexical.add(i, d["text"])
 
-        cur.execute("SELECT name,email FROM doctors")
-        doctors = [
-        f"Doctor: {r['name']} Email: {r['email']}"
-        for r in cur.fetchall()
-]
+        if not documents:
+            print("⚠️ No clinical data found to index.")
+            return
 
-        cur.execute("""
-        SELECT anxiety,burnout_risk,depression_risk,self_harm_risk
-        FROM email_logs
-        ORDER BY created_at DESC
-        LIMIT 5
-""")
-        risks = [
-    f"Risk Log: Anxiety {r['anxiety']} Burnout {r['burnout_risk']} "
-    f"Depression {r['depression_risk']} Self Harm {r['self_harm_risk']}"
-    for r in cur.fetchall()
-]
+        index = builder.finish()
 
-        db.close()
+        _save_index(index, documents, lexical)
+        _set_active_model(MODEL_NAME, MODEL)
+
+    elapsed = time.perf_counter() - started
+    print(f"✅ Clinical RAG vector index built successfully ({index_kind(index)}, {index.ntotal} vectors).")
+    print(f"   {len(documents) / elapsed:.0f} docs/s in {elapsed:.1f}s, "
+          f"{EMBEDDINGS.misses - misses} embedded, the rest from cache, "
+          f"peak RSS {_peak_rss_mb():.0f} MB")
+
+
+# ---------------- EMBEDDING MODEL ----------------
+# The index must be queried with the model that embedded it. After
+# RAG_EMBED_MODEL changes, the old model keeps serving queries while the
+# new one re-embeds every document into the cache in the background; the
+# final rebuild is then all cache hits and switches over in one publish.
+
+_active_model = (MODEL_NAME, MODEL)
+
+
+def _set_active_model(name, model):
+    global _active_model
+    _active_model = (name, model)
+    if EMBEDDINGS.get_meta("index_model") != name:
+        EMBEDDINGS.set_meta("index_model", name)
+
+
+def _embed(texts):
+    name, model = _active_model
+    return EMBEDDINGS.encode(name, model, texts)
+
+
+def _switch_model():
+    _, documents, _ = _load_index()
+    texts = [d["text"] for d in (documents or {}).values()]
+
+    for start in range(0, len(texts), 512):
+        EMBEDDINGS.encode(MODEL_NAME, MODEL, texts[start:start + 512])
+        time.sleep(0)   # let request greenlets run between batches
+
+    build_rag_index()
+    removed = EMBEDDINGS.prune(MODEL_NAME)
+    print(f"✅ Embedding model switched to {MODEL_NAME} ({removed} old vectors pruned)")
+
+
+def start_model_switch():
+    """
+    Starts the background re-embedding if RAG_EMBED_MODEL changed since the
+    index was built. Called by the service at startup, not on import.
+    """
+    indexed = EMBEDDINGS.get_meta("index_model")
+    if not indexed or indexed == MODEL_NAME or not os.path.exists(IDX_FILE):
+        return
+
+    print(f"🔁 Embedding model changed {indexed} → {MODEL_NAME}, re-embedding in background")
+    _set_active_model(indexed, embedder(indexed))
+    threading.Thread(target=_switch_model, daemon=True).start()
+
+
+# ---------------- INCREMENTAL UPDATES ----------------
+
+def refresh_rag_documents(kind, row_ids):
+    """
+    Re-read the given rows of one kind ("session", "patient", "doctor",
+    "risk") and bring their vectors in line with the database: new rows are
+    embedded and appended, changed rows are replaced and rows that no longer
+    exist are removed. Only these rows are encoded.
+    """
+    refresh_many({kind: row_ids})
+
+
+def refresh_many(rows_by_kind):
+    """
+    refresh_rag_documents for several kinds at once ({kind: row_ids}), as
+    one index update.
+    """
+    rows_by_kind = {k: [int(r) for r in ids] for k, ids in rows_by_kind.items() if ids}
+    if not rows_by_kind:
+        return
+
+    db = get_db()
+    cur = db.cursor()
+    fresh = {}
+    for kind, row_ids in rows_by_kind.items():
+        fresh.update(_load_docs(cur, kind, row_ids))
+    db.close()
+    wanted = [doc_id(k, r) for k, row_ids in rows_by_kind.items() for r in row_ids]
+
+    with _INDEX_LOCK:
+        index, documents, lexical = _load_index()
+
+        if index is None:
+            # No usable index on disk yet, fall back to a one-off full build
+            build_rag_index()
+            return
 
-        context = "\n".join(
-        retrieved_docs
-    + ["--- DATABASE SNAPSHOT ---"]
-    + patients
-    + doctors
-    + risks
-)
+        # Work on copies: the published objects may be searched concurrently
+        index = faiss.clone_index(index)
+        documents = dict(documents)
 
+        stale = [i for i in wanted if i in documents]
+        if stale and not supports_remove(index):
+            # HNSW graphs cannot drop vectors in place
+            build_rag_index()
+            return
 
+        removed = [(i, documents[i]["text"]) for i in stale]
 
+        if stale:
+            index.remove_ids(np.array(stale, dtype="int64"))
+            for i in stale:
+                documents.pop(i, None)
 
-        payload = {
-            "contents": [
-                {
-                    "parts": [
-                        {
-                            "text": f"""
+        if fresh:
+            ids = np.array(list(fresh.keys()), dtype="int64")
+            embeddings = _embed([d["text"] for d in fresh.values()])
+            index.add_with_ids(np.array(embeddings, dtype="float32"), ids)
+            documents.update(fresh)
+
+        lexical = lexical.updated(removed, [(i, d["text"]) for i, d in fresh.items()])
+
+        if needs_rebuild(index):
+            # Corpus outgrew the current structure, retrain from scratch
+            build_rag_index()
+            return
+
+        _swap_index(index, documents, lexical)
+
+    print(f"✅ RAG index updated: {rows_by_kind}")
+
+
+def remove_rag_documents(kind, row_ids):
+    with _INDEX_LOCK:
+        index, documents, lexical = _load_index()
+        if index is None:
+            return
+
+        ids = [doc_id(kind, r) for r in row_ids if doc_id(kind, r) in documents]
+        if not ids:
+            return
+
+        if not supports_remove(index):
+            build_rag_index()
+            return
+
+        index = faiss.clone_index(index)
+        documents = dict(documents)
+        index.remove_ids(np.array(ids, dtype="int64"))
+        lexical = lexical.updated([(i, documents[i]["text"]) for i in ids])
+        for i in ids:
+            documents.pop(i, None)
+
+        _swap_index(index, documents, lexical)
+
+
+def index_session(session_id):
+    """
+    Index a newly stored session together with the risk log written for it.
+    """
+    db = get_db()
+    cur = db.cursor()
+    cur.execute("SELECT log_id FROM email_logs WHERE session_id = ?", (session_id,))
+    log_ids = [r["log_id"] for r in cur.fetchall()]
+    db.close()
+
+    refresh_many({"session": [session_id], "risk": log_ids})
+
+
+# ---------------- QUERY ENGINE ----------------
+
+def _as_set(value, cast=int):
+    if value is None or value == "":
+        return set()
+    if not isinstance(value, (list, tuple, set)):
+        value = [value]
+    return {cast(v) for v in value}
+
+
+def _filter_ids(documents, question, filters):
+    """
+    Vector ids a question may search, or None for the whole index.
+    Explicit filters win; otherwise patients/doctors named in the question
+    restrict the search to their records.
+    """
+    filters = filters or {}
+    patient_ids = _as_set(filters.get("patient_id"))
+    doctor_ids = _as_set(filters.get("doctor_id"))
+    types = _as_set(filters.get("type"), str)
+
+    if not patient_ids and not doctor_ids:
+        patient_ids, doctor_ids = SNAPSHOT.mentioned(question)
+
+    if doctor_ids:
+        patient_ids |= SNAPSHOT.caseload(doctor_ids)
+
+    entity_filter = bool(patient_ids or doctor_ids)
+    return metadata_index(documents).select(
+        patient_ids=patient_ids if entity_filter else None,
+        doctor_ids=doctor_ids if entity_filter else None,
+        types=types or None,
+        date_from=filters.get("from"),
+        date_to=filters.get("to"),
+    )
+
+
+def _rag_context(question, filters=None, q_emb=None):
+    """
+    Retrieval half of the pipeline. Returns the context text for the
+    prompt, or None when nothing has been indexed yet.
+    """
+    index, documents, lexical = _load_index()
+    if index is None:
+        build_rag_index()
+        index, documents, lexical = _load_index()
+
+    if not documents:
+        return None
+
+    if q_emb is None:
+        q_emb = _embed_question(question)
+    q_vec = np.array(q_emb, dtype="float32")
+    allowed = _filter_ids(documents, question, filters)
+
+    if allowed is None:
+        k = min(CANDIDATES, len(documents))
+        _, I = index.search(q_vec, k=k)
+    else:
+        k = min(CANDIDATES, max(1, len(allowed)))
+        _, I = filtered_search(index, q_vec[0], k, allowed)
+        print(f"RAG FILTER: {len(allowed)} of {len(documents)} vectors")
+
+    # Fuse the vector ranking with BM25 so exact terms (names,
+    # medications, symptoms) are not lost by the embedding model
+    vector_hits = [int(i) for i in I[0] if i in documents]
+    lexical_hits = [i for i, _ in lexical.search(question, k, allowed)] if lexical is not None else []
+    fused = reciprocal_rank_fusion([vector_hits, lexical_hits])[:CANDIDATES]
+
+    retrieved_docs = [documents[i]["text"] for i, _ in fused]
+    relevance = [score for _, score in fused]
+    doc_embs = _embed(retrieved_docs) if retrieved_docs else []
+
+    # ===== ADD LIVE DATABASE SNAPSHOT =====
+    snapshot = snapshot_context(question)
+
+    context, usage = build_context(q_emb[0], retrieved_docs, doc_embs, snapshot, relevance=relevance)
+    print("RAG CONTEXT TOKENS:", usage)
+
+    return context
+
+
+def _rag_prompt(context, question):
+    return f"""
 You are a clinical session analytics assistant for an internal healthcare dashboard.
 
 Answer ONLY using information that is explicitly present in the records provided.
@@ -166,13 +606,78 @@ Question:
 
 Answer:
 """
-                        }
-                    ]
-                }
-            ]
-        }
 
-        res = requests.post(URL, json=payload, timeout=45)
+
+def _rag_payload(question, filters=None, q_emb=None):
+    context = _rag_context(question, filters, q_emb)
+    if context is None:
+        return None
+    return {
+        "contents": [
+            {
+                "parts": [
+                    {"text": _rag_prompt(context, question)}
+                ]
+            }
+        ]
+    }
+
+
+# ---------------- ANSWER CACHE ----------------
+
+ANSWERS = AnswerCache()
+
+
+def _embed_question(question):
+    return _active_model[1].encode([normalize_question(question)])
+
+
+def _answer_version():
+    # Any index publish or database commit starts a new cache generation
+    _load_index()
+    return (STORE.version(), data_version())
+
+
+def _answer_scope(question, filters):
+    # Everyone the question may be about is part of the scope, so "how is
+    # Vidushi sleeping" is never served the cached answer about another
+    # patient, however close the two embeddings are
+    patient_ids, doctor_ids = SNAPSHOT.referenced(question)
+    scope = [(k, str(v)) for k, v in (filters or {}).items()]
+    scope += [("patient", str(p)) for p in patient_ids] + [("doctor", str(d)) for d in doctor_ids]
+    return tuple(sorted(scope))
+
+
+def _busy_answer(question, q_emb, scope):
+    # Gemini is saturated or failing: reuse a close earlier answer if any
+    cached = ANSWERS.fallback(question, q_emb[0], scope)
+    if cached is not None:
+        return cached + "\n\n(Cached answer: the AI service is busy, recent sessions may not be reflected.)"
+    return "⚠️ AI service is busy. Please retry in a moment."
+
+
+def query_rag(question, filters=None):
+    try:
+        # Aggregates are answered from SQL without touching the model
+        routed = route_query(question, filters)
+        if routed is not None:
+            return routed
+
+        q_emb = _embed_question(question)
+        version = _answer_version()
+        scope = _answer_scope(question, filters)
+
+        cached = ANSWERS.lookup(question, q_emb[0], version, scope)
+        if cached is not None:
+            print("RAG ANSWER CACHE HIT")
+            return cached
+
+        payload = _rag_payload(question, filters, q_emb)
+        if payload is None:
+            return "⚠️ No clinical data has been indexed yet."
+
+        with LLM_GUARD.admit() as call:
+            res = call.check(GEMINI.generate(payload, timeout=45))
         print("RAG STATUS:", res.status_code)
         print("RAG RAW:", res.text)
 
@@ -187,12 +692,87 @@ Answer:
         if not parts or "text" not in parts[0]:
             return "⚠️ AI response format changed. Please retry."
 
+        ANSWERS.store(question, q_emb[0], version, parts[0]["text"], scope)
         return parts[0]["text"]
 
+    except Overloaded as e:
+        print("RAG LLM UNAVAILABLE:", e)
+        return _busy_answer(question, q_emb, scope)
+
     except requests.exceptions.Timeout:
         print("RAG TIMEOUT ERROR")
         return "⚠️ AI request timed out. Please retry."
 
     except Exception as e:
         print("RAG ENGINE ERROR:", e)
-        return "⚠️ AI service error. Please contact admin."
\ No newline at end of file
+        return "⚠️ AI service error. Please contact admin."
+
+
+
+# ---------------- STREAMING ANSWERS ----------------
+# Same retrieval and prompt as query_rag, but the answer is requested from
+# Gemini's streamGenerateContent endpoint (server-sent events) and yielded
+# chunk by chunk, so the dashboard can show text as soon as it arrives.
+
+def stream_rag(question, filters=None):
+    try:
+        routed = route_query(question, filters)
+        if routed is not None:
+            yield routed
+            return
+
+        q_emb = _embed_question(question)
+        version = _answer_version()
+        scope = _answer_scope(question, filters)
+
+        cached = ANSWERS.lookup(question, q_emb[0], version, scope)
+        if cached is not None:
+            print("RAG ANSWER CACHE HIT")
+            yield cached
+            return
+
+        payload = _rag_payload(question, filters, q_emb)
+        if payload is None:
+            yield "⚠️ No clinical data has been indexed yet."
+            return
+
+        # The slot is held until the whole answer has streamed
+        with LLM_GUARD.admit() as call, GEMINI.stream_generate(payload, timeout=45) as res:
+            call.check(res)
+            print("RAG STREAM STATUS:", res.status_code)
+            if res.status_code != 200:
+                print("RAG RAW:", res.text)
+                yield "⚠️ AI service error. Please contact admin."
+                return
+
+            answer = []
+            for line in res.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                try:
+                    data = json.loads(line[5:].strip())
+                except ValueError:
+                    continue
+
+                for cand in data.get("candidates", [])[:1]:
+                    for part in cand.get("content", {}).get("parts", []):
+                        if part.get("text"):
+                            answer.append(part["text"])
+                            yield part["text"]
+
+            if not answer:
+                yield "⚠️ AI returned no answer."
+            else:
+                ANSWERS.store(question, q_emb[0], version, "".join(answer), scope)
+
+    except Overloaded as e:
+        print("RAG LLM UNAVAILABLE:", e)
+        yield _busy_answer(question, q_emb, scope)
+
+    except requests.exceptions.Timeout:
+        print("RAG TIMEOUT ERROR")
+        yield "⚠️ AI request timed out. Please retry."
+
+    except Exception as e:
+        print("RAG ENGINE ERROR:", e)
+        yield "⚠️ AI service error. Please contact admin."
@@ -0,0 +1,134 @@
+import bisect
+import threading
+import faiss
+import numpy as np
+
+
+# ---------------- METADATA FILTERS ----------------
+# Every document in the store carries {"type", "patient_id", "doctor_id",
+# "date"} next to its text. The filter index below groups vector ids by
+# those fields once per published document map, and a filtered search
+# hands FAISS an IDSelector so only the matching vectors are scored.
+
+DOC_TYPES = ("session", "patient", "doctor", "risk")
+
+# Filters matching fewer vectors than this are scored exactly on the
+# reconstructed vectors; graph indexes lose recall on very selective filters
+EXACT_FILTER_LIMIT = 20000
+
+
+class MetadataIndex:
+
+    def __init__(self, documents):
+        self.by_patient = {}
+        self.by_doctor = {}
+        self.by_type = {}
+        dated = []
+
+        for i, doc in documents.items():
+            self.by_type.setdefault(doc["type"], []).append(i)
+            if doc.get("patient_id") is not None:
+                self.by_patient.setdefault(doc["patient_id"], []).append(i)
+            if doc["type"] == "doctor":
+                self.by_doctor.setdefault(doc["doctor_id"], []).append(i)
+            if doc.get("date"):
+                dated.append((doc["date"], i))
+
+        dated.sort()
+        self.dates = [d for d, _ in dated]
+        self.dated_ids = np.array([i for _, i in dated], dtype="int64")
+        self.undated = {i for i, doc in documents.items() if not doc.get("date")}
+
+    def select(self, patient_ids=None, doctor_ids=None, types=None, date_from=None, date_to=None):
+        """
+        Returns the set of vector ids matching every given filter, or None
+        when no filter applies. doctor_ids keeps the doctor's own record;
+        their patients must be passed in patient_ids.
+        """
+        ids = None
+
+        if patient_ids is not None or doctor_ids is not None:
+            ids = set()
+            for pid in patient_ids or ():
+                ids.update(self.by_patient.get(pid, ()))
+            for did in doctor_ids or ():
+                ids.update(self.by_doctor.get(did, ()))
+
+        if types:
+            typed = set()
+            for t in types:
+                typed.update(self.by_type.get(t, ()))
+            ids = typed if ids is None else ids & typed
+
+        if date_from or date_to:
+            lo = bisect.bisect_left(self.dates, date_from) if date_from else 0
+            hi = bisect.bisect_right(self.dates, date_to + "\uffff") if date_to else len(self.dates)
+            # Patient/doctor records have no date and stay searchable
+            in_range = set(self.dated_ids[lo:hi].tolist()) | self.undated
+            ids = in_range if ids is None else ids & in_range
+
+        return ids
+
+
+_cache_lock = threading.Lock()
+_cache = (None, None)   # (documents, MetadataIndex)
+
+
+def metadata_index(documents):
+    global _cache
+    docs, meta = _cache
+    if docs is documents:
+        return meta
+
+    with _cache_lock:
+        docs, meta = _cache
+        if docs is not documents:
+            meta = MetadataIndex(documents)
+            _cache = (documents, meta)
+        return meta
+
+
+def search_params(index, ids):
+    """
+    SearchParameters restricting a search to the given vector ids. IVF
+    indexes probe every cell for filtered queries, so a selective filter
+    does not lose matches that sit outside the usual nprobe cells.
+    """
+    sel = faiss.IDSelectorBatch(np.fromiter(ids, dtype="int64", count=len(ids)))
+
+    try:
+        ivf = faiss.extract_index_ivf(index)
+    except RuntimeError:
+        ivf = None
+
+    if ivf is not None:
+        params = faiss.SearchParametersIVF(sel=sel, nprobe=ivf.nlist)
+    else:
+        params = faiss.SearchParameters(sel=sel)
+
+    # Keep the selector alive for the duration of the search
+    params.keep_sel = sel
+    return params
+
+
+def filtered_search(index, q, k, ids):
+    """
+    index.search() restricted to ids. Returns (D, I) like FAISS does.
+    """
+    if not ids:
+        return np.full((1, k), np.inf, dtype="float32"), np.full((1, k), -1, dtype="int64")
+
+    if len(ids) <= EXACT_FILTER_LIMIT and isinstance(index, faiss.IndexIDMap2):
+        # Flat and HNSW storage keep full vectors, score them directly
+        keys = np.fromiter(ids, dtype="int64", count=len(ids))
+        vectors = index.reconstruct_batch(keys)
+        dist = ((vectors - q.reshape(1, -1)) ** 2).sum(axis=1)
+        top = np.argsort(dist)[:k]
+
+        D = np.full((1, k), np.inf, dtype="float32")
+        I = np.full((1, k), -1, dtype="int64")
+        D[0, :len(top)] = dist[top]
+        I[0, :len(top)] = keys[top]
+        return D, I
+
+    return index.search(q.reshape(1, -1), k, params=search_params(index, ids))
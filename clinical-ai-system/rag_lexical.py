@@ -0,0 +1,140 @@
+import math
+import re
+from collections import Counter
+
+
+# ---------------- BM25 LEXICAL INDEX ----------------
+# Exact-term search over the same decrypted documents as the FAISS index.
+# MiniLM embeddings rank medication names, patient names and words such as
+# "insomnia" poorly; BM25 catches them and query_rag fuses both rankings.
+#
+# The index is a plain inverted file (term -> {doc id: term frequency}) so
+# it pickles compactly and loads in one pickle.load at startup. Updates are
+# copy-on-write: add/remove return a new index that shares every posting
+# list they did not touch, so readers of the published copy are unaffected.
+
+K1 = 1.5
+B = 0.75
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has",
+    "have", "how", "in", "is", "it", "of", "on", "or", "that", "the", "this",
+    "to", "was", "were", "what", "when", "which", "who", "with",
+}
+
+
+def tokenize(text):
+    return [t for t in _TOKEN.findall(text.lower()) if t not in _STOPWORDS]
+
+
+class LexicalIndex:
+
+    def __init__(self):
+        self.postings = {}
+        self.lengths = {}
+        self.total_length = 0
+
+    @classmethod
+    def from_documents(cls, documents):
+        lex = cls()
+        for i, doc in documents.items():
+            lex._add(i, doc["text"])
+        return lex
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def add(self, doc_id, text):
+        """
+        In-place insert, only for an index that has not been published yet.
+        """
+        self._add(doc_id, text)
+
+    def _copy(self):
+        lex = LexicalIndex()
+        lex.postings = dict(self.postings)
+        lex.lengths = dict(self.lengths)
+        lex.total_length = self.total_length
+        return lex
+
+    def _add(self, doc_id, text, copied=None):
+        terms = Counter(tokenize(text))
+        for term, tf in terms.items():
+            plist = self.postings.get(term)
+            if copied is not None and term not in copied:
+                plist = dict(plist) if plist else {}
+                copied.add(term)
+            elif plist is None:
+                plist = {}
+            plist[doc_id] = tf
+            self.postings[term] = plist
+
+        length = sum(terms.values())
+        self.lengths[doc_id] = length
+        self.total_length += length
+
+    def _remove(self, doc_id, text, copied=None):
+        if doc_id not in self.lengths:
+            return
+        for term in set(tokenize(text)):
+            plist = self.postings.get(term)
+            if not plist or doc_id not in plist:
+                continue
+            if copied is not None and term not in copied:
+                plist = dict(plist)
+                copied.add(term)
+            del plist[doc_id]
+            if plist:
+                self.postings[term] = plist
+            else:
+                del self.postings[term]
+        self.total_length -= self.lengths.pop(doc_id)
+
+    def updated(self, removed=(), added=()):
+        """
+        Returns a new index with `removed` [(id, old text)] dropped and
+        `added` [(id, text)] inserted.
+        """
+        lex = self._copy()
+        copied = set()
+        for i, text in removed:
+            lex._remove(i, text, copied)
+        for i, text in added:
+            lex._add(i, text, copied)
+        return lex
+
+    def search(self, query, k, allowed=None):
+        """
+        Top-k [(doc id, score)] by BM25, optionally restricted to `allowed`.
+        """
+        n = len(self.lengths)
+        if not n:
+            return []
+
+        avgdl = self.total_length / n
+        scores = {}
+
+        for term in set(tokenize(query)):
+            plist = self.postings.get(term)
+            if not plist:
+                continue
+            idf = math.log(1 + (n - len(plist) + 0.5) / (len(plist) + 0.5))
+            for i, tf in plist.items():
+                if allowed is not None and i not in allowed:
+                    continue
+                norm = tf + K1 * (1 - B + B * self.lengths[i] / avgdl)
+                scores[i] = scores.get(i, 0.0) + idf * tf * (K1 + 1) / norm
+
+        return sorted(scores.items(), key=lambda x: x[1], reverse=True)[:k]
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """
+    Merges several ranked id lists; returns [(id, fused score)] best first.
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, i in enumerate(ranking):
+            fused[i] = fused.get(i, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(fused.items(), key=lambda x: x[1], reverse=True)
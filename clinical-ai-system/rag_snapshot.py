@@ -0,0 +1,193 @@
+import os
+import re
+import threading
+from db import get_db, data_version
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+# ---------------- LIVE DATABASE SNAPSHOT ----------------
+# query_rag used to scan the patients and doctors tables and paste every row
+# into the prompt on each question. The snapshot is now built once per
+# database version (db.data_version) and only the aggregates plus the
+# entities the question actually mentions are sent to the model.
+
+MAX_ENTITIES = int(os.getenv("RAG_SNAPSHOT_MAX_ENTITIES", "25"))
+RECENT_RISKS = 5
+
+_WORD = re.compile(r"[a-z0-9@._'-]+")
+_POSSESSIVE = re.compile(r"'s\b")
+
+
+def _words(text):
+    # "Kumar's" should match Kumar
+    return _WORD.findall(_POSSESSIVE.sub("", text.lower()))
+
+
+class DatabaseSnapshot:
+
+    def __init__(self, max_entities=MAX_ENTITIES):
+        self.max_entities = max_entities
+        self._lock = threading.Lock()
+        self._version = None
+        self._data = None
+
+    def get(self):
+        version = data_version()
+        if self._data is not None and version == self._version:
+            return self._data
+
+        with self._lock:
+            if self._data is None or version != self._version:
+                self._data = self._build()
+                self._version = version
+        return self._data
+
+    def _build(self):
+        db = get_db()
+        cur = db.cursor()
+
+        cur.execute("""
+            SELECT p.patient_id, p.name, p.email, p.assigned_doctor, d.name AS doctor
+            FROM patients p
+            LEFT JOIN doctors d ON p.assigned_doctor = d.doctor_id
+        """)
+        patients = []
+        caseloads = {}
+        for r in cur.fetchall():
+            patients.append({
+                "kind": "patient",
+                "id": r["patient_id"],
+                "name": r["name"] or "",
+                "email": r["email"] or "",
+                "line": f"Patient: {r['name']} Email: {r['email']}"
+                        + (f" Doctor: {r['doctor']}" if r["doctor"] else ""),
+            })
+            if r["assigned_doctor"] is not None:
+                caseloads.setdefault(r["assigned_doctor"], []).append(r["patient_id"])
+
+        cur.execute("SELECT doctor_id, name, email FROM doctors")
+        doctors = [
+            {
+                "kind": "doctor",
+                "id": r["doctor_id"],
+                "name": r["name"] or "",
+                "email": r["email"] or "",
+                "line": f"Doctor: {r['name']} Email: {r['email']} "
+                        f"Patients: {len(caseloads.get(r['doctor_id'], []))}",
+            }
+            for r in cur.fetchall()
+        ]
+
+        cur.execute("SELECT COUNT(*) FROM clinical_sessions")
+        total_sessions = cur.fetchone()[0]
+
+        cur.execute("""
+            SELECT
+                COUNT(*),
+                SUM(CASE WHEN recipient_type='LOW' THEN 1 ELSE 0 END),
+                SUM(CASE WHEN recipient_type='MEDIUM' THEN 1 ELSE 0 END),
+                SUM(CASE WHEN recipient_type='HIGH' THEN 1 ELSE 0 END),
+                AVG(anxiety), AVG(burnout_risk), AVG(depression_risk), AVG(self_harm_risk)
+            FROM email_logs
+        """)
+        logs, low, medium, high, anx, burn, dep, sh = cur.fetchone()
+
+        cur.execute("""
+            SELECT anxiety,burnout_risk,depression_risk,self_harm_risk
+            FROM email_logs
+            ORDER BY created_at DESC
+            LIMIT ?
+        """, (RECENT_RISKS,))
+        risks = [
+            f"Risk Log: Anxiety {r['anxiety']} Burnout {r['burnout_risk']} "
+            f"Depression {r['depression_risk']} Self Harm {r['self_harm_risk']}"
+            for r in cur.fetchall()
+        ]
+
+        db.close()
+
+        summary = [
+            f"Clinic totals: {len(patients)} patients, {len(doctors)} doctors, "
+            f"{total_sessions} sessions, {logs} risk logs",
+            f"Risk distribution: LOW {low or 0} MEDIUM {medium or 0} HIGH {high or 0}",
+            f"Average scores: Anxiety {round(anx or 0, 2)} Burnout {round(burn or 0, 2)} "
+            f"Depression {round(dep or 0, 2)} Self Harm {round(sh or 0, 2)}",
+        ]
+
+        # token -> entities, so matching a question is a few dict lookups
+        entities = patients + doctors
+        lookup = {}
+        for e in entities:
+            keys = set(_WORD.findall(e["name"].lower())) | {e["email"].lower()}
+            for key in keys:
+                if len(key) >= 3:
+                    lookup.setdefault(key, []).append(e)
+
+        return {
+            "summary": summary,
+            "risks": risks,
+            "entities": entities,
+            "lookup": lookup,
+            "caseloads": caseloads,
+        }
+
+    def _matches(self, data, question):
+        matched = []
+        seen = set()
+        for word in _words(question):
+            for e in data["lookup"].get(word, []):
+                key = (e["kind"], e["id"])
+                if key not in seen:
+                    seen.add(key)
+                    matched.append(e)
+        return matched
+
+    def mentioned(self, question):
+        """
+        Patients and doctors named in the question, by full name or email.
+        Returns (patient_ids, doctor_ids).
+        """
+        data = self.get()
+        q = " " + " ".join(_words(question)) + " "
+
+        patient_ids, doctor_ids = set(), set()
+        for e in self._matches(data, question):
+            name = " ".join(_WORD.findall(e["name"].lower()))
+            if (name and f" {name} " in q) or (e["email"] and f" {e['email'].lower()} " in q):
+                (patient_ids if e["kind"] == "patient" else doctor_ids).add(e["id"])
+        return patient_ids, doctor_ids
+
+    def referenced(self, question):
+        """
+        Patients and doctors any word of the question may refer to, e.g.
+        every Singh for "Singh". Returns (patient_ids, doctor_ids).
+        """
+        data = self.get()
+        patient_ids, doctor_ids = set(), set()
+        for e in self._matches(data, question):
+            (patient_ids if e["kind"] == "patient" else doctor_ids).add(e["id"])
+        return patient_ids, doctor_ids
+
+    def caseload(self, doctor_ids):
+        data = self.get()
+        return {pid for d in doctor_ids for pid in data["caseloads"].get(d, [])}
+
+    def context_for(self, question):
+        data = self.get()
+
+        if len(data["entities"]) <= self.max_entities:
+            # Small clinic: the full directory fits the budget
+            entities = data["entities"]
+        else:
+            entities = self._matches(data, question)[:self.max_entities]
+
+        return data["summary"] + [e["line"] for e in entities] + data["risks"]
+
+
+SNAPSHOT = DatabaseSnapshot()
+
+
+def snapshot_context(question):
+    return SNAPSHOT.context_for(question)
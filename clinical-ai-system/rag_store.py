@@ -0,0 +1,169 @@
+import os
+import pickle
+import threading
+import faiss
+from rag_lexical import LexicalIndex
+
+
+# ---------------- RESIDENT INDEX STORE ----------------
+# Keeps the FAISS index, its document map and the BM25 lexical index in
+# memory for the whole process. Queries are served from the loaded copy;
+# the files on disk are only re-read when their mtime/size changes (e.g.
+# rag_builder.py was run from another process). Writers always go through
+# a temp file + rename, so a reader never opens a half-written index.
+#
+# publish() swaps and writes at once. swap() only replaces what this
+# process serves and leaves the files to a later persist(), so a burst of
+# small updates is written once (see RAG_PUBLISH_DELAY in rag_engine).
+# Until then the in-memory copy is newer than the files and is not
+# reloaded from them.
+
+class IndexStore:
+
+    def __init__(self, idx_file, doc_file, lex_file):
+        self.idx_file = idx_file
+        self.doc_file = doc_file
+        self.lex_file = lex_file
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._current = (None, None, None)   # (index, documents, lexical)
+        self._disk = None                    # stamp of the files _current was read from / written to
+        self._generation = 0                 # bumped on every swap or reload
+        self._saved = 0                      # generation the files hold
+
+    def _stamp(self):
+        try:
+            a = os.stat(self.idx_file)
+            b = os.stat(self.doc_file)
+        except FileNotFoundError:
+            return None
+        try:
+            c = os.stat(self.lex_file)
+            lex = (c.st_mtime_ns, c.st_size)
+        except FileNotFoundError:
+            lex = None
+        return (a.st_mtime_ns, a.st_size, b.st_mtime_ns, b.st_size, lex)
+
+    def _read(self):
+        # Retry if a writer swapped the files while we were reading them
+        for _ in range(3):
+            before = self._stamp()
+            if before is None:
+                return None, None, None, None
+
+            documents = pickle.load(open(self.doc_file, "rb"))
+            if not isinstance(documents, dict):
+                # Old list-of-strings format, caller rebuilds
+                return None, None, None, before
+
+            index = faiss.read_index(self.idx_file)
+
+            lexical = None
+            if before[4] is not None:
+                lexical = pickle.load(open(self.lex_file, "rb"))
+
+            if self._stamp() != before or index.ntotal != len(documents):
+                continue
+
+            if lexical is None or len(lexical) != len(documents):
+                # Index written before the lexical file existed
+                try:
+                    lexical = LexicalIndex.from_documents(documents)
+                except (KeyError, TypeError):
+                    lexical = None
+
+            return index, documents, lexical, before
+
+        return None, None, None, None
+
+    def get(self):
+        """
+        Returns (index, documents, lexical) or (None, None, None) when
+        nothing usable is on disk. The returned objects are read-only.
+        """
+        current = self._current
+        if self._saved < self._generation:
+            # Unwritten swap: memory is ahead of the files
+            return current
+
+        disk = self._stamp()
+        if disk is not None and disk == self._disk:
+            return current
+
+        with self._lock:
+            current = self._current
+            disk = self._stamp()
+            if self._saved < self._generation or disk is None or disk == self._disk:
+                return current
+
+            fresh = self._read()
+            if fresh[0] is None and current[0] is not None and fresh[3] is None:
+                # Files are mid-swap, keep serving the previous version
+                return current
+
+            self._current = fresh[:3]
+            self._disk = fresh[3]
+            self._generation += 1
+            self._saved = self._generation
+            if fresh[0] is not None:
+                print(f"🔄 RAG index loaded ({fresh[0].ntotal} vectors)")
+            return self._current
+
+    def version(self):
+        """
+        Identifies the index currently served; changes on every swap,
+        publish and reload.
+        """
+        return self._generation
+
+    @property
+    def dirty(self):
+        return self._saved < self._generation
+
+    def swap(self, index, documents, lexical):
+        """
+        Serve new objects from now on, without writing them yet. The
+        objects passed in must not be mutated afterwards.
+        """
+        with self._lock:
+            self._current = (index, documents, lexical)
+            self._generation += 1
+
+    def persist(self):
+        """
+        Writes the objects currently served, if the files are behind them.
+        Returns True if anything was written.
+        """
+        with self._write_lock:
+            with self._lock:
+                if self._saved >= self._generation:
+                    return False
+                index, documents, lexical = self._current
+                generation = self._generation
+
+            # Slow part outside _lock: readers and swap() carry on meanwhile
+            idx_tmp = f"{self.idx_file}.tmp"
+            doc_tmp = f"{self.doc_file}.tmp"
+            lex_tmp = f"{self.lex_file}.tmp"
+
+            faiss.write_index(index, idx_tmp)
+            with open(doc_tmp, "wb") as f:
+                pickle.dump(documents, f, protocol=pickle.HIGHEST_PROTOCOL)
+            with open(lex_tmp, "wb") as f:
+                pickle.dump(lexical, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+            with self._lock:
+                os.replace(lex_tmp, self.lex_file)
+                os.replace(doc_tmp, self.doc_file)
+                os.replace(idx_tmp, self.idx_file)
+                self._disk = self._stamp()
+                self._saved = generation
+            return True
+
+    def publish(self, index, documents, lexical):
+        """
+        Atomically replace the index on disk and in memory. The objects
+        passed in must not be mutated afterwards.
+        """
+        self.swap(index, documents, lexical)
+        self.persist()
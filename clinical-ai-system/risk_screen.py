@@ -0,0 +1,64 @@
+import re
+
+
+# ---------------- LOCAL RISK PRE-SCREEN ----------------
+# Cheap keyword screen of the raw session summary, run before the session
+# is queued for Gemini. It only decides queue priority, never the clinical
+# risk level: a false HIGH just means the job runs a little earlier. Phrases
+# negated just before ("denies suicidal ideation", "no self-harm") are
+# ignored.
+
+HIGH_TERMS = [
+    r"suicid\w*",
+    r"self[- ]?harm\w*",
+    r"kill(ing)? (my|him|her|them)sel(f|ves)",
+    r"end(ing)? (my|his|her|their) (own )?life",
+    r"(want|wants|wanted|wish|wishes|wished) to die",
+    r"no reason to live",
+    r"overdos\w*",
+    r"cutting (my|him|her|them)sel(f|ves)",
+    r"better off dead",
+]
+
+MEDIUM_TERMS = [
+    r"hopeless\w*",
+    r"worthless\w*",
+    r"panic attacks?",
+    r"can'?t cope",
+    r"unable to cope",
+    r"severe (anxiety|depression|insomnia)",
+    r"not eating",
+    r"withdrawn",
+    r"crisis",
+]
+
+NEGATIONS = {"no", "not", "denies", "denied", "deny", "without", "never", "nor"}
+NEGATION_WINDOW = 3
+
+_HIGH = re.compile(r"\b(" + "|".join(HIGH_TERMS) + r")\b")
+_MEDIUM = re.compile(r"\b(" + "|".join(MEDIUM_TERMS) + r")\b")
+_WORD = re.compile(r"[a-z']+")
+_CLAUSE = re.compile(r"[.;:!?,\n]")
+
+
+def _negated(text, start):
+    # Only look back within the same clause
+    clause = _CLAUSE.split(text[max(0, start - 60):start])[-1]
+    before = _WORD.findall(clause)[-NEGATION_WINDOW:]
+    return any(w in NEGATIONS for w in before)
+
+
+def _mentions(pattern, text):
+    return any(not _negated(text, m.start()) for m in pattern.finditer(text))
+
+
+def prescreen(summary):
+    """
+    Returns "HIGH", "MEDIUM" or "LOW" for queue priority.
+    """
+    text = (summary or "").lower()
+    if _mentions(_HIGH, text):
+        return "HIGH"
+    if _mentions(_MEDIUM, text):
+        return "MEDIUM"
+    return "LOW"
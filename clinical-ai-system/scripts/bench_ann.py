@@ -0,0 +1,65 @@
+import sys
+import os
+import time
+import argparse
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from rag_ann import INDEX_TYPES, build_index, index_kind
+
+# Recall-vs-latency comparison of the RAG index types on a synthetic corpus.
+# Vectors are clustered and unit-normalised like MiniLM sentence embeddings;
+# recall@k is measured against the exact flat index.
+#
+#   python scripts/bench_ann.py --docs 200000 --queries 500
+
+
+def synthetic_corpus(n, dim, clusters, seed):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype("float32")
+    labels = rng.integers(0, clusters, size=n)
+    x = centers[labels] + 0.35 * rng.normal(size=(n, dim)).astype("float32")
+    x /= np.linalg.norm(x, axis=1, keepdims=True)
+    return x
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--types", default=",".join(INDEX_TYPES))
+    args = parser.parse_args()
+
+    corpus = synthetic_corpus(args.docs + args.queries, args.dim, max(8, args.docs // 500), 7)
+    vectors, queries = corpus[:args.docs], corpus[args.docs:]
+    ids = np.arange(args.docs, dtype="int64")
+
+    print(f"Corpus: {args.docs} x {args.dim}, {args.queries} queries, recall@{args.k}\n")
+    print(f"{'type':<10}{'build s':>10}{'ms/query':>10}{'recall':>9}")
+
+    truth = None
+    for kind in args.types.split(","):
+        t0 = time.perf_counter()
+        index = build_index(vectors, ids, kind)
+        build_s = time.perf_counter() - t0
+
+        # One query at a time, the way query_rag searches
+        t0 = time.perf_counter()
+        found = np.vstack([index.search(q[None, :], args.k)[1] for q in queries])
+        ms = (time.perf_counter() - t0) * 1000 / len(queries)
+
+        if truth is None:
+            if index_kind(index) != "flat":
+                truth = build_index(vectors, ids, "flat").search(queries, args.k)[1]
+            else:
+                truth = found
+
+        recall = np.mean([len(set(f) & set(t)) / args.k for f, t in zip(found, truth)])
+        print(f"{index_kind(index):<10}{build_s:>10.2f}{ms:>10.3f}{recall:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
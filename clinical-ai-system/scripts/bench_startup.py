@@ -0,0 +1,159 @@
+import sys
+import os
+import json
+import time
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+# Cold-start and per-worker memory of the service processes.
+#
+# 1. Import time and RSS of rag_engine / followup_service, each in a fresh
+#    interpreter, plus what the first embedding then costs (the lazy load).
+# 2. Per-worker memory with and without preloading: a parent forks
+#    --workers children the way the gunicorn master does, every child
+#    embeds a sentence, and reports RSS, PSS (shared pages split between
+#    the processes that map them) and USS (pages only it uses).
+#
+#   python scripts/bench_startup.py --workers 4 --whisper
+
+IMPORT_PROBE = """
+import json, os, sys, time, resource
+sys.path.insert(0, {root!r})
+os.chdir({root!r})
+t = time.perf_counter()
+import {module} as m
+imported = time.perf_counter() - t
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+t = time.perf_counter()
+import rag_engine
+rag_engine.MODEL.encode(["warm up"])
+first_use = time.perf_counter() - t
+print(json.dumps({{"import_s": imported, "rss_mb": rss, "first_use_s": first_use,
+    "rss_after_use_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}}))
+os._exit(0)
+"""
+
+
+def memory_mb():
+    """
+    RSS / PSS / USS of this process in MB, from /proc (Linux).
+    """
+    fields = {}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[1].isdigit():
+                    fields[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    except OSError:
+        return {"rss": 0, "pss": 0, "uss": 0}
+    return {
+        "rss": fields.get("Rss", 0),
+        "pss": fields.get("Pss", 0),
+        "uss": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+    }
+
+
+def fork_probe(preload, workers, whisper):
+    """
+    Runs in its own interpreter; prints one JSON line.
+    """
+    import model_loader
+
+    t = time.perf_counter()
+    if preload:
+        model_loader.preload(whisper=whisper, workers=1)
+    preload_s = time.perf_counter() - t
+
+    children = []
+    for _ in range(workers):
+        up_r, up_w = os.pipe()
+        go_r, go_w = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(up_r)
+            os.close(go_w)
+            t = time.perf_counter()
+            model_loader.embedder().encode(["how is the patient sleeping"])
+            if whisper:
+                from whisper_backend import backend_config
+                model_loader.whisper_model(backend_config(1)).get()
+            ready = time.perf_counter() - t
+            # Measure only once every sibling is loaded, so PSS is comparable
+            os.write(up_w, b"r")
+            os.read(go_r, 1)
+            os.write(up_w, json.dumps({"ready_s": ready, **memory_mb()}).encode())
+            os.close(up_w)
+            os._exit(0)
+        os.close(up_w)
+        os.close(go_r)
+        children.append((pid, up_r, go_w))
+
+    for _, up_r, _ in children:
+        os.read(up_r, 1)
+    parent = memory_mb()
+    for _, _, go_w in children:
+        os.write(go_w, b"g")
+
+    results = []
+    for pid, up_r, go_w in children:
+        with os.fdopen(up_r) as f:
+            results.append(json.loads(f.read()))
+        os.close(go_w)
+        os.waitpid(pid, 0)
+
+    print(json.dumps({"preload_s": preload_s, "parent": parent, "workers": results}))
+
+
+def run(args):
+    out = subprocess.run([sys.executable, *args], cwd=ROOT, capture_output=True, text=True)
+    lines = [l for l in out.stdout.splitlines() if l.startswith("{")]
+    if out.returncode != 0 or not lines:
+        raise RuntimeError(out.stderr.strip().splitlines()[-1] if out.stderr.strip() else "no output")
+    return json.loads(lines[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--whisper", action="store_true", help="load Whisper in the workers too")
+    parser.add_argument("--modules", default="rag_engine,followup_service")
+    parser.add_argument("--fork-probe", choices=["lazy", "preload"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.fork_probe:
+        fork_probe(args.fork_probe == "preload", args.workers, args.whisper)
+        return
+
+    print(f"{'import':<20}{'import s':>10}{'RSS MB':>9}{'1st embed s':>13}{'RSS after':>11}")
+    for module in args.modules.split(","):
+        try:
+            r = run(["-c", IMPORT_PROBE.format(root=ROOT, module=module)])
+        except RuntimeError as e:
+            print(f"{module:<20}  failed: {e}")
+            continue
+        print(f"{module:<20}{r['import_s']:>10.2f}{r['rss_mb']:>9.0f}{r['first_use_s']:>13.2f}{r['rss_after_use_mb']:>11.0f}")
+
+    print(f"\n{args.workers} forked workers{' + Whisper' if args.whisper else ''}, per worker (MB):")
+    print(f"{'mode':<10}{'preload s':>10}{'ready s':>9}{'RSS':>8}{'PSS':>8}{'USS':>8}{'total PSS':>11}")
+    for mode in ("lazy", "preload"):
+        probe = [os.path.abspath(__file__), "--fork-probe", mode, "--workers", str(args.workers)]
+        if args.whisper:
+            probe.append("--whisper")
+        try:
+            r = run(probe)
+        except RuntimeError as e:
+            print(f"{mode:<10}  failed: {e}")
+            continue
+        w = r["workers"]
+        avg = lambda k: sum(x[k] for x in w) / len(w)
+        total = r["parent"]["pss"] + sum(x["pss"] for x in w)
+        print(f"{mode:<10}{r['preload_s']:>10.2f}{avg('ready_s'):>9.2f}{avg('rss'):>8.0f}"
+              f"{avg('pss'):>8.0f}{avg('uss'):>8.0f}{total:>11.0f}")
+
+
+if __name__ == "__main__":
+    main()
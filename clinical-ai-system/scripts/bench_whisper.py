@@ -0,0 +1,157 @@
+import sys
+import os
+import re
+import time
+import argparse
+import multiprocessing
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from audio_prep import decode_stream, SAMPLE_RATE
+from whisper_backend import backend_config, describe, load_backend
+
+# Speed / memory / accuracy comparison of Whisper backends on CPU. Each
+# configuration runs in a fresh process so peak RSS is its own. Longer
+# clips are the test audio repeated with short pauses; real-time factor is
+# compute seconds per audio second (below 1 = faster than real time).
+#
+# WER needs a reference: --reference "text" or --reference-file. Without
+# one, the last configuration's transcript of the 1x clip is used, so put
+# the most accurate model last.
+#
+#   python scripts/bench_whisper.py --configs openai:base,faster:base:int8,faster:small:int8 --lengths 1,5
+
+DEFAULT_AUDIO = os.path.join(os.path.dirname(os.path.dirname(__file__)), "static", "test_audio.wav")
+DEFAULT_CONFIGS = "openai:tiny,faster:tiny:int8,openai:base,faster:base:int8,faster:small:int8"
+
+_WORD = re.compile(r"[a-z0-9']+")
+
+
+def words(text):
+    return _WORD.findall(text.lower())
+
+
+def wer(reference, hypothesis):
+    ref, hyp = words(reference), words(hypothesis)
+    if not ref:
+        return 0.0 if not hyp else 1.0
+    # Word-level edit distance, one row at a time
+    row = list(range(len(hyp) + 1))
+    for i, r in enumerate(ref, 1):
+        prev, row[0] = row[0], i
+        for j, h in enumerate(hyp, 1):
+            prev, row[j] = row[j], min(row[j] + 1, row[j - 1] + 1, prev + (r != h))
+    return row[-1] / len(ref)
+
+
+def synthetic_clip(audio, times, pause=0.5):
+    gap = np.zeros(int(pause * SAMPLE_RATE), dtype=np.float32)
+    parts = []
+    for i in range(times):
+        parts += [audio, gap] if i < times - 1 else [audio]
+    return np.concatenate(parts)
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    except ImportError:
+        return 0
+
+
+def _run_config(config, clips, out):
+    try:
+        t0 = time.perf_counter()
+        backend = load_backend(config)
+        load_s = time.perf_counter() - t0
+        load_rss = _peak_rss_mb()
+
+        # Warm-up, so the first clip does not pay for lazy initialisation
+        backend.transcribe(clips[0][1][:SAMPLE_RATE * 2])
+
+        results = []
+        for times, clip in clips:
+            t0 = time.perf_counter()
+            text = backend.transcribe(clip)
+            compute = time.perf_counter() - t0
+            results.append({"times": times, "seconds": len(clip) / SAMPLE_RATE, "compute": compute, "text": text})
+        out.put({"load_s": load_s, "load_rss": load_rss, "peak_rss": _peak_rss_mb(), "results": results})
+    except Exception as e:
+        out.put({"error": f"{type(e).__name__}: {e}"})
+
+
+def parse_config(spec, threads):
+    parts = spec.split(":")
+    return backend_config(
+        backend=parts[0],
+        model=parts[1] if len(parts) > 1 else None,
+        compute_type=parts[2] if len(parts) > 2 else None,
+        threads=threads or None
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--audio", default=DEFAULT_AUDIO)
+    parser.add_argument("--configs", default=DEFAULT_CONFIGS,
+                        help="comma-separated backend:model[:compute_type]")
+    parser.add_argument("--lengths", default="1,5", help="clip lengths as multiples of the test audio")
+    parser.add_argument("--threads", type=int, default=0, help="0 = WHISPER_THREADS / all cores")
+    parser.add_argument("--reference")
+    parser.add_argument("--reference-file")
+    args = parser.parse_args()
+
+    with open(args.audio, "rb") as f:
+        audio = decode_stream(f)
+    lengths = [int(n) for n in args.lengths.split(",")]
+    clips = [(n, synthetic_clip(audio, n)) for n in lengths]
+
+    reference = args.reference
+    if args.reference_file:
+        with open(args.reference_file, encoding="utf-8") as f:
+            reference = f.read()
+
+    print(f"Audio: {args.audio} ({len(audio) / SAMPLE_RATE:.1f}s), clips: "
+          + ", ".join(f"{n}x = {len(c) / SAMPLE_RATE:.0f}s" for n, c in clips) + "\n")
+
+    ctx = multiprocessing.get_context("spawn")
+    rows = []
+    for spec in args.configs.split(","):
+        config = parse_config(spec, args.threads)
+        out = ctx.Queue()
+        proc = ctx.Process(target=_run_config, args=(config, clips, out))
+        proc.start()
+        result = out.get()
+        proc.join()
+        rows.append((config, result))
+        if "error" in result:
+            print(f"✗ {describe(config)}: {result['error']}")
+        else:
+            print(f"✓ {describe(config)}: loaded in {result['load_s']:.1f}s")
+
+    pseudo = reference is None
+    if pseudo:
+        done = [r for _, r in rows if "error" not in r]
+        reference = done[-1]["results"][0]["text"] if done else ""
+
+    header = f"\n{'config':<42}{'load s':>8}{'model MB':>10}{'peak MB':>9}"
+    for n in lengths:
+        header += f"{f'RTF {n}x':>10}{f'WER {n}x':>9}"
+    print(header)
+
+    for config, result in rows:
+        if "error" in result:
+            continue
+        line = f"{describe(config):<42}{result['load_s']:>8.1f}{result['load_rss']:>10.0f}{result['peak_rss']:>9.0f}"
+        for r in result["results"]:
+            line += f"{r['compute'] / r['seconds']:>10.3f}{wer(' '.join([reference] * r['times']), r['text']):>9.3f}"
+        print(line)
+
+    if pseudo:
+        print("\nWER is against the last configuration's transcript (no --reference given).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import os
+import sys
+import sqlite3
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Keep every database the modules open at import out of the checkout
+_TMP = tempfile.mkdtemp(prefix="clinic-tests-")
+os.environ.setdefault("JOBS_DB", os.path.join(_TMP, "jobs.db"))
+os.environ.setdefault("AES_SECRET_KEY", "test-key")
+os.chdir(_TMP)
+
+import db  # noqa: E402
+import rag_snapshot  # noqa: E402
+
+SCHEMA = """
+CREATE TABLE doctors (
+    doctor_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT,
+    email TEXT
+);
+CREATE TABLE patients (
+    patient_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT,
+    email TEXT,
+    assigned_doctor INTEGER
+);
+CREATE TABLE clinical_sessions (
+    session_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    patient_id INTEGER,
+    short_summary TEXT,
+    ai_json TEXT,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE email_logs (
+    log_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    patient_id INTEGER,
+    session_id INTEGER,
+    email_body TEXT,
+    recipient_type TEXT,
+    anxiety INTEGER,
+    burnout_risk INTEGER,
+    depression_risk INTEGER,
+    self_harm_risk INTEGER,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+
+@pytest.fixture
+def clinic_db(tmp_path, monkeypatch):
+    """
+    A fresh clinic.db with two doctors and three patients, wired into db.py.
+    """
+    path = str(tmp_path / "clinic.db")
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    conn.executemany("INSERT INTO doctors (name, email) VALUES (?, ?)", [
+        ("Primary Doctor", "primary@clinic.test"),
+        ("Sanjeev kumar", "sanjeev@clinic.test"),
+    ])
+    conn.executemany("INSERT INTO patients (name, email, assigned_doctor) VALUES (?, ?, ?)", [
+        ("Vidushi Singh", "vidushi@clinic.test", 2),
+        ("Rakhi kumar", "rakhi@clinic.test", 2),
+        ("Srishti singh", "srishti@clinic.test", 1),
+    ])
+    conn.commit()
+    conn.close()
+
+    monkeypatch.setattr(db, "DB_NAME", path)
+    monkeypatch.setattr(db, "_watch_conn", None)
+    # A new database starts at the same data_version as the last one
+    monkeypatch.setattr(rag_snapshot.SNAPSHOT, "_data", None)
+    yield path
+    if db._watch_conn is not None:
+        db._watch_conn.close()
@@ -0,0 +1,120 @@
+import json
+import sqlite3
+
+import pytest
+
+import ai_engine
+import followup_service
+from crypto_utils import encrypt_text
+from job_queue import Defer, DONE, FAILED
+from llm_guard import CircuitOpen, Overloaded
+
+
+@pytest.fixture
+def session(clinic_db, monkeypatch):
+    conn = sqlite3.connect(clinic_db)
+    conn.execute(
+        "INSERT INTO clinical_sessions (patient_id, short_summary) VALUES (?, ?)",
+        (1, encrypt_text("Patient reports suicidal thoughts")),
+    )
+    conn.commit()
+    conn.close()
+
+    sent = []
+    monkeypatch.setattr(followup_service, "send_email", lambda *a, **kw: sent.append((a, kw)))
+    monkeypatch.setattr(followup_service, "dispatch_event", lambda *a, **kw: None)
+    monkeypatch.setattr(followup_service, "index_session", lambda sid: None)
+    return {"db": clinic_db, "sent": sent}
+
+
+def job(priority):
+    return {"payload": {"session_id": 1, "patient_id": 1}, "state": {}, "priority": priority}
+
+
+def ai_json(path):
+    conn = sqlite3.connect(path)
+    row = conn.execute("SELECT ai_json FROM clinical_sessions WHERE session_id = 1").fetchone()
+    conn.close()
+    return row[0]
+
+
+def gemini_fails(monkeypatch, error):
+    def call(prompt):
+        raise error
+    monkeypatch.setattr(ai_engine, "call_gemini", call)
+
+
+@pytest.mark.parametrize("error", [Overloaded("queue full"), CircuitOpen("breaker open")])
+def test_guard_rejection_defers(session, monkeypatch, error):
+    gemini_fails(monkeypatch, error)
+    with pytest.raises(Defer) as raised:
+        followup_service.run_analysis_job(job("MEDIUM"), lambda *a: None)
+
+    assert raised.value.delay >= followup_service.ANALYSIS_DEFER
+    assert ai_json(session["db"]) is None
+    assert session["sent"] == []
+
+
+def test_high_priority_never_uses_fallback(session, monkeypatch):
+    gemini_fails(monkeypatch, ValueError("bad JSON"))
+    with pytest.raises(ValueError):
+        followup_service.run_analysis_job(job("HIGH"), lambda *a: None)
+
+    assert ai_json(session["db"]) is None
+    assert session["sent"] == []
+
+
+def test_other_priorities_keep_the_fallback(session, monkeypatch):
+    gemini_fails(monkeypatch, ValueError("bad JSON"))
+    result = followup_service.run_analysis_job(job("LOW"), lambda *a: None)
+
+    assert result["risk"] == "MEDIUM"
+    assert json.loads(ai_json(session["db"]))["risk"] == "MEDIUM"
+    assert len(session["sent"]) == 1
+
+
+@pytest.fixture
+def jobs(session, monkeypatch):
+    indexed = []
+    monkeypatch.setattr(followup_service, "index_session", indexed.append)
+    monkeypatch.setattr(followup_service.JOBS, "retry_delay", 0)
+    return indexed
+
+
+def run_until_settled(job_id):
+    queue = followup_service.JOBS
+    while queue.get(job_id)["status"] not in (DONE, FAILED):
+        queue._run(queue._claim())
+    return queue.get(job_id)
+
+
+def test_failed_high_analysis_escalates_to_the_doctor(session, jobs, monkeypatch):
+    gemini_fails(monkeypatch, ValueError("bad JSON"))
+    job_id = followup_service.JOBS.enqueue("analyze_session", {"session_id": 1, "patient_id": 1}, "HIGH")
+
+    final = run_until_settled(job_id)
+    assert final["status"] == FAILED
+    assert final["attempts"] == followup_service.JOBS.max_attempts
+    assert ai_json(session["db"]) is None
+
+    # Only the escalation, to the assigned doctor, from the pre-screen alone
+    ((to, subject, body), kw), = session["sent"]
+    assert to == "sanjeev@clinic.test"
+    assert "suicidal thoughts" in body
+    assert kw["priority"] == "HIGH" and kw["message_id"] == "session-1-escalation"
+    assert jobs == [1]
+
+
+def test_analysed_high_job_is_not_escalated(session, jobs, monkeypatch):
+    monkeypatch.setattr(followup_service, "analyze_session", lambda summary, fallback: {
+        "risk": "HIGH", "email_text": "Follow-up", "anxiety": 9, "burnout_risk": 9,
+        "depression_risk": 9, "self_harm_risk": 9,
+    })
+
+    def webhook_down(*args, **kwargs):
+        raise RuntimeError("outbox unavailable")
+    monkeypatch.setattr(followup_service, "dispatch_event", webhook_down)
+    job_id = followup_service.JOBS.enqueue("analyze_session", {"session_id": 1, "patient_id": 1}, "HIGH")
+
+    assert run_until_settled(job_id)["status"] == FAILED
+    assert session["sent"] == []
@@ -0,0 +1,42 @@
+import numpy as np
+
+from answer_cache import AnswerCache
+from rag_engine import _answer_scope
+
+VERSION = (1, 1)
+
+
+def vec(*values):
+    return np.array(values, dtype="float32")
+
+
+def test_similar_question_hits_in_the_same_scope():
+    cache = AnswerCache(similarity=0.9)
+    cache.store("How are patients sleeping?", vec(1, 0), VERSION, "badly")
+
+    assert cache.lookup("how are the patients sleeping", vec(0.99, 0.05), VERSION) == "badly"
+    assert cache.lookup("How are patients sleeping?", vec(1, 0), VERSION, scope=(("type", "x"),)) is None
+    assert cache.lookup("How are patients sleeping?", vec(1, 0), (2, 1)) is None
+
+
+def test_named_patients_are_part_of_the_scope(clinic_db):
+    cache = AnswerCache(similarity=0.9)
+    about_vidushi = "How is Vidushi Singh sleeping?"
+    about_rakhi = "How is Rakhi Kumar sleeping?"
+    cache.store(about_vidushi, vec(1, 0), VERSION, "Vidushi sleeps badly", _answer_scope(about_vidushi, {}))
+
+    # Same embedding, different patient: never a hit, not even as a fallback
+    scope = _answer_scope(about_rakhi, {})
+    assert cache.lookup(about_rakhi, vec(1, 0), VERSION, scope) is None
+    assert cache.fallback(about_rakhi, vec(1, 0), scope) is None
+    # A partial name is scoped to everyone it could mean
+    assert _answer_scope("How is Rakhi sleeping?", {}) == (("patient", "2"),)
+    assert _answer_scope("How is Singh sleeping?", {}) == (("patient", "1"), ("patient", "3"))
+    assert _answer_scope("How are the patients sleeping?", {}) == ()
+
+    again = "how is vidushi singh sleeping lately"
+    assert cache.lookup(again, vec(1, 0), VERSION, _answer_scope(again, {})) == "Vidushi sleeps badly"
+
+
+def test_filters_stay_in_the_scope(clinic_db):
+    assert _answer_scope("How is Vidushi?", {"type": "HIGH"}) == (("patient", "1"), ("type", "HIGH"))
@@ -0,0 +1,171 @@
+import smtplib
+import threading
+import socketserver
+
+import pytest
+
+import aws_mailer
+from aws_mailer import SMTPPool, _message
+from crypto_utils import encrypt_text
+from job_queue import GiveUp
+
+
+class StubSMTP(socketserver.StreamRequestHandler):
+    """
+    Minimal SMTP server. server.refuse: recipients answered with 550;
+    server.busy: recipients answered with 450; server.unavailable: recipients answered with 421 (then the server hangs
+    up); server.drop_after: hang up after that many messages on a connection.
+    """
+
+    def reply(self, line):
+        self.wfile.write((line + "\r\n").encode())
+
+    def handle(self):
+        server = self.server
+        server.connections += 1
+        sent = 0
+        self.reply("220 stub ESMTP")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            cmd = line.decode().strip()
+            verb = cmd.split(" ", 1)[0].upper()
+
+            if verb in ("EHLO", "HELO"):
+                self.reply("250 stub")
+            elif verb == "RCPT":
+                to = cmd.split(":", 1)[1].strip("<> ")
+                if to in server.unavailable:
+                    server.unavailable.discard(to)
+                    self.reply("421 service not available")
+                    return
+                if to in server.refuse:
+                    self.reply("550 no such user")
+                elif to in server.busy:
+                    self.reply("450 mailbox busy")
+                else:
+                    self.reply("250 ok")
+            elif verb in ("MAIL", "RSET", "NOOP"):
+                self.reply("250 ok")
+            elif verb == "DATA":
+                self.reply("354 go ahead")
+                data = []
+                while True:
+                    line = self.rfile.readline()
+                    if line in (b".\r\n", b".\n", b""):
+                        break
+                    data.append(line)
+                server.messages.append(b"".join(data))
+                self.reply("250 queued")
+                sent += 1
+                if server.drop_after and sent >= server.drop_after:
+                    return
+            elif verb == "QUIT":
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("502 not implemented")
+
+
+class StubServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+@pytest.fixture
+def smtp(monkeypatch):
+    srv = StubServer(("127.0.0.1", 0), StubSMTP)
+    srv.connections = 0
+    srv.messages = []
+    srv.refuse = set()
+    srv.busy = set()
+    srv.unavailable = set()
+    srv.drop_after = 0
+    threading.Thread(target=srv.serve_forever, args=(0.05,), daemon=True).start()
+
+    host, port = srv.server_address
+    monkeypatch.setattr(aws_mailer, "SES_HOST", host)
+    monkeypatch.setattr(aws_mailer, "SES_PORT", port)
+    monkeypatch.setattr(aws_mailer, "SES_STARTTLS", False)
+    monkeypatch.setattr(aws_mailer, "SES_USER", None)
+    monkeypatch.setattr(aws_mailer, "SENDER", "clinic@example.test")
+    monkeypatch.setattr(aws_mailer, "SMTP_TIMEOUT", 5)
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+
+@pytest.fixture
+def pool():
+    p = SMTPPool(size=1)
+    yield p
+    p.close_all()
+
+
+def send(pool, to):
+    pool.send(to, _message(to, "HopeQure Follow-up", "hello"))
+
+
+def test_connection_is_reused(smtp, pool):
+    for i in range(3):
+        send(pool, f"patient{i}@example.test")
+
+    assert len(smtp.messages) == 3
+    assert smtp.connections == 1
+    assert pool.stats()["opened"] == 1
+
+
+def test_refused_recipient_keeps_the_connection(smtp, pool):
+    smtp.refuse.add("gone@example.test")
+
+    with pytest.raises(smtplib.SMTPRecipientsRefused):
+        send(pool, "gone@example.test")
+    assert pool.stats()["idle"] == 1
+
+    send(pool, "patient@example.test")
+    assert smtp.connections == 1
+    assert len(smtp.messages) == 1
+
+
+def test_dropped_connection_is_replaced(smtp, pool):
+    smtp.drop_after = 1
+
+    send(pool, "a@example.test")
+    send(pool, "b@example.test")
+
+    assert len(smtp.messages) == 2
+    assert smtp.connections == 2
+    assert pool.stats()["reconnects"] == 1
+
+
+def test_421_reconnects_once(smtp, pool):
+    smtp.unavailable.add("busy@example.test")
+
+    send(pool, "busy@example.test")
+
+    assert len(smtp.messages) == 1
+    assert smtp.connections == 2
+    assert pool.stats()["reconnects"] == 1
+
+
+def deliver(pool, monkeypatch, to):
+    monkeypatch.setattr(aws_mailer, "POOL", pool)
+    job = {"payload": {"to": to, "subject": "HopeQure Follow-up", "body": encrypt_text("hello")},
+           "created_at": 0}
+    return aws_mailer._deliver(job, lambda *a: None)
+
+
+def test_permanent_refusal_gives_up(smtp, pool, monkeypatch):
+    smtp.refuse.add("gone@example.test")
+
+    with pytest.raises(GiveUp, match="550"):
+        deliver(pool, monkeypatch, "gone@example.test")
+
+
+def test_temporary_refusal_is_retried(smtp, pool, monkeypatch):
+    smtp.busy.add("busy@example.test")
+
+    # Raised as is, so the outbox retries it
+    with pytest.raises(smtplib.SMTPRecipientsRefused):
+        deliver(pool, monkeypatch, "busy@example.test")
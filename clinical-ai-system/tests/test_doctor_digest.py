@@ -0,0 +1,108 @@
+import sqlite3
+
+import pytest
+
+import db
+import doctor_digest
+
+
+@pytest.fixture
+def digest(clinic_db, tmp_path, monkeypatch):
+    conn = sqlite3.connect(clinic_db)
+    conn.executemany("""
+        INSERT INTO email_logs (patient_id, session_id, recipient_type, anxiety, burnout_risk,
+                                depression_risk, self_harm_risk)
+        VALUES (?, ?, ?, 5, 5, 5, 1)
+    """, [(1, 1, "MEDIUM"), (2, 2, "HIGH"), (1, 3, "MEDIUM")])
+    conn.commit()
+    conn.close()
+
+    sent = []
+
+    def send_email(to, subject, body, priority="MEDIUM", message_id=None):
+        sent.append({"to": to, "subject": subject, "body": body, "message_id": message_id})
+        return message_id
+
+    jobs_db = str(tmp_path / "jobs.db")
+    monkeypatch.setattr(doctor_digest, "JOBS_DB", jobs_db)
+    monkeypatch.setattr(doctor_digest, "_created", False)
+    monkeypatch.setattr(doctor_digest, "DIGEST_MAX_SESSIONS", 10)
+    monkeypatch.setattr(doctor_digest, "send_email", send_email)
+    return {"sent": sent, "jobs_db": jobs_db, "clinic_db": clinic_db}
+
+
+def pending(path):
+    conn = sqlite3.connect(path)
+    rows = conn.execute("SELECT log_id, message_id, sent_at FROM digest_queue ORDER BY log_id").fetchall()
+    conn.close()
+    return rows
+
+
+def test_queue_lives_outside_clinic_db(digest):
+    before = db.data_version()
+    doctor_digest.queue_for_digest(1, 2)
+    doctor_digest.queue_for_digest(2, 2)
+    assert db.data_version() == before
+
+    conn = sqlite3.connect(digest["clinic_db"])
+    assert conn.execute("SELECT name FROM sqlite_master WHERE name = 'digest_queue'").fetchone() is None
+    conn.close()
+    assert [r[0] for r in pending(digest["jobs_db"])] == [1, 2]
+
+
+def test_flush_sends_one_digest(digest):
+    doctor_digest.queue_for_digest(1, 2)
+    doctor_digest.queue_for_digest(2, 2)
+    message_id = doctor_digest.flush(2)
+
+    (mail,) = digest["sent"]
+    assert mail["to"] == "sanjeev@clinic.test"
+    assert mail["message_id"] == message_id
+    # HIGH first
+    assert mail["body"].index("Rakhi kumar") < mail["body"].index("Vidushi Singh")
+    assert all(r[2] is not None for r in pending(digest["jobs_db"]))
+    assert doctor_digest.flush(2) is None
+
+
+def test_interrupted_flush_resends_under_the_same_id(digest, monkeypatch):
+    doctor_digest.queue_for_digest(1, 2)
+    doctor_digest.queue_for_digest(2, 2)
+
+    def crash(*args, **kwargs):
+        raise RuntimeError("process died")
+
+    # Dies after stamping the rows, before they are marked sent
+    real = doctor_digest.send_email
+    monkeypatch.setattr(doctor_digest, "send_email", crash)
+    with pytest.raises(RuntimeError):
+        doctor_digest.flush(2)
+    monkeypatch.setattr(doctor_digest, "send_email", real)
+    stamped = {r[1] for r in pending(digest["jobs_db"])}
+    assert len(stamped) == 1 and None not in stamped
+
+    # A session queued meanwhile must not change the id of the resend
+    doctor_digest.queue_for_digest(3, 2)
+    first = doctor_digest.flush(2)
+    second = doctor_digest.flush(2)
+
+    assert [m["message_id"] for m in digest["sent"]] == [first, second]
+    assert first in stamped and second != first
+    assert digest["sent"][0]["body"].count("Vidushi Singh") == 1
+    assert [r[1] for r in pending(digest["jobs_db"])] == [first, first, second]
+
+
+
+def test_items_of_a_deleted_doctor_are_dropped(digest, monkeypatch):
+    monkeypatch.setattr(doctor_digest, "DIGEST_WINDOW", 0)
+    doctor_digest.queue_for_digest(1, 2)
+    doctor_digest.queue_for_digest(2, 2)
+    conn = sqlite3.connect(digest["clinic_db"])
+    conn.execute("DELETE FROM doctors WHERE doctor_id = 2")
+    conn.commit()
+    conn.close()
+
+    assert doctor_digest.flush_due() == 1
+    assert digest["sent"] == []
+    assert all(sent_at for _, _, sent_at in pending(digest["jobs_db"]))
+    # Not picked up again on the next poll
+    assert doctor_digest.flush_due() == 0
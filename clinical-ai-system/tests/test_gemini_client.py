@@ -0,0 +1,156 @@
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import gemini_client
+from gemini_client import GeminiClient
+
+OK = {"candidates": [{"content": {"parts": [{"text": "fine"}]}}]}
+
+
+class StubGemini(BaseHTTPRequestHandler):
+    """
+    Answers from server.script, a list of (status, headers, body) or
+    "drop" (close without answering) / ("sleep", seconds); 200 OK once
+    the script runs out.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        server.requests.append({
+            "path": self.path,
+            "headers": dict(self.headers),
+            "body": json.loads(body),
+            "client_port": self.client_address[1],
+        })
+        step = server.script.pop(0) if server.script else (200, {}, OK)
+
+        if step == "drop":
+            self.close_connection = True
+            return
+        if step[0] == "sleep":
+            time.sleep(step[1])
+            step = (200, {}, OK)
+
+        status, headers, payload = step
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        try:
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            pass   # the client gave up (read timeout test)
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(gemini_client, "BACKOFF_BASE", 0.01)
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), StubGemini)
+    srv.daemon_threads = True
+    srv.requests = []
+    srv.script = []
+    thread = threading.Thread(target=srv.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+
+@pytest.fixture
+def client(server):
+    host, port = server.server_address
+    c = GeminiClient(base_url=f"http://{host}:{port}/v1beta", model="test-model",
+                     api_key="secret-key", pool_size=2, max_retries=3)
+    yield c
+    c.session.close()
+
+
+def test_api_key_goes_in_the_header(server, client):
+    res = client.generate({"contents": []})
+
+    assert res.status_code == 200
+    req = server.requests[0]
+    assert req["path"] == "/v1beta/models/test-model:generateContent"
+    assert "key=" not in req["path"]
+    assert req["headers"]["x-goog-api-key"] == "secret-key"
+    assert req["body"] == {"contents": []}
+
+
+def test_stream_uses_sse(server, client):
+    with client.stream_generate({}) as res:
+        assert res.status_code == 200
+    assert server.requests[0]["path"].endswith(":streamGenerateContent?alt=sse")
+
+
+def test_connections_are_reused(server, client):
+    for _ in range(5):
+        client.generate({}).close()
+
+    assert len(server.requests) == 5
+    assert len({r["client_port"] for r in server.requests}) == 1
+
+
+def test_retries_429_and_5xx(server, client):
+    server.script = [(503, {}, {}), (429, {"Retry-After": "0"}, {}), (500, {}, {})]
+
+    res = client.generate({})
+
+    assert res.status_code == 200
+    assert len(server.requests) == 4
+    stats = client.stats()
+    assert stats["calls"] == 1 and stats["retries"] == 3 and stats["failures"] == 0
+
+
+def test_retry_after_is_honoured(server, client):
+    server.script = [(429, {"Retry-After": "0.3"}, {})]
+
+    started = time.perf_counter()
+    assert client.generate({}).status_code == 200
+    assert time.perf_counter() - started >= 0.3
+
+
+def test_gives_up_after_max_retries(server, client):
+    server.script = [(503, {}, {})] * 10
+
+    res = client.generate({})
+
+    assert res.status_code == 503
+    assert len(server.requests) == client.max_retries + 1
+    assert client.stats()["failures"] == 1
+
+
+def test_client_errors_are_not_retried(server, client):
+    server.script = [(400, {}, {"error": "bad request"})]
+
+    assert client.generate({}).status_code == 400
+    assert len(server.requests) == 1
+
+
+def test_dropped_connection_is_retried(server, client):
+    server.script = ["drop"]
+
+    assert client.generate({}).status_code == 200
+    assert len(server.requests) == 2
+    assert client.stats()["retries"] == 1
+
+
+def test_read_timeout_is_not_retried(server, client):
+    server.script = [("sleep", 0.5)]
+
+    with pytest.raises(requests.exceptions.Timeout):
+        client.generate({}, timeout=0.1)
+    assert len(server.requests) == 1
+    assert client.stats()["statuses"] == {"ReadTimeout": 1}
@@ -0,0 +1,11 @@
+from latency_stats import percentiles
+
+
+def test_empty_window_is_all_zeros():
+    assert percentiles([]) == {"avg": 0, "p50": 0, "p95": 0, "max": 0}
+
+
+def test_unsorted_values_scaled_and_rounded():
+    values = [0.004, 0.001, 0.003, 0.002] + [0.0015] * 16
+    assert percentiles(values, scale=1000) == {"avg": 1.7, "p50": 1.5, "p95": 4.0, "max": 4.0}
+    assert percentiles([0.12345], 3) == {"avg": 0.123, "p50": 0.123, "p95": 0.123, "max": 0.123}
@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+import live_transcribe
+from live_transcribe import LiveStream, merge_words
+from transcriber import Busy
+
+RATE = live_transcribe.LIVE_SAMPLE_RATE
+
+
+class FakePool:
+
+    def __init__(self, busy=0):
+        self.busy = busy
+        self.windows = []
+
+    def submit(self, audio, duration=None, cleanup=None, on_done=None):
+        if self.busy:
+            self.busy -= 1
+            raise Busy("queue full")
+        self.windows.append((audio, on_done))
+        return "job"
+
+
+def ramp(start, n):
+    # Sample i carries i (mod 2**15), so a window shows which samples it holds
+    return (np.arange(start, start + n) % 32768).astype(np.int16).tobytes()
+
+
+def samples(audio):
+    return np.round(audio * 32768).astype(np.int64)
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(live_transcribe, "LIVE_STEP", 1.0)
+    monkeypatch.setattr(live_transcribe, "LIVE_WINDOW", 2.0)
+    monkeypatch.setattr(live_transcribe, "LIVE_OVERLAP", 0.5)
+    monkeypatch.setattr(live_transcribe, "has_speech", lambda audio: True)
+    fake = FakePool()
+    monkeypatch.setattr(live_transcribe, "TRANSCRIBER", fake)
+    return fake
+
+
+def test_busy_submit_keeps_the_audio(pool):
+    pushed = []
+    stream = LiveStream(lambda event, data: pushed.append((event, data)))
+
+    # 1 s: first window goes out and completes
+    stream.add(ramp(0, RATE))
+    audio, on_done = pool.windows.pop()
+    assert samples(audio)[0] == 0 and len(audio) == RATE
+    on_done({"status": "done", "text": "hello there friend"})
+
+    # Pool full for the next two steps: nothing may be trimmed meanwhile
+    pool.busy = 2
+    for second in (1, 2):
+        stream.add(ramp(second * RATE, RATE))
+    assert pool.windows == []
+
+    # 3 s of new audio pending: the window must start at the overlap before
+    # the last submitted end, not wrap around the buffer
+    stream.add(ramp(3 * RATE, RATE))
+    audio, on_done = pool.windows.pop()
+    expected = np.arange(RATE - int(0.5 * RATE), 4 * RATE) % 32768
+    assert np.array_equal(samples(audio), expected)
+
+    on_done({"status": "done", "text": "there friend general kenobi"})
+    assert stream.text() == "hello there friend general kenobi"
+    assert pushed[-1][0] == "live_partial"
+
+
+def test_merge_words_prefers_newer_overlap():
+    words, start = merge_words(["the", "patient", "sleeps", "bad"], 1, ["patient", "sleeps", "badly", "now"])
+    assert words == ["the", "patient", "sleeps", "badly", "now"]
+    assert start == 1
@@ -0,0 +1,88 @@
+import sqlite3
+
+import pytest
+
+from query_router import QueryRouter
+
+
+@pytest.fixture
+def router(clinic_db):
+    conn = sqlite3.connect(clinic_db)
+    # Vidushi: 2 sessions, one high risk; Rakhi: 1 session, high risk
+    conn.executemany("INSERT INTO clinical_sessions (patient_id, short_summary) VALUES (?, ?)", [
+        (1, "Sleeping badly, insomnia"),
+        (1, "Better week"),
+        (2, "Reported suicidal thoughts"),
+    ])
+    conn.executemany("""
+        INSERT INTO email_logs (patient_id, session_id, recipient_type, anxiety, burnout_risk,
+                                depression_risk, self_harm_risk)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, [
+        (1, 1, "HIGH", 8, 6, 7, 5),
+        (1, 2, "LOW", 2, 2, 1, 0),
+        (2, 3, "HIGH", 6, 4, 8, 9),
+    ])
+    conn.commit()
+    conn.close()
+    return QueryRouter()
+
+
+@pytest.mark.parametrize("question", [
+    # first name only: ambiguous, must not become a clinic-wide count
+    "How many sessions has Vidushi had?",
+    "How many high risk sessions did Rakhi have this week?",
+    # doctor that does not resolve
+    "how many patients does Dr Sanjeev have",
+    "How many sessions did Dr Mehta run this week?",
+    # content qualifiers the SQL cannot express
+    "how many sessions mention insomnia",
+    "How many patients reported suicidal thoughts?",
+    "How many patients with anxiety?",
+    # time qualifiers the SQL cannot express
+    "How many sessions since March?",
+    "How many sessions in the last 2 weeks?",
+    # qualifiers an intent would silently drop
+    "What is the average anxiety of high risk sessions?",
+    # open-ended
+    "Why is Vidushi Singh's anxiety high?",
+])
+def test_falls_through(router, question):
+    assert router.route(question) is None
+    assert router.stats()["fallthrough"] == 1
+
+
+def test_full_name_is_scoped(router):
+    answer = router.route("How many sessions has Vidushi Singh had?")
+    assert answer == "2 clinical sessions have been recorded for Vidushi Singh to date."
+
+
+def test_risk_count_for_named_patient(router):
+    answer = router.route("How many high risk sessions did Rakhi Kumar have this week?")
+    assert answer == "1 session was assessed as high risk for Rakhi kumar in the past seven days."
+
+
+def test_clinic_wide_counts(router):
+    assert router.route("How many sessions?") == "3 clinical sessions have been recorded across the clinic to date."
+    assert router.route("How many patients are registered?") == "The clinic currently has 3 registered patients."
+    assert router.route("How many high-risk patients this month?") == (
+        "2 patients have at least one session assessed as high risk across the clinic in the past thirty days."
+    )
+
+
+def test_named_doctor(router):
+    assert router.route("How many patients does Dr Sanjeev Kumar have?") == "2 patients are assigned to Sanjeev kumar."
+    answer = router.route("List Dr Sanjeev Kumar's patients")
+    assert answer.startswith("Sanjeev kumar currently has 2 assigned patients: Rakhi kumar")
+
+
+def test_average_score(router):
+    answer = router.route("Average anxiety for Vidushi Singh")
+    assert answer == "For Vidushi Singh to date, the average anxiety score is 5.0 out of 10 across 2 sessions."
+
+
+def test_filters_and_named_patient_must_agree(router):
+    assert router.route("How many sessions has Vidushi Singh had?", {"patient_id": "2"}) is None
+    assert router.route("How many sessions?", {"patient_id": "2"}) == (
+        "1 clinical session has been recorded for Rakhi kumar to date."
+    )
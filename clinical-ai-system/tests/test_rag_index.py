@@ -0,0 +1,110 @@
+import time
+import hashlib
+import sqlite3
+
+import numpy as np
+import pytest
+
+import rag_engine
+from crypto_utils import encrypt_text
+from embedding_cache import EmbeddingCache
+from rag_store import IndexStore
+
+DIM = 8
+
+
+class FakeEncoder:
+    """
+    Deterministic stand-in for SentenceTransformer.
+    """
+
+    def __init__(self):
+        self.calls = 0
+
+    def encode(self, texts):
+        self.calls += 1
+        return np.array([
+            np.frombuffer(hashlib.sha256(t.encode()).digest()[:DIM * 4], dtype="uint32") / 2 ** 32
+            for t in texts
+        ], dtype="float32")
+
+
+def store_at(tmp_path):
+    return IndexStore(str(tmp_path / "rag.faiss"), str(tmp_path / "docs.pkl"), str(tmp_path / "lex.pkl"))
+
+
+@pytest.fixture
+def engine(clinic_db, tmp_path, monkeypatch):
+    conn = sqlite3.connect(clinic_db)
+    conn.execute("INSERT INTO clinical_sessions (patient_id, short_summary) VALUES (1, ?)",
+                 (encrypt_text("Sleeping badly since the move"),))
+    conn.commit()
+    conn.close()
+
+    encoder = FakeEncoder()
+    monkeypatch.setattr(rag_engine, "STORE", store_at(tmp_path))
+    monkeypatch.setattr(rag_engine, "EMBEDDINGS", EmbeddingCache(str(tmp_path / "emb.db")))
+    monkeypatch.setattr(rag_engine, "MODEL", encoder)
+    monkeypatch.setattr(rag_engine, "_active_model", ("fake", encoder))
+    monkeypatch.setattr(rag_engine, "_set_active_model", lambda name, model: None)
+    monkeypatch.setattr(rag_engine, "PUBLISH_DELAY", 0.3)
+    rag_engine.build_rag_index()
+    return {"db": clinic_db, "tmp": tmp_path}
+
+
+def add_session(path, text):
+    conn = sqlite3.connect(path)
+    cur = conn.execute("INSERT INTO clinical_sessions (patient_id, short_summary) VALUES (2, ?)",
+                       (encrypt_text(text),))
+    conn.commit()
+    conn.close()
+    return cur.lastrowid
+
+
+def on_disk(tmp_path):
+    _, documents, _ = store_at(tmp_path).get()
+    return documents
+
+
+def test_updates_are_served_at_once_and_written_together(engine):
+    files = engine["tmp"] / "rag.faiss"
+    built = files.stat().st_mtime_ns
+    version = rag_engine.STORE.version()
+
+    new_ids = [add_session(engine["db"], f"Session {i} about panic attacks") for i in range(3)]
+    for sid in new_ids:
+        rag_engine.index_session(sid)
+
+    # Served from memory straight away, files untouched so far
+    index, documents, lexical = rag_engine.STORE.get()
+    for sid in new_ids:
+        assert rag_engine.doc_id("session", sid) in documents
+    assert index.ntotal == len(documents) == len(lexical)
+    assert rag_engine.STORE.version() != version
+    assert files.stat().st_mtime_ns == built
+    assert rag_engine.doc_id("session", new_ids[0]) not in on_disk(engine["tmp"])
+
+    # One write for the whole burst
+    time.sleep(0.6)
+    assert not rag_engine.STORE.dirty
+    assert set(on_disk(engine["tmp"])) == set(documents)
+
+
+def test_unwritten_updates_are_not_replaced_by_the_files(engine):
+    sid = add_session(engine["db"], "Reports better sleep")
+    rag_engine.refresh_rag_documents("session", [sid])
+
+    # The files are older than memory: get() keeps serving memory
+    _, documents, _ = rag_engine.STORE.get()
+    assert rag_engine.doc_id("session", sid) in documents
+    rag_engine._persist()
+    assert rag_engine.doc_id("session", sid) in on_disk(engine["tmp"])
+
+
+def test_remove_and_synchronous_mode(engine, monkeypatch):
+    monkeypatch.setattr(rag_engine, "PUBLISH_DELAY", 0)
+    rag_engine.remove_rag_documents("session", [1])
+
+    assert rag_engine.doc_id("session", 1) not in rag_engine.STORE.get()[1]
+    assert not rag_engine.STORE.dirty
+    assert rag_engine.doc_id("session", 1) not in on_disk(engine["tmp"])
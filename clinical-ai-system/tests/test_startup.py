@@ -0,0 +1,31 @@
+import os
+import sys
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import sys, threading
+sys.path.insert(0, {root!r})
+import followup_service
+before = threading.active_count()
+print(before)
+followup_service.start_background_workers()
+started = threading.active_count()
+followup_service.start_background_workers()
+print(started - before)
+print(threading.active_count() - started)
+"""
+
+
+def test_import_starts_no_background_workers(tmp_path):
+    env = dict(os.environ, JOBS_DB=str(tmp_path / "jobs.db"), JOB_WORKERS="2",
+               DIGEST_ENABLED="0", MAIL_WORKERS="1", WEBHOOK_WORKERS="1")
+    out = subprocess.run([sys.executable, "-c", PROBE.format(root=ROOT)], cwd=tmp_path,
+                         env=env, capture_output=True, text=True, timeout=60)
+    assert out.returncode == 0, out.stderr
+    imported, started, again = [int(l) for l in out.stdout.splitlines() if l.strip().isdigit()][-3:]
+    assert imported == 1
+    assert started > 0
+    # a second call (e.g. __main__ plus a hook) starts nothing more
+    assert again == 0
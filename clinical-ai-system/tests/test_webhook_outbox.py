@@ -0,0 +1,220 @@
+import hmac
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from job_queue import JobQueue, QUEUED, DONE, FAILED
+from webhooks import webhook_dispatcher, webhook_outbox
+from webhooks.webhook_outbox import _SubscriberLimiter
+from webhooks.webhook_registry import SubscriberRegistry, _ensure_schema
+
+SECRET = "subscriber-secret"
+
+
+class Receiver(BaseHTTPRequestHandler):
+    """
+    Records every POST; answers with server.statuses.pop(0) (200 once
+    empty). While server.hold is cleared, requests wait for it.
+    """
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        with server.lock:
+            server.active += 1
+            server.peak = max(server.peak, server.active)
+            server.received.append({
+                "path": self.path,
+                "body": body,
+                "signature": self.headers.get("X-HopeQure-Signature"),
+                "delivery": self.headers.get("X-HopeQure-Delivery"),
+            })
+            status = server.statuses.pop(0) if server.statuses else 200
+        server.hold.wait(5)
+        with server.lock:
+            server.active -= 1
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+@pytest.fixture
+def receiver():
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), Receiver)
+    srv.daemon_threads = True
+    srv.lock = threading.Lock()
+    srv.received = []
+    srv.statuses = []
+    srv.active = 0
+    srv.peak = 0
+    srv.hold = threading.Event()
+    srv.hold.set()
+    threading.Thread(target=srv.serve_forever, args=(0.05,), daemon=True).start()
+    host, port = srv.server_address
+    srv.url = f"http://{host}:{port}"
+    yield srv
+    srv.hold.set()
+    srv.shutdown()
+    srv.server_close()
+
+
+@pytest.fixture
+def outbox(clinic_db, tmp_path, monkeypatch):
+    queue = JobQueue(path=str(tmp_path / "jobs.db"), table="webhook_outbox",
+                     max_attempts=3, retry_delay=0, batch_limit=20)
+    queue.handler("webhook")(webhook_outbox._deliver)
+    registry = SubscriberRegistry()
+
+    monkeypatch.setattr(webhook_outbox, "OUTBOX", queue)
+    monkeypatch.setattr(webhook_outbox, "REGISTRY", registry)
+    monkeypatch.setattr(webhook_dispatcher, "REGISTRY", registry)
+    monkeypatch.setattr(webhook_outbox, "LIMITER", _SubscriberLimiter(2))
+    monkeypatch.setattr(webhook_outbox, "WEBHOOK_BATCH_WINDOW", 0)
+    return queue
+
+
+def subscribe(clinic_db, url, batch=False):
+    conn = sqlite3.connect(clinic_db)
+    _ensure_schema(conn)
+    cur = conn.execute(
+        "INSERT INTO webhook_subscribers (event_type, target_url, secret, batch_events) VALUES (?, ?, ?, ?)",
+        ("session.created", url, SECRET, int(batch)),
+    )
+    conn.commit()
+    conn.close()
+    return cur.lastrowid
+
+
+def drain(queue):
+    """
+    Runs due jobs on this thread until none are left.
+    """
+    while True:
+        job = queue._claim()
+        if job is None:
+            return
+        queue._run(job)
+
+
+def jobs(queue):
+    db = queue._db()
+    rows = db.execute(f"SELECT * FROM {queue.table} ORDER BY created_at").fetchall()
+    db.close()
+    return [dict(r) for r in rows]
+
+
+def test_delivery_is_signed(clinic_db, outbox, receiver):
+    subscribe(clinic_db, receiver.url + "/hook")
+    webhook_dispatcher.dispatch_event("session.created", {"session_id": 7, "name": "é"})
+    drain(outbox)
+
+    (req,) = receiver.received
+    assert req["path"] == "/hook"
+    assert req["signature"] == hmac.new(SECRET.encode(), req["body"], hashlib.sha256).hexdigest()
+    body = json.loads(req["body"])
+    assert body["event"] == "session.created"
+    assert body["data"] == {"session_id": 7, "name": "é"}
+    (job,) = jobs(outbox)
+    assert req["delivery"] == job["job_id"]
+    assert job["status"] == DONE
+
+
+def test_failures_are_retried_with_the_same_delivery_id(clinic_db, outbox, receiver):
+    subscribe(clinic_db, receiver.url)
+    receiver.statuses = [503, 429]
+    webhook_dispatcher.dispatch_event("session.created", {"session_id": 1})
+    drain(outbox)
+
+    assert len(receiver.received) == 3
+    assert len({r["delivery"] for r in receiver.received}) == 1
+    (job,) = jobs(outbox)
+    assert job["status"] == DONE and job["attempts"] == 3
+
+
+def test_rejected_delivery_is_dead_lettered_at_once(clinic_db, outbox, receiver):
+    sub_id = subscribe(clinic_db, receiver.url)
+    receiver.statuses = [400]
+    webhook_dispatcher.dispatch_event("session.created", {"session_id": 1})
+    drain(outbox)
+
+    assert len(receiver.received) == 1
+    (dead,) = webhook_outbox.dead_letters()
+    assert dead["subscriber_id"] == sub_id
+    assert dead["event"] == "session.created"
+    assert dead["attempts"] == 1
+    assert "400" in dead["error"]
+
+
+def test_dead_letter_after_max_attempts_and_requeue(clinic_db, outbox, receiver):
+    subscribe(clinic_db, receiver.url)
+    receiver.statuses = [500] * outbox.max_attempts
+    webhook_dispatcher.dispatch_event("session.created", {"session_id": 1})
+    drain(outbox)
+
+    (job,) = jobs(outbox)
+    assert job["status"] == FAILED and job["attempts"] == outbox.max_attempts
+    assert len(receiver.received) == outbox.max_attempts
+
+    # An admin requeues it once the endpoint is fixed
+    assert outbox.requeue(job["job_id"])
+    drain(outbox)
+    assert jobs(outbox)[0]["status"] == DONE
+    assert webhook_outbox.dead_letters() == []
+
+
+def test_per_subscriber_limit(clinic_db, outbox, receiver):
+    subscribe(clinic_db, receiver.url)
+    for i in range(3):
+        webhook_dispatcher.dispatch_event("session.created", {"session_id": i})
+
+    # Three workers at once against one slow subscriber
+    receiver.hold.clear()
+    workers = []
+    for _ in range(3):
+        job = outbox._claim()
+        t = threading.Thread(target=outbox._run, args=(job,))
+        t.start()
+        workers.append(t)
+
+    # One of them is deferred without using up an attempt
+    deadline = time.time() + 5
+    while time.time() < deadline:
+        deferred = [j for j in jobs(outbox) if j["status"] == QUEUED]
+        if deferred:
+            break
+        time.sleep(0.02)
+    assert len(deferred) == 1 and deferred[0]["attempts"] == 0
+
+    receiver.hold.set()
+    for t in workers:
+        t.join(5)
+    db = outbox._db()
+    db.execute("UPDATE webhook_outbox SET run_after = 0 WHERE status = ?", (QUEUED,))
+    db.commit()
+    db.close()
+    drain(outbox)
+
+    assert receiver.peak == 2
+    assert len(receiver.received) == 3
+    assert all(j["status"] == DONE for j in jobs(outbox))
+
+
+def test_batch_subscriber_gets_one_post(clinic_db, outbox, receiver):
+    subscribe(clinic_db, receiver.url, batch=True)
+    for i in range(3):
+        webhook_dispatcher.dispatch_event("session.created", {"session_id": i})
+    drain(outbox)
+
+    (req,) = receiver.received
+    body = json.loads(req["body"])
+    assert body["event"] == "batch"
+    assert [e["data"]["session_id"] for e in body["events"]] == [0, 1, 2]
+    assert req["signature"] == hmac.new(SECRET.encode(), req["body"], hashlib.sha256).hexdigest()
@@ -0,0 +1,298 @@
+import os
+import time
+import uuid
+import queue
+import threading
+import multiprocessing
+from collections import deque
+from dotenv import load_dotenv
+from whisper_backend import backend_config, describe
+from model_loader import whisper_model
+from latency_stats import percentiles
+
+load_dotenv()
+
+
+# ---------------- WHISPER TRANSCRIPTION POOL ----------------
+# Whisper is CPU-bound and, run on the request thread, freezes the eventlet
+# hub (every request and Socket.IO connection) for the whole transcription.
+# Instead TRANSCRIBE_WORKERS child processes each load the model once
+# (backend, size and threads: whisper_backend) and take audio from a
+# bounded queue (TRANSCRIBE_QUEUE_DEPTH, beyond that submit raises Busy).
+# A worker that runs past TRANSCRIBE_MAX_SECONDS is killed and replaced,
+# and the job fails. Jobs live in memory for TRANSCRIBE_RESULT_TTL seconds
+# so clients can poll them or receive on_update pushes; audio is transient
+# so they are not persisted.
+#
+# The worker processes start with the first submit, not at import, unless
+# start(eager=True). A model preloaded in a parent process (model_loader)
+# is inherited by the forked workers instead of loaded again.
+
+TRANSCRIBE_WORKERS = int(os.getenv("TRANSCRIBE_WORKERS", "1"))
+TRANSCRIBE_QUEUE_DEPTH = int(os.getenv("TRANSCRIBE_QUEUE_DEPTH", "8"))
+TRANSCRIBE_MAX_SECONDS = float(os.getenv("TRANSCRIBE_MAX_SECONDS", "900"))
+TRANSCRIBE_RESULT_TTL = float(os.getenv("TRANSCRIBE_RESULT_TTL", "600"))
+# fork by default: spawn would re-import followup_service in every child
+TRANSCRIBE_START_METHOD = os.getenv("TRANSCRIBE_START_METHOD", "fork" if os.name == "posix" else "spawn")
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+LATENCY_WINDOW = 500
+
+
+class Busy(Exception):
+    """
+    The transcription queue is full; retry later.
+    """
+
+
+# ---------------- CHILD PROCESS ----------------
+
+def _worker_main(conn, config):
+    backend = whisper_model(config).get()
+    conn.send({"ready": True})
+
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+
+        started = time.perf_counter()
+        try:
+            text = backend.transcribe(task["audio"])
+            conn.send({
+                "text": text,
+                "compute_ms": (time.perf_counter() - started) * 1000,
+            })
+        except Exception as e:
+            conn.send({"error": str(e)})
+
+
+class _Worker:
+
+    def __init__(self, ctx, config):
+        self.conn, child = ctx.Pipe()
+        self.proc = ctx.Process(target=_worker_main, args=(child, config), daemon=True)
+        self.proc.start()
+        child.close()
+        self.ready = False
+
+    def run(self, audio, timeout):
+        """
+        Returns the child's reply; raises TimeoutError or EOFError if the
+        child is stuck or died.
+        """
+        if not self.ready:
+            # First task waits for the model load as well
+            if not self.conn.poll(timeout):
+                raise TimeoutError("model load timed out")
+            self.conn.recv()
+            self.ready = True
+
+        self.conn.send({"audio": audio})
+        if not self.conn.poll(timeout):
+            raise TimeoutError(f"transcription exceeded {timeout:.0f}s")
+        return self.conn.recv()
+
+    def kill(self):
+        self.proc.kill()
+        self.proc.join(5)
+        self.conn.close()
+
+
+# ---------------- POOL ----------------
+
+class TranscriptionPool:
+
+    def __init__(self, workers=TRANSCRIBE_WORKERS, depth=TRANSCRIBE_QUEUE_DEPTH,
+                 max_seconds=TRANSCRIBE_MAX_SECONDS, config=None):
+        self.workers = workers
+        self.depth = depth
+        self.max_seconds = max_seconds
+        self.config = config or backend_config(workers)
+        self._ctx = multiprocessing.get_context(TRANSCRIBE_START_METHOD)
+        self._queue = queue.Queue(maxsize=depth)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._spawn = None
+        self._started = False
+        self._running = 0
+
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.restarts = 0
+        self._wait_ms = deque(maxlen=LATENCY_WINDOW)
+        self._compute_ms = deque(maxlen=LATENCY_WINDOW)
+        self._rtf = deque(maxlen=LATENCY_WINDOW)
+
+    def on_update(self, fn):
+        """
+        fn(public_job) is called on every status change.
+        """
+        self._listeners.append(fn)
+        return fn
+
+    def _notify(self, job):
+        data = self.public(job)
+        for fn in self._listeners:
+            try:
+                fn(data)
+            except Exception as e:
+                print("TRANSCRIBE UPDATE ERROR:", e)
+
+    def _prune(self):
+        cutoff = time.time() - TRANSCRIBE_RESULT_TTL
+        for job_id in [j for j, job in self._jobs.items()
+                       if job["finished_at"] and job["finished_at"] < cutoff]:
+            del self._jobs[job_id]
+
+    def submit(self, audio, duration=None, cleanup=None, on_done=None):
+        """
+        Queues audio (a file path or a 16 kHz float32 array) and returns the
+        job id. duration (seconds of audio) enables real-time-factor stats;
+        cleanup() runs once the job has finished either way, then
+        on_done(job).
+        """
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "status": QUEUED,
+            "text": None,
+            "error": None,
+            "duration": duration,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "_audio": audio,
+            "_cleanup": cleanup,
+            "_on_done": on_done,
+        }
+        self._ensure_started()
+        with self._lock:
+            self._prune()
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                self.rejected += 1
+                raise Busy(f"{self.depth} transcriptions already queued")
+            self._jobs[job["job_id"]] = job
+        return job["job_id"]
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def public(self, job):
+        data = {k: v for k, v in job.items() if not k.startswith("_")}
+        if job["status"] == QUEUED:
+            data["position"] = self._queue.qsize()
+        return data
+
+    def _finish(self, job, text=None, error=None):
+        job["text"] = text
+        job["error"] = error
+        job["status"] = FAILED if error else DONE
+        job["finished_at"] = time.time()
+        job["_audio"] = None
+        cleanup, job["_cleanup"] = job["_cleanup"], None
+        if cleanup:
+            try:
+                cleanup()
+            except Exception as e:
+                print("TRANSCRIBE CLEANUP ERROR:", e)
+
+    def _serve(self):
+        worker = _Worker(self._ctx, self.config)
+        while True:
+            job = self._queue.get()
+            job["status"] = RUNNING
+            job["started_at"] = time.time()
+            with self._lock:
+                self._running += 1
+                self._wait_ms.append((job["started_at"] - job["created_at"]) * 1000)
+            self._notify(job)
+
+            try:
+                reply = worker.run(job["_audio"], self.max_seconds)
+                if "error" in reply:
+                    self._finish(job, error=reply["error"])
+                else:
+                    self._finish(job, text=reply["text"])
+                    with self._lock:
+                        self._compute_ms.append(reply["compute_ms"])
+                        if job["duration"]:
+                            self._rtf.append(reply["compute_ms"] / 1000 / job["duration"])
+
+            except (TimeoutError, EOFError, OSError) as e:
+                print(f"❌ Transcription worker lost ({e}), restarting")
+                self._finish(job, error=str(e) or "transcription worker died")
+                worker.kill()
+                worker = _Worker(self._ctx, self.config)
+                with self._lock:
+                    self.restarts += 1
+                    if isinstance(e, TimeoutError):
+                        self.timeouts += 1
+
+            with self._lock:
+                self._running -= 1
+                if job["status"] == DONE:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+            print(f"🎙️ Transcription {job['job_id']} {job['status']} in "
+                  f"{job['finished_at'] - job['started_at']:.1f}s")
+            self._notify(job)
+            if job["_on_done"]:
+                try:
+                    job["_on_done"](self.public(job))
+                except Exception as e:
+                    print("TRANSCRIBE CALLBACK ERROR:", e)
+
+    def start(self, spawn, eager=False):
+        """
+        spawn(fn) starts a background thread, e.g. socketio.start_background_task.
+        Without eager the workers (and the model) wait for the first job.
+        """
+        self._spawn = spawn
+        if eager:
+            self._ensure_started()
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._started or self._spawn is None:
+                return
+            self._started = True
+        for _ in range(self.workers):
+            self._spawn(self._serve)
+        print(f"🎙️ {self.workers} Whisper workers starting ({describe(self.config)}, {TRANSCRIBE_START_METHOD})")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "model": describe(self.config),
+                "started": self._started,
+                "workers": self.workers,
+                "queue_depth": self.depth,
+                "queued": self._queue.qsize(),
+                "running": self._running,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+                "worker_restarts": self.restarts,
+                "max_seconds": self.max_seconds,
+                "wait_ms": percentiles(self._wait_ms),
+                "compute_ms": percentiles(self._compute_ms),
+                "real_time_factor": percentiles(self._rtf, 3),
+            }
+
+
+TRANSCRIBER = TranscriptionPool()
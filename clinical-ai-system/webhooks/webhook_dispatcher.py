@@ -1,28 +1,21 @@
-from db import get_db
-from webhooks.webhook_sender import send_webhook
+from webhooks.webhook_registry import REGISTRY
+from webhooks.webhook_outbox import encode_event, enqueue_delivery
 
 def dispatch_event(event_type, payload):
+    """
+    Queues the event for every active subscriber and returns at once;
+    delivery happens in the webhook outbox workers.
+    """
     print(f"\n🚀 dispatch_event called → {event_type}")
 
-    db = get_db()
-    cur = db.cursor()
-
-    cur.execute("""
-        SELECT target_url, secret
-        FROM webhook_subscribers
-        WHERE event_type = ? AND active = 1
-    """, (event_type,))
-
-    subscribers = cur.fetchall()
-    db.close()
+    # In-memory lookup, refreshed only when webhook_subscribers changes
+    subscribers = REGISTRY.for_event(event_type)
 
     print(f"📡 Subscribers found: {len(subscribers)}")
+    if not subscribers:
+        return
 
-    for url, secret in subscribers:
-        print(f"➡️ Sending webhook to {url}")
-        send_webhook(
-            url=url,
-            secret=secret,
-            event_type=event_type,
-            payload=payload
-        )
+    # One serialization shared by every subscriber
+    body = encode_event(event_type, payload)
+    for subscriber in subscribers:
+        enqueue_delivery(subscriber, event_type, body)
@@ -0,0 +1,207 @@
+import os
+import time
+import threading
+from collections import Counter, deque
+import requests
+from dotenv import load_dotenv
+from job_queue import JobQueue, Defer, GiveUp
+from latency_stats import percentiles
+from webhooks.webhook_sender import encode_body, post_body
+from webhooks.webhook_registry import REGISTRY
+
+load_dotenv()
+
+
+# ---------------- WEBHOOK OUTBOX ----------------
+# dispatch_event only writes one outbox row per subscriber; WEBHOOK_WORKERS
+# threads deliver them. At most WEBHOOK_PER_SUBSCRIBER deliveries run
+# against the same subscriber at once, so one slow endpoint cannot occupy
+# every worker; further jobs for it are deferred briefly. Failures are
+# retried with exponential backoff, and deliveries that still fail after
+# WEBHOOK_MAX_ATTEMPTS (or get a non-retryable 4xx) stay in the outbox as
+# dead letters that an admin can list and requeue.
+#
+# The envelope is serialized once per event (shared by all subscribers) and
+# stored as the exact JSON text that is later signed and POSTed. Subscribers
+# with batch_events=1 get their events held for WEBHOOK_BATCH_WINDOW seconds
+# and coalesced into one POST of up to WEBHOOK_BATCH_MAX events:
+#   {"event": "batch", "events": [<envelope>, ...], "timestamp": ...}
+
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "4"))
+WEBHOOK_PER_SUBSCRIBER = int(os.getenv("WEBHOOK_PER_SUBSCRIBER", "2"))
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "8"))
+WEBHOOK_RETRY_DELAY = float(os.getenv("WEBHOOK_RETRY_DELAY", "5"))
+WEBHOOK_DEFER = float(os.getenv("WEBHOOK_DEFER", "0.5"))
+WEBHOOK_BATCH_WINDOW = float(os.getenv("WEBHOOK_BATCH_WINDOW", "1"))
+WEBHOOK_BATCH_MAX = int(os.getenv("WEBHOOK_BATCH_MAX", "20"))
+
+# 4xx responses worth retrying; any other 4xx is dead-lettered at once
+RETRYABLE_4XX = {408, 409, 425, 429}
+LATENCY_WINDOW = 500
+
+OUTBOX = JobQueue(table="webhook_outbox", max_attempts=WEBHOOK_MAX_ATTEMPTS, retry_delay=WEBHOOK_RETRY_DELAY,
+                  batch_limit=WEBHOOK_BATCH_MAX)
+
+
+class _SubscriberLimiter:
+
+    def __init__(self, limit):
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._inflight = Counter()
+
+    def try_acquire(self, key):
+        with self._lock:
+            if self._inflight[key] >= self.limit:
+                return False
+            self._inflight[key] += 1
+            return True
+
+    def release(self, key):
+        with self._lock:
+            self._inflight[key] -= 1
+            if not self._inflight[key]:
+                del self._inflight[key]
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._inflight)
+
+
+LIMITER = _SubscriberLimiter(WEBHOOK_PER_SUBSCRIBER)
+
+_stats_lock = threading.Lock()
+_send_ms = deque(maxlen=LATENCY_WINDOW)
+_delivery_ms = deque(maxlen=LATENCY_WINDOW)
+_delivered = Counter()
+_failures = Counter()
+_deferred = 0
+_batches = 0
+_batched_events = 0
+
+
+def encode_event(event_type, payload):
+    """
+    Returns the envelope as JSON text, ready to be queued for any number
+    of subscribers.
+    """
+    return encode_body({
+        "event": event_type,
+        "timestamp": int(time.time()),
+        "data": payload
+    }).decode()
+
+
+def enqueue_delivery(subscriber, event_type, body):
+    """
+    subscriber is a registry Subscriber; body comes from encode_event.
+    """
+    if subscriber.batch:
+        return OUTBOX.enqueue(
+            "webhook",
+            {"subscriber_id": subscriber.id, "event": event_type, "body": body},
+            group=f"sub:{subscriber.id}",
+            delay=WEBHOOK_BATCH_WINDOW
+        )
+    return OUTBOX.enqueue("webhook", {"subscriber_id": subscriber.id, "event": event_type, "body": body})
+
+
+def _batch_body(members):
+    # Keys in sort order, like encode_body, without re-serializing the events
+    events = ",".join(m["payload"]["body"] for m in members)
+    return f'{{"event":"batch","events":[{events}],"timestamp":{int(time.time())}}}'.encode()
+
+
+@OUTBOX.handler("webhook")
+def _deliver(job, progress):
+    global _deferred, _batches, _batched_events
+    sub_id = job["payload"]["subscriber_id"]
+    members = [job] + job["batch"]
+
+    sub = REGISTRY.get(sub_id)
+    if sub is None:
+        # Unsubscribed or deactivated since the event was queued
+        return {"skipped": "subscriber inactive"}
+    url, secret = sub.url, sub.secret
+
+    if len(members) > 1:
+        body = _batch_body(members)
+    else:
+        body = job["payload"]["body"].encode()
+
+    if not LIMITER.try_acquire(sub_id):
+        with _stats_lock:
+            _deferred += 1
+        raise Defer(WEBHOOK_DEFER, "subscriber busy")
+
+    started = time.perf_counter()
+    try:
+        status = post_body(url, secret, body, delivery_id=job["job_id"])
+    except requests.HTTPError as e:
+        code = e.response.status_code
+        with _stats_lock:
+            _failures[str(code)] += 1
+        if 400 <= code < 500 and code not in RETRYABLE_4XX:
+            raise GiveUp(f"{url} rejected the webhook with {code}")
+        raise
+    except requests.RequestException as e:
+        with _stats_lock:
+            _failures[type(e).__name__] += 1
+        raise
+    finally:
+        LIMITER.release(sub_id)
+
+    send_ms = (time.perf_counter() - started) * 1000
+    delivery_ms = (time.time() - job["created_at"]) * 1000
+    with _stats_lock:
+        _send_ms.append(send_ms)
+        _delivery_ms.append(delivery_ms)
+        for m in members:
+            _delivered[m["payload"]["event"]] += 1
+        if len(members) > 1:
+            _batches += 1
+            _batched_events += len(members)
+
+    return {"status": status, "events": len(members),
+            "send_ms": round(send_ms, 1), "delivery_ms": round(delivery_ms, 1)}
+
+
+def start_webhook_workers(spawn):
+    """
+    spawn(fn) starts a background thread, e.g. socketio.start_background_task.
+    """
+    for _ in range(WEBHOOK_WORKERS):
+        spawn(OUTBOX.work)
+    print(f"🪝 {WEBHOOK_WORKERS} webhook workers started")
+
+
+def dead_letters(limit=50):
+    return [
+        {
+            "delivery_id": job["job_id"],
+            "subscriber_id": job["payload"]["subscriber_id"],
+            "event": job["payload"]["event"],
+            "attempts": job["attempts"],
+            "error": job["error"],
+            "failed_at": job["finished_at"],
+        }
+        for job in OUTBOX.failed_jobs(limit)
+    ]
+
+
+def webhook_stats():
+    outbox = OUTBOX.stats()
+    with _stats_lock:
+        return {
+            "outbox": outbox,
+            "dead_letters": outbox["failed"],
+            "delivered": dict(_delivered),
+            "failed_attempts": dict(_failures),
+            "deferred": _deferred,
+            "batches": _batches,
+            "batched_events": _batched_events,
+            "subscribers": REGISTRY.stats(),
+            "inflight_by_subscriber": LIMITER.snapshot(),
+            "send_ms": percentiles(_send_ms),
+            "delivery_ms": percentiles(_delivery_ms),
+        }
@@ -0,0 +1,115 @@
+import threading
+from collections import namedtuple, defaultdict
+from db import get_db, data_version
+
+
+# ---------------- SUBSCRIBER REGISTRY ----------------
+# Every dispatch and every delivery used to open clinic.db just to look up
+# the subscribers. The registry keeps the active ones in memory instead.
+#
+# Triggers on webhook_subscribers bump a version row whenever the table is
+# written, including by the scripts/ helpers running in another process.
+# A lookup first compares db.data_version() (free, no query); only when the
+# database changed at all is the version row read, and the subscribers are
+# reloaded only when that moved.
+
+Subscriber = namedtuple("Subscriber", "id event_type url secret batch")
+
+
+def _ensure_schema(db):
+    db.executescript("""
+        CREATE TABLE IF NOT EXISTS webhook_subscribers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            event_type TEXT NOT NULL,
+            target_url TEXT NOT NULL,
+            secret TEXT NOT NULL,
+            active INTEGER DEFAULT 1,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        );
+
+        CREATE TABLE IF NOT EXISTS webhook_registry_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        );
+        INSERT OR IGNORE INTO webhook_registry_version (id, version) VALUES (1, 0);
+
+        CREATE TRIGGER IF NOT EXISTS webhook_subscribers_ins AFTER INSERT ON webhook_subscribers
+        BEGIN UPDATE webhook_registry_version SET version = version + 1; END;
+        CREATE TRIGGER IF NOT EXISTS webhook_subscribers_upd AFTER UPDATE ON webhook_subscribers
+        BEGIN UPDATE webhook_registry_version SET version = version + 1; END;
+        CREATE TRIGGER IF NOT EXISTS webhook_subscribers_del AFTER DELETE ON webhook_subscribers
+        BEGIN UPDATE webhook_registry_version SET version = version + 1; END;
+    """)
+    cols = {r[1] for r in db.execute("PRAGMA table_info(webhook_subscribers)")}
+    if "batch_events" not in cols:
+        # Opt-in: subscriber accepts several events in one POST
+        db.execute("ALTER TABLE webhook_subscribers ADD COLUMN batch_events INTEGER DEFAULT 0")
+    db.commit()
+
+
+class SubscriberRegistry:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ready = False
+        self._seen_data = None
+        self._version = None
+        self._by_id = {}
+        self._by_event = {}
+        self.reloads = 0
+        self.version_checks = 0
+
+    def _refresh(self):
+        with self._lock:
+            dv = data_version()
+            if self._ready and dv == self._seen_data:
+                return
+
+            db = get_db()
+            try:
+                if not self._ready:
+                    _ensure_schema(db)
+                    self._ready = True
+                    dv = data_version()
+                version = db.execute("SELECT version FROM webhook_registry_version").fetchone()[0]
+                self.version_checks += 1
+                if version != self._version:
+                    rows = db.execute("""
+                        SELECT id, event_type, target_url, secret, COALESCE(batch_events, 0)
+                        FROM webhook_subscribers
+                        WHERE active = 1
+                    """).fetchall()
+                    by_event = defaultdict(list)
+                    for r in rows:
+                        sub = Subscriber(r[0], r[1], r[2], r[3], bool(r[4]))
+                        by_event[sub.event_type].append(sub)
+                    self._by_id = {sub.id: sub for subs in by_event.values() for sub in subs}
+                    self._by_event = dict(by_event)
+                    self._version = version
+                    self.reloads += 1
+                    print(f"🪝 Webhook registry loaded: {len(self._by_id)} active subscribers")
+            finally:
+                db.close()
+            self._seen_data = dv
+
+    def for_event(self, event_type):
+        self._refresh()
+        return self._by_event.get(event_type, [])
+
+    def get(self, subscriber_id):
+        """
+        Active subscriber by id, or None.
+        """
+        self._refresh()
+        return self._by_id.get(subscriber_id)
+
+    def stats(self):
+        return {
+            "active": len(self._by_id),
+            "version": self._version,
+            "reloads": self.reloads,
+            "version_checks": self.version_checks,
+        }
+
+
+REGISTRY = SubscriberRegistry()
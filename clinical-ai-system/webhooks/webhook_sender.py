@@ -2,44 +2,50 @@ import requests
 import json
 import hmac
 import hashlib
-import time
+
+def encode_body(data: dict) -> bytes:
+    """
+    Serializes a webhook body once; these exact bytes are signed and sent.
+    """
+    return json.dumps(data, separators=(",", ":"), sort_keys=True).encode()
+
+
+def sign_body(secret: str, body: bytes) -> str:
+    return hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
 
 def generate_signature(secret: str, payload: dict) -> str:
     """
     Generate HMAC SHA256 signature
     """
-    message = json.dumps(payload, separators=(",", ":"), sort_keys=True)
-    signature = hmac.new(
-        secret.encode(),
-        message.encode(),
-        hashlib.sha256
-    ).hexdigest()
-    return signature
-
-
-def send_webhook(url, secret, event_type, payload):
-    data = {
-        "event": event_type,
-        "timestamp": int(time.time()),
-        "data": payload
-    }
+    return sign_body(secret, encode_body(payload))
 
-    signature = generate_signature(secret, data)
 
+def post_body(url, secret, body, delivery_id=None):
+    """
+    POSTs pre-encoded body bytes with their signature; returns the status
+    code, raises on failure so the webhook outbox can retry it.
+    """
     headers = {
         "Content-Type": "application/json",
-        "X-HopeQure-Signature": signature
+        "X-HopeQure-Signature": sign_body(secret, body)
     }
+    if delivery_id:
+        # Same id on every retry, so receivers can drop duplicates
+        headers["X-HopeQure-Delivery"] = delivery_id
 
     try:
         response = requests.post(
             url,
-            json=data,
+            data=body,
             headers=headers,
             timeout=5
         )
         response.raise_for_status()
         print(f"✅ Webhook sent → status {response.status_code}")
+        return response.status_code
 
     except Exception as e:
         print(f"❌ Webhook failed: {e}")
+        raise
+
@@ -0,0 +1,83 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+# ---------------- WHISPER BACKENDS ----------------
+# WHISPER_BACKEND picks the implementation the transcription workers load:
+#   openai  - openai-whisper on PyTorch, fp32 on CPU (the original setup)
+#   faster  - faster-whisper (CTranslate2), WHISPER_COMPUTE_TYPE=int8 by
+#             default; optional dependency: pip install faster-whisper
+# WHISPER_MODEL is the size (tiny / base / small, or any name the backend
+# knows). WHISPER_THREADS is the CPU threads per worker process; 0 splits
+# the machine's cores between the TRANSCRIBE_WORKERS processes so they do
+# not oversubscribe each other. scripts/bench_whisper.py compares them.
+
+BACKENDS = ("openai", "faster")
+
+WHISPER_BACKEND = os.getenv("WHISPER_BACKEND", "openai")
+WHISPER_MODEL = os.getenv("WHISPER_MODEL", "base")
+WHISPER_COMPUTE_TYPE = os.getenv("WHISPER_COMPUTE_TYPE", "int8")
+WHISPER_THREADS = int(os.getenv("WHISPER_THREADS", "0"))
+WHISPER_BEAM_SIZE = int(os.getenv("WHISPER_BEAM_SIZE", "1"))   # 1 = greedy, like openai-whisper's default
+WHISPER_LANGUAGE = os.getenv("WHISPER_LANGUAGE", "en")
+
+
+def default_threads(workers):
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+
+def backend_config(workers=1, **overrides):
+    config = {
+        "backend": WHISPER_BACKEND,
+        "model": WHISPER_MODEL,
+        "compute_type": WHISPER_COMPUTE_TYPE,
+        "threads": WHISPER_THREADS or default_threads(workers),
+        "beam_size": WHISPER_BEAM_SIZE,
+    }
+    config.update({k: v for k, v in overrides.items() if v is not None})
+    if config["backend"] not in BACKENDS:
+        raise ValueError(f"Unknown WHISPER_BACKEND {config['backend']!r}, expected one of {BACKENDS}")
+    return config
+
+
+def describe(config):
+    if config["backend"] == "faster":
+        return f"faster-whisper {config['model']} ({config['compute_type']}, {config['threads']} threads)"
+    return f"openai-whisper {config['model']} (fp32, {config['threads']} threads)"
+
+
+class OpenAIWhisper:
+
+    def __init__(self, model, threads, beam_size=1, **_):
+        import torch
+        import whisper
+        torch.set_num_threads(threads)
+        self.model = whisper.load_model(model, device="cpu")
+        self.beam_size = beam_size if beam_size > 1 else None
+
+    def transcribe(self, audio):
+        result = self.model.transcribe(audio, language=WHISPER_LANGUAGE, fp16=False, beam_size=self.beam_size)
+        return result.get("text", "").strip()
+
+
+class FasterWhisper:
+
+    def __init__(self, model, threads, compute_type="int8", beam_size=1, **_):
+        try:
+            from faster_whisper import WhisperModel
+        except ImportError:
+            raise RuntimeError("WHISPER_BACKEND=faster needs the faster-whisper package")
+        self.model = WhisperModel(model, device="cpu", compute_type=compute_type, cpu_threads=threads)
+        self.beam_size = beam_size
+
+    def transcribe(self, audio):
+        segments, _ = self.model.transcribe(audio, language=WHISPER_LANGUAGE, beam_size=self.beam_size)
+        # segments is a generator; decoding happens while it is consumed
+        return "".join(s.text for s in segments).strip()
+
+
+def load_backend(config):
+    cls = FasterWhisper if config["backend"] == "faster" else OpenAIWhisper
+    return cls(**{k: v for k, v in config.items() if k != "backend"})